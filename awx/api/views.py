@@ -8,7 +8,6 @@ import cgi
 import dateutil
 import time
 import socket
-import subprocess
 import sys
 import logging
 import requests
@@ -19,7 +18,7 @@ from collections import OrderedDict
 from django.conf import settings
 from django.core.exceptions import FieldError
 from django.db.models import Q, Count, F
-from django.db import IntegrityError, transaction, connection
+from django.db import IntegrityError, transaction
 from django.shortcuts import get_object_or_404
 from django.utils.encoding import smart_text, force_text
 from django.utils.safestring import mark_safe
@@ -27,8 +26,7 @@ from django.utils.timezone import now
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.cache import never_cache
 from django.template.loader import render_to_string
-from django.core.servers.basehttp import FileWrapper
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.contrib.contenttypes.models import ContentType
 from django.utils.translation import ugettext_lazy as _
 
@@ -73,6 +71,10 @@ from awx.main.utils import (
 )
 from awx.main.utils.filters import SmartFilter
 from awx.main.utils.insights import filter_insights_api_response
+from awx.main.utils.stdout import (
+    iter_stdout_file, iter_event_stdout, filter_stdout, rendered_stdout_cache,
+    STDOUT_ANSI_RE, STDOUT_ANSI_CRLF_RE, STDOUT_CRLF_RE
+)
 
 from awx.api.permissions import * # noqa
 from awx.api.renderers import * # noqa
@@ -81,6 +83,7 @@ from awx.api.metadata import RoleMetadata, JobTypeMetadata
 from awx.main.consumers import emit_channel_notification
 from awx.main.models.unified_jobs import ACTIVE_STATES
 from awx.main.scheduler.tasks import run_job_complete
+from awx.main.scheduler.metrics import get_recent_cycles, get_schedule_interval
 
 logger = logging.getLogger('awx.api.views')
 
@@ -192,6 +195,7 @@ class ApiVersionRootView(APIView):
         data['credentials'] = reverse('api:credential_list', request=request)
         if get_request_version(request) > 1:
             data['credential_types'] = reverse('api:credential_type_list', request=request)
+            data['task_manager_metrics'] = reverse('api:task_manager_metrics_view', request=request)
         data['inventory'] = reverse('api:inventory_list', request=request)
         data['inventory_scripts'] = reverse('api:inventory_script_list', request=request)
         data['inventory_sources'] = reverse('api:inventory_source_list', request=request)
@@ -364,6 +368,29 @@ class ApiV1ConfigView(APIView):
             return Response({"error": _("Failed to remove license (%s)") % has_error}, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TaskManagerMetricsView(APIView):
+
+    permission_classes = (IsAuthenticated,)
+    view_name = _('Task Manager Metrics')
+    new_in_320 = True
+    new_in_api_v2 = True
+
+    def check_permissions(self, request):
+        super(TaskManagerMetricsView, self).check_permissions(request)
+        if not (request.user.is_superuser or request.user.is_system_auditor):
+            self.permission_denied(request)  # Raises PermissionDenied exception.
+
+    def get(self, request, format=None):
+        '''Return the timings and counters of recent task manager cycles.'''
+        cycles = get_recent_cycles()
+        return Response(dict(
+            schedule_interval=get_schedule_interval(),
+            history=settings.AWX_TASK_MANAGER_METRICS_HISTORY,
+            count=len(cycles),
+            results=cycles,
+        ))
+
+
 class DashboardView(APIView):
 
     view_name = _("Dashboard")
@@ -3618,7 +3645,7 @@ class WorkflowJobCancel(WorkflowsEnforcementMixin, RetrieveAPIView):
         if obj.can_cancel:
             obj.cancel()
             #TODO: Figure out whether an immediate schedule is needed.
-            run_job_complete.delay(obj.id)
+            run_job_complete.trigger(obj.id)
             return Response(status=status.HTTP_202_ACCEPTED)
         else:
             return self.http_method_not_allowed(request, *args, **kwargs)
@@ -4289,33 +4316,6 @@ class UnifiedJobList(ListAPIView):
     new_in_148 = True
 
 
-class StdoutANSIFilter(object):
-
-    def __init__(self, fileobj):
-        self.fileobj = fileobj
-        self.extra_data = ''
-        if hasattr(fileobj,'close'):
-            self.close = fileobj.close
-
-    def read(self, size=-1):
-        data = self.extra_data
-        while size > 0 and len(data) < size:
-            line = self.fileobj.readline(size)
-            if not line:
-                break
-            # Remove ANSI escape sequences used to embed event data.
-            line = re.sub(r'\x1b\[K(?:[A-Za-z0-9+/=]+\x1b\[\d+D)+\x1b\[K', '', line)
-            # Remove ANSI color escape sequences.
-            line = re.sub(r'\x1b[^m]*m', '', line)
-            data += line
-        if size > 0 and len(data) > size:
-            self.extra_data = data[size:]
-            data = data[:size]
-        else:
-            self.extra_data = ''
-        return data
-
-
 class UnifiedJobStdout(RetrieveAPIView):
 
     authentication_classes = [TokenGetAuthentication] + api_settings.DEFAULT_AUTHENTICATION_CLASSES
@@ -4347,6 +4347,18 @@ class UnifiedJobStdout(RetrieveAPIView):
             dark = bool(dark_val and dark_val[0].lower() in ('1', 't', 'y'))
             content_only = bool(request.accepted_renderer.format in ('api', 'json'))
             dark_bg = (content_only and dark) or (not content_only and (dark or not dark_val))
+
+            # The stdout of a finished job doesn't change anymore, so keep
+            # what it renders to. Redaction is done by
+            # result_stdout_raw_limited, before anything gets cached.
+            cache_key = None
+            if unified_job.status not in ACTIVE_STATES:
+                cache_key = (self.__class__.__name__, unified_job.pk, start_line, end_line,
+                             request.accepted_renderer.format, content_format, content_encoding, dark_bg)
+                rendered = rendered_stdout_cache.get(cache_key)
+                if rendered is not None:
+                    return Response(rendered)
+
             content, start, end, absolute_end = unified_job.result_stdout_raw_limited(start_line, end_line)
 
             # Remove any ANSI escape sequences containing job event data.
@@ -4362,60 +4374,52 @@ class UnifiedJobStdout(RetrieveAPIView):
             }
             data = render_to_string('api/stdout.html', context).strip()
 
+            rendered = data
             if request.accepted_renderer.format == 'api':
-                return Response(mark_safe(data))
-            if request.accepted_renderer.format == 'json':
+                rendered = mark_safe(data)
+            elif request.accepted_renderer.format == 'json':
                 if content_encoding == 'base64' and content_format == 'ansi':
-                    return Response({'range': {'start': start, 'end': end, 'absolute_end': absolute_end}, 'content': b64encode(content)})
+                    rendered = {'range': {'start': start, 'end': end, 'absolute_end': absolute_end}, 'content': b64encode(content)}
                 elif content_format == 'html':
-                    return Response({'range': {'start': start, 'end': end, 'absolute_end': absolute_end}, 'content': body})
-            return Response(data)
+                    rendered = {'range': {'start': start, 'end': end, 'absolute_end': absolute_end}, 'content': body}
+            if cache_key is not None:
+                size = len(rendered['content']) if isinstance(rendered, dict) else len(rendered)
+                rendered_stdout_cache.set(cache_key, rendered, size)
+            return Response(rendered)
         elif request.accepted_renderer.format == 'txt':
             return Response(unified_job.result_stdout)
         elif request.accepted_renderer.format == 'ansi':
             return Response(unified_job.result_stdout_raw)
         elif request.accepted_renderer.format in {'txt_download', 'ansi_download'}:
-            if not os.path.exists(unified_job.result_stdout_file):
-                write_fd = open(unified_job.result_stdout_file, 'w')
-                with connection.cursor() as cursor:
-                    try:
-                        tablename, related_name = {
-                            Job: ('main_jobevent', 'job_id'),
-                            AdHocCommand: ('main_adhoccommandevent', 'ad_hoc_command_id'),
-                        }.get(unified_job.__class__, (None, None))
-                        if tablename is None:
-                            # stdout job event reconstruction isn't supported
-                            # for certain job types (such as inventory syncs),
-                            # so just grab the raw stdout from the DB
-                            write_fd.write(unified_job.result_stdout_text)
-                            write_fd.close()
-                        else:
-                            cursor.copy_expert(
-                                "copy (select stdout from {} where {}={} order by start_line) to stdout".format(
-                                    tablename,
-                                    related_name,
-                                    unified_job.id
-                                ),
-                                write_fd
-                            )
-                            write_fd.close()
-                            subprocess.Popen("sed -i 's/\\\\r\\\\n/\\n/g' {}".format(unified_job.result_stdout_file),
-                                             shell=True).wait()
-                    except Exception as e:
-                        return Response({"error": _("Error generating stdout download file: {}".format(e))})
-            try:
-                content_fd = open(unified_job.result_stdout_file, 'r')
-                if request.accepted_renderer.format == 'txt_download':
-                    # For txt downloads, filter out ANSI escape sequences.
-                    content_fd = StdoutANSIFilter(content_fd)
-                    suffix = ''
+            # Stream the download, with ANSI escape sequences filtered out
+            # for txt downloads; it is never held in memory as a whole.
+            normalize_newlines = False
+            if os.path.exists(unified_job.result_stdout_file):
+                chunks = iter_stdout_file(unified_job.result_stdout_file)
+            else:
+                tablename, related_name = {
+                    Job: ('main_jobevent', 'job_id'),
+                    AdHocCommand: ('main_adhoccommandevent', 'ad_hoc_command_id'),
+                }.get(unified_job.__class__, (None, None))
+                if tablename is None:
+                    # stdout job event reconstruction isn't supported
+                    # for certain job types (such as inventory syncs),
+                    # so just grab the raw stdout from the DB
+                    chunks = [unified_job.result_stdout_text]
                 else:
-                    suffix = '_ansi'
-                response = HttpResponse(FileWrapper(content_fd), content_type='text/plain')
-                response["Content-Disposition"] = 'attachment; filename="job_%s%s.txt"' % (str(unified_job.id), suffix)
-                return response
-            except Exception as e:
-                return Response({"error": _("Error generating stdout download file: %s") % str(e)}, status=status.HTTP_400_BAD_REQUEST)
+                    chunks = iter_event_stdout(tablename, related_name, unified_job.id)
+                    normalize_newlines = True
+            if request.accepted_renderer.format == 'txt_download':
+                pattern = STDOUT_ANSI_CRLF_RE if normalize_newlines else STDOUT_ANSI_RE
+                suffix = ''
+            else:
+                pattern = STDOUT_CRLF_RE if normalize_newlines else None
+                suffix = '_ansi'
+            if pattern is not None:
+                chunks = filter_stdout(chunks, pattern)
+            response = StreamingHttpResponse(chunks, content_type='text/plain')
+            response["Content-Disposition"] = 'attachment; filename="job_%s%s.txt"' % (str(unified_job.id), suffix)
+            return response
         else:
             return super(UnifiedJobStdout, self).retrieve(request, *args, **kwargs)
 
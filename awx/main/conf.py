@@ -408,7 +408,9 @@ register(
                 'awx - service logs\n'
                 'activity_stream - activity stream records\n'
                 'job_events - callback data from Ansible job events\n'
-                'system_tracking - facts gathered from scan jobs.'),
+                'system_tracking - facts gathered from scan jobs\n'
+                'task_manager - timings and counters of each task manager cycle\n'
+                'callback_receiver - queue depth and throughput of the job event workers.'),
     category=_('Logging'),
     category_slug='logging',
 )
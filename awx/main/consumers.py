@@ -1,6 +1,8 @@
 import json
 import logging
+import time
 import urllib
+from collections import OrderedDict
 
 from channels import Group, channel_layers
 from channels.sessions import channel_session
@@ -96,3 +98,71 @@ def emit_channel_notification(group, payload):
         Group(group).send({"text": json.dumps(payload, cls=DjangoJSONEncoder)})
     except ValueError:
         logger.error("Invalid payload emitting channel {} on topic: {}".format(group, payload))
+
+
+class EventEmitter(object):
+    '''
+    Coalesces the events sent to websocket groups (e.g. job_events-<id>).
+
+    Until buffering is turned on events are sent one per message. Once it is,
+    the events of each group are buffered and sent as one frame every
+    WEBSOCKET_EVENT_INTERVAL seconds:
+
+        {"group_name": "job_events", "job": 42, "events": [...],
+         "skipped": 0, "skipped_counters": null}
+
+    At most WEBSOCKET_EVENT_BATCH_MAX events of a group go in a frame. The
+    events beyond that are only counted, along with the range of their
+    counters, so that listeners can fetch them from the API if they need them.
+
+    The process buffering events must call flush() regularly, see
+    CallbackBrokerWorker.callback_worker().
+    '''
+
+    # Keys copied from the first event of a frame, so that listeners can route it
+    frame_keys = ('group_name', 'job', 'ad_hoc_command')
+
+    def __init__(self):
+        self.buffering = False
+        self.buffers = OrderedDict()
+        self.last_flush = time.time()
+
+    @property
+    def pending(self):
+        return bool(self.buffers)
+
+    def send(self, group, payload):
+        if not self.buffering:
+            emit_channel_notification(group, payload)
+            return
+        buf = self.buffers.get(group)
+        if buf is None:
+            buf = self.buffers[group] = dict(
+                frame=OrderedDict((k, payload[k]) for k in self.frame_keys if k in payload),
+                events=[], skipped=0, skipped_counters=None,
+            )
+        if len(buf['events']) < settings.WEBSOCKET_EVENT_BATCH_MAX:
+            buf['events'].append(payload)
+        else:
+            buf['skipped'] += 1
+            counter = payload.get('counter')
+            if counter is not None:
+                low, high = buf['skipped_counters'] or (counter, counter)
+                buf['skipped_counters'] = [min(low, counter), max(high, counter)]
+        self.flush()
+
+    def flush(self, force=False):
+        now = time.time()
+        if not force and now - self.last_flush < settings.WEBSOCKET_EVENT_INTERVAL:
+            return
+        self.last_flush = now
+        buffers, self.buffers = self.buffers, OrderedDict()
+        for group, buf in buffers.items():
+            frame = buf['frame']
+            frame['events'] = buf['events']
+            frame['skipped'] = buf['skipped']
+            frame['skipped_counters'] = buf['skipped_counters']
+            emit_channel_notification(group, frame)
+
+
+event_emitter = EventEmitter()
@@ -110,7 +110,7 @@ class IsolatedManager(object):
         job execution within the isolated instance
         '''
         for var in (
-                'HOME', 'RABBITMQ_HOST', 'RABBITMQ_PASS', 'RABBITMQ_USER', 'CACHE',
+                'HOME', 'RABBITMQ_HOST', 'RABBITMQ_PASS', 'RABBITMQ_USER',
                 'DJANGO_PROJECT_DIR', 'DJANGO_SETTINGS_MODULE', 'RABBITMQ_VHOST'):
             env.pop(var, None)
         return env
@@ -221,8 +221,6 @@ class IsolatedManager(object):
             '- /project/.git',
             '- /project/.svn',
             '- /project/.hg',
-            # don't rsync job events that are in the process of being written
-            '- /artifacts/job_events/*-partial.json.tmp',
             # rsync can't copy named pipe data - we're replicating this manually ourselves in the playbook
             '- /env'
         ]
@@ -241,7 +239,7 @@ class IsolatedManager(object):
             os.symlink(self.cwd, self.path_to('project'))
 
         # create directories for build artifacts to live in
-        os.makedirs(self.path_to('artifacts', 'job_events'), mode=stat.S_IXUSR + stat.S_IWUSR + stat.S_IRUSR)
+        os.makedirs(self.path_to('artifacts'), mode=stat.S_IXUSR + stat.S_IWUSR + stat.S_IRUSR)
 
     def _missing_artifacts(self, path_list, output):
         missing_artifacts = filter(lambda path: not os.path.exists(path), path_list)
@@ -436,20 +434,9 @@ class IsolatedManager(object):
 
         def job_event_callback(event_data):
             event_data.setdefault(event_data_key, instance.id)
-            if 'uuid' in event_data:
-                filename = '{}-partial.json'.format(event_data['uuid'])
-                partial_filename = os.path.join(private_data_dir, 'artifacts', 'job_events', filename)
-                try:
-                    with codecs.open(partial_filename, 'r', encoding='utf-8') as f:
-                        partial_event_data = json.load(f)
-                    event_data.update(partial_event_data)
-                except IOError:
-                    if event_data.get('event', '') != 'verbose':
-                        logger.error('Missing callback data for event type `{}`, uuid {}, job {}.\nevent_data: {}'.format(
-                            event_data.get('event', ''), event_data['uuid'], instance.id, event_data))
             dispatcher.dispatch(event_data)
 
-        return OutputEventFilter(stdout_handle, job_event_callback)
+        return OutputEventFilter(stdout_handle, job_event_callback, close_callback=dispatcher.flush)
 
     def run(self, instance, host, private_data_dir, proot_temp_dir):
         """
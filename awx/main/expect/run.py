@@ -119,6 +119,10 @@ def run_pexpect(args, cwd, env, logfile,
         if logfile_pos != logfile.tell():
             logfile_pos = logfile.tell()
             last_stdout_update = time.time()
+        else:
+            # pexpect flushes the logfile after every read, which a compressed
+            # stdout file may only partly honor; make the last output readable.
+            logfile.flush()
         if cancelled_callback:
             try:
                 canceled = cancelled_callback()
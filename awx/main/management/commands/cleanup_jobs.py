@@ -8,12 +8,12 @@ from optparse import make_option
 
 # Django
 from django.core.management.base import NoArgsCommand, CommandError
-from django.db import transaction
+from django.db import connection, transaction
 from django.utils.timezone import now
 
 # AWX
 from awx.main.models import (
-    Job, AdHocCommand, ProjectUpdate, InventoryUpdate,
+    Job, JobEvent, AdHocCommand, AdHocCommandEvent, ProjectUpdate, InventoryUpdate,
     SystemJob, WorkflowJob, Notification
 )
 from awx.main.signals import ( # noqa
@@ -32,6 +32,9 @@ class Command(NoArgsCommand):
 
     help = 'Remove old jobs, project and inventory updates from the database.'
 
+    # Number of jobs whose events are removed by a single DELETE
+    EVENT_DELETE_BATCH_SIZE = 100
+
     option_list = NoArgsCommand.option_list + (
         make_option('--days', dest='days', type='int', default=90, metavar='N',
                     help='Remove jobs/updates executed more than N days ago. Defaults to 90.'),
@@ -61,10 +64,35 @@ class Command(NoArgsCommand):
                     help='Remove workflow jobs')
     )
 
+    def delete_events(self, event_model, job_ids):
+        '''
+        Remove the events of many jobs with set-based DELETEs, instead of
+        letting each job's delete() collect its events and cascade to them
+        one by one.
+        '''
+        if not job_ids:
+            return
+        table = event_model._meta.db_table
+        job_column = event_model._meta.get_field(
+            'job' if event_model is JobEvent else 'ad_hoc_command').column
+        placeholders = ', '.join(['%s'] * len(job_ids))
+        with connection.cursor() as cursor:
+            for field in event_model._meta.many_to_many:
+                cursor.execute('DELETE FROM {} WHERE {} IN (SELECT id FROM {} WHERE {} IN ({}))'.format(
+                    field.m2m_db_table(), field.m2m_column_name(), table, job_column, placeholders), job_ids)
+            cursor.execute('DELETE FROM {} WHERE {} IN ({})'.format(table, job_column, placeholders), job_ids)
+
+    def delete_jobs(self, event_model, jobs):
+        self.delete_events(event_model, [job.pk for job in jobs])
+        for job in jobs:
+            job.delete()
+        del jobs[:]
+
     def cleanup_jobs(self):
         #jobs_qs = Job.objects.exclude(status__in=('pending', 'running'))
         #jobs_qs = jobs_qs.filter(created__lte=self.cutoff)
         skipped, deleted = 0, 0
+        to_delete = []
         jobs = Job.objects.filter(created__lt=self.cutoff)
         for job in jobs.iterator():
             job_display = '"%s" (%d host summaries, %d events)' % \
@@ -78,14 +106,18 @@ class Command(NoArgsCommand):
                 action_text = 'would delete' if self.dry_run else 'deleting'
                 self.logger.info('%s %s', action_text, job_display)
                 if not self.dry_run:
-                    job.delete()
+                    to_delete.append(job)
+                    if len(to_delete) >= self.EVENT_DELETE_BATCH_SIZE:
+                        self.delete_jobs(JobEvent, to_delete)
                 deleted += 1
+        self.delete_jobs(JobEvent, to_delete)
 
         skipped += Job.objects.filter(created__gte=self.cutoff).count()
         return skipped, deleted
 
     def cleanup_ad_hoc_commands(self):
         skipped, deleted = 0, 0
+        to_delete = []
         ad_hoc_commands = AdHocCommand.objects.filter(created__lt=self.cutoff)
         for ad_hoc_command in ad_hoc_commands.iterator():
             ad_hoc_command_display = '"%s" (%d events)' % \
@@ -99,8 +131,11 @@ class Command(NoArgsCommand):
                 action_text = 'would delete' if self.dry_run else 'deleting'
                 self.logger.info('%s %s', action_text, ad_hoc_command_display)
                 if not self.dry_run:
-                    ad_hoc_command.delete()
+                    to_delete.append(ad_hoc_command)
+                    if len(to_delete) >= self.EVENT_DELETE_BATCH_SIZE:
+                        self.delete_jobs(AdHocCommandEvent, to_delete)
                 deleted += 1
+        self.delete_jobs(AdHocCommandEvent, to_delete)
 
         skipped += AdHocCommand.objects.filter(created__gte=self.cutoff).count()
         return skipped, deleted
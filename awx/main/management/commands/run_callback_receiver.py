@@ -2,14 +2,17 @@
 # All Rights Reserved.
 
 # Python
+from collections import OrderedDict
 import logging
 import signal
 from uuid import UUID
 from multiprocessing import Process
 from multiprocessing import Queue as MPQueue
+from multiprocessing import Value as MPValue
 from Queue import Empty as QueueEmpty
 from Queue import Full as QueueFull
 import os
+import time
 
 from kombu import Connection, Exchange, Queue
 from kombu.mixins import ConsumerMixin
@@ -22,9 +25,13 @@ from django.db import DatabaseError
 from django.core.cache import cache as django_cache
 
 # AWX
+from awx.main.consumers import event_emitter
 from awx.main.models import * # noqa
 
 logger = logging.getLogger('awx.main.commands.run_callback_receiver')
+analytics_logger = logging.getLogger('awx.analytics.callback_receiver')
+
+METRICS_CACHE_KEY = 'callback_receiver_metrics'
 
 
 class WorkerSignalHandler:
@@ -38,11 +45,129 @@ class WorkerSignalHandler:
         self.kill_now = True
 
 
+class HostIdCache(object):
+    '''
+    Bounded cache of the inventory host ids of running jobs, by host name,
+    used by a worker to resolve the hosts of the job events it saves.
+
+    The hosts of a job's inventory are loaded with a single query when the
+    first event of the job comes in, and the job is forgotten once its
+    playbook_on_stats event has been saved, or when no event of it came in
+    for ttl seconds (a job canceled or failed before the end of its
+    playbook). Names that aren't in the inventory aren't cached, and are
+    looked up again. Least recently used jobs are dropped when more than
+    max_size host names are cached.
+    '''
+
+    def __init__(self, max_size, ttl=600):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.size = 0
+        self.jobs = OrderedDict()  # job id -> (last use, {host name: host id})
+
+    def get_host_ids(self, job, hostnames):
+        if not job.inventory_id:
+            return dict((name, None) for name in hostnames)
+        now = time.time()
+        entry = self.jobs.pop(job.id, None)
+        if entry is None:
+            host_ids = dict(job.inventory.hosts.values_list('name', 'id'))
+            self.size += len(host_ids)
+        else:
+            host_ids = entry[1]
+            # Hosts may have been added to the inventory since it was loaded
+            missing = [name for name in hostnames if name not in host_ids]
+            if missing:
+                found = dict((name, pk) for name, pk in JobEvent._get_host_ids(job, missing).items()
+                             if pk is not None)
+                host_ids.update(found)
+                self.size += len(found)
+        self.jobs[job.id] = (now, host_ids)
+        self.evict(now)
+        return dict((name, host_ids.get(name)) for name in hostnames)
+
+    def evict(self, now=None):
+        '''
+        Drop the jobs not used for ttl seconds, then the least recently
+        used ones while more than max_size host names are cached.
+        '''
+        now = time.time() if now is None else now
+        for job_id, (last_use, host_ids) in self.jobs.items():
+            if now - last_use < self.ttl and (self.size <= self.max_size or len(self.jobs) <= 1):
+                break
+            self.evict_job(job_id)
+
+    def evict_job(self, job_id):
+        entry = self.jobs.pop(job_id, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+
+class CallbackReceiverMetrics(object):
+    '''
+    Queue depth, throughput and drop counters of each job event worker.
+
+    Events queued, overflowed to another worker and dropped are counted by the
+    consumer; events saved are counted by each worker process in shared memory.
+    Every JOB_EVENT_METRICS_INTERVAL seconds the counters are sent to the
+    awx.analytics.callback_receiver logger and kept in the cache.
+    '''
+
+    def __init__(self, worker_count):
+        self.start = self.last_publish = time.time()
+        self.queued = [0] * worker_count
+        self.overflowed = [0] * worker_count
+        self.dropped = [0] * worker_count
+        self.saved = [MPValue('L', 0) for i in range(worker_count)]
+        self.last_queued = [0] * worker_count
+        self.last_saved = [0] * worker_count
+
+    def as_dict(self, worker_queues, elapsed):
+        workers = []
+        for idx, queue_actual in enumerate(worker_queues):
+            try:
+                depth = queue_actual.qsize()
+            except NotImplementedError:
+                depth = None
+            saved = self.saved[idx].value
+            workers.append(OrderedDict([
+                ('worker', idx),
+                ('queue_depth', depth),
+                ('queued', self.queued[idx]),
+                ('saved', saved),
+                ('overflowed', self.overflowed[idx]),
+                ('dropped', self.dropped[idx]),
+                ('queued_per_second', (self.queued[idx] - self.last_queued[idx]) / elapsed if elapsed else None),
+                ('saved_per_second', (saved - self.last_saved[idx]) / elapsed if elapsed else None),
+            ]))
+            self.last_queued[idx] = self.queued[idx]
+            self.last_saved[idx] = saved
+        return OrderedDict([
+            ('cluster_node', settings.CLUSTER_HOST_ID),
+            ('uptime', time.time() - self.start),
+            ('interval', elapsed),
+            ('queue_size', settings.JOB_EVENT_MAX_QUEUE_SIZE),
+            ('workers', workers),
+        ])
+
+    def publish(self, worker_queues, force=False):
+        now = time.time()
+        elapsed = now - self.last_publish
+        if not force and elapsed < settings.JOB_EVENT_METRICS_INTERVAL:
+            return None
+        self.last_publish = now
+        data = self.as_dict(worker_queues, elapsed)
+        analytics_logger.info('callback receiver workers', extra=dict(data))
+        django_cache.set(METRICS_CACHE_KEY, data)
+        return data
+
+
 class CallbackBrokerWorker(ConsumerMixin):
     def __init__(self, connection, use_workers=True):
         self.connection = connection
         self.worker_queues = []
         self.total_messages = 0
+        self.metrics = CallbackReceiverMetrics(settings.JOB_EVENT_WORKERS)
         self.init_workers(use_workers)
 
     def init_workers(self, use_workers=True):
@@ -80,48 +205,117 @@ class CallbackBrokerWorker(ConsumerMixin):
                          accept=['json'],
                          callbacks=[self.process_task])]
 
-    def process_task(self, body, message):
-        if "uuid" in body and body['uuid']:
+    def on_iteration(self):
+        try:
+            self.metrics.publish([w[1] for w in self.worker_queues])
+        except Exception:
+            logger.exception('Could not publish callback receiver metrics')
+
+    def select_worker(self, body):
+        '''
+        All the events of a job (or ad hoc command) go to the same worker, so
+        that its host cache and event ordering are kept in one process.
+        '''
+        for key in ('job_id', 'ad_hoc_command_id'):
+            if body.get(key) is not None:
+                try:
+                    return int(body[key]) % settings.JOB_EVENT_WORKERS
+                except (TypeError, ValueError):
+                    pass
+        if body.get('uuid'):
             try:
-                queue = UUID(body['uuid']).int % settings.JOB_EVENT_WORKERS
+                return UUID(body['uuid']).int % settings.JOB_EVENT_WORKERS
             except Exception:
-                queue = self.total_messages % settings.JOB_EVENT_WORKERS
-        else:
-            queue = self.total_messages % settings.JOB_EVENT_WORKERS
-        self.write_queue_worker(queue, body)
-        self.total_messages += 1
+                pass
+        return self.total_messages % settings.JOB_EVENT_WORKERS
+
+    def process_task(self, body, message):
+        # CallbackQueueDispatcher publishes lists of events
+        events = body if isinstance(body, list) else [body]
+        for event in events:
+            self.write_queue_worker(self.select_worker(event), event)
+            self.total_messages += 1
         message.ack()
 
     def write_queue_worker(self, preferred_queue, body):
-        queue_order = sorted(range(settings.JOB_EVENT_WORKERS), cmp=lambda x, y: -1 if x==preferred_queue else 0)
-        write_attempt_order = []
-        for queue_actual in queue_order:
+        '''
+        Hand body to the preferred worker, or to the next worker whose queue
+        isn't full.  Only when every queue is full does the consumer wait (up
+        to JOB_EVENT_QUEUE_TIMEOUT seconds) on the preferred worker, which
+        holds back further deliveries from the broker, before dropping the
+        event.
+        '''
+        worker_count = len(self.worker_queues)
+        for offset in range(worker_count):
+            queue_actual = (preferred_queue + offset) % worker_count
+            worker_actual = self.worker_queues[queue_actual]
             try:
-                worker_actual = self.worker_queues[queue_actual]
-                worker_actual[1].put(body, block=True, timeout=5)
-                worker_actual[0] += 1
-                return queue_actual
+                worker_actual[1].put_nowait(body)
             except QueueFull:
-                pass
+                continue
             except Exception:
-                import traceback
-                tb = traceback.format_exc()
-                logger.warn("Could not write to queue %s" % preferred_queue)
-                logger.warn("Detail: {}".format(tb))
-            write_attempt_order.append(preferred_queue)
-        logger.warn("Could not write payload to any queue, attempted order: {}".format(write_attempt_order))
-        return None
+                logger.exception("Could not write to queue %s" % queue_actual)
+                continue
+            worker_actual[0] += 1
+            self.metrics.queued[queue_actual] += 1
+            if queue_actual != preferred_queue:
+                self.metrics.overflowed[preferred_queue] += 1
+            return queue_actual
+        try:
+            self.worker_queues[preferred_queue][1].put(body, block=True, timeout=settings.JOB_EVENT_QUEUE_TIMEOUT)
+        except Exception:
+            self.metrics.dropped[preferred_queue] += 1
+            logger.warn("Could not write payload to any queue, dropped event for worker {}".format(preferred_queue))
+            return None
+        self.worker_queues[preferred_queue][0] += 1
+        self.metrics.queued[preferred_queue] += 1
+        return preferred_queue
 
     def callback_worker(self, queue_actual, idx):
         signal_handler = WorkerSignalHandler()
+        host_cache = HostIdCache(settings.JOB_EVENT_HOST_CACHE_SIZE, settings.JOB_EVENT_HOST_CACHE_TTL)
+        event_emitter.buffering = True
         while not signal_handler.kill_now:
             try:
-                body = queue_actual.get(block=True, timeout=1)
+                timeout = settings.WEBSOCKET_EVENT_INTERVAL if event_emitter.pending else 1
+                body = queue_actual.get(block=True, timeout=timeout)
             except QueueEmpty:
+                event_emitter.flush()
+                host_cache.evict()
                 continue
             except Exception as e:
                 logger.error("Exception on worker thread, restarting: " + str(e))
                 continue
+            batch = self.read_batch(queue_actual, body)
+            self.save_events(batch, host_cache)
+            event_emitter.flush()
+            with self.metrics.saved[idx].get_lock():
+                self.metrics.saved[idx].value += len(batch)
+        event_emitter.flush(force=True)
+
+    def read_batch(self, queue_actual, body):
+        '''
+        Gather the events following body into a batch, until the batch is
+        JOB_EVENT_BATCH_SIZE long or JOB_EVENT_BATCH_LATENCY has passed.
+        '''
+        batch = [body]
+        deadline = time.time() + settings.JOB_EVENT_BATCH_LATENCY
+        while len(batch) < settings.JOB_EVENT_BATCH_SIZE:
+            timeout = deadline - time.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(queue_actual.get(block=True, timeout=timeout))
+            except QueueEmpty:
+                break
+            except Exception as e:
+                logger.error("Exception on worker thread, restarting: " + str(e))
+                break
+        return batch
+
+    def save_events(self, batch, host_cache=None):
+        job_events = []
+        for body in batch:
             try:
                 if 'job_id' not in body and 'ad_hoc_command_id' not in body:
                     raise Exception('Payload does not have a job_id or ad_hoc_command_id')
@@ -133,18 +327,33 @@ class CallbackBrokerWorker(ConsumerMixin):
                     logger.info('Body: {}'.format(
                         highlight(pformat(body, width=160), PythonLexer(), Terminal256Formatter(style='friendly'))
                     ))
+                if 'job_id' in body:
+                    job_events.append(body)
+                    continue
                 try:
-                    if 'job_id' in body:
-                        JobEvent.create_from_data(**body)
-                    elif 'ad_hoc_command_id' in body:
-                        AdHocCommandEvent.create_from_data(**body)
+                    AdHocCommandEvent.create_from_data(**body)
                 except DatabaseError as e:
-                    logger.error('Database Error Saving Job Event: {}'.format(e))
+                    logger.error('Database Error Saving Ad Hoc Command Event: {}'.format(e))
             except Exception as exc:
                 import traceback
                 tb = traceback.format_exc()
                 logger.error('Callback Task Processor Raised Exception: %r', exc)
                 logger.error('Detail: {}'.format(tb))
+        if not job_events:
+            return
+        try:
+            JobEvent.bulk_create_from_data(job_events, host_cache=host_cache)
+        except DatabaseError as e:
+            logger.error('Database Error Saving Job Events: {}'.format(e))
+        except Exception as exc:
+            import traceback
+            tb = traceback.format_exc()
+            logger.error('Callback Task Processor Raised Exception: %r', exc)
+            logger.error('Detail: {}'.format(tb))
+        if host_cache is not None:
+            for body in job_events:
+                if body.get('event') == 'playbook_on_stats':
+                    host_cache.evict_job(body['job_id'])
 
 
 class Command(NoArgsCommand):
@@ -0,0 +1,86 @@
+# Copyright (c) 2017 Ansible by Red Hat
+# All Rights Reserved.
+
+# Python
+import datetime
+import json
+from optparse import make_option
+
+# Django
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.timezone import now
+
+# AWX
+from awx.main.models import InstanceGroup, UnifiedJob
+from awx.main.scheduler.simulation import PlacementSimulation
+
+
+class Command(BaseCommand):
+    '''
+    Record the recent task queue to a file, or replay a recorded queue
+    against the task manager placement strategies to compare them.
+    '''
+
+    help = 'Record or replay the task queue to compare task manager placement strategies.'
+
+    option_list = BaseCommand.option_list + (
+        make_option('--record', dest='record', type='string', metavar='FILE',
+                    help='Write the jobs finished in the last --days days to FILE.'),
+        make_option('--days', dest='days', type='int', default=1, metavar='N',
+                    help='Number of days of jobs to record. Defaults to 1.'),
+        make_option('--replay', dest='replay', type='string', metavar='FILE',
+                    help='Replay the queue recorded in FILE with each placement strategy.'),
+        make_option('--cycle', dest='cycle', type='int', default=20, metavar='N',
+                    help='Seconds between simulated task manager cycles. Defaults to 20.'),
+    )
+
+    STRATEGIES = (
+        ('greedy', False),
+        ('best_fit', False),
+        ('best_fit', True),
+    )
+
+    def record(self, filename, days):
+        instance_groups = {}
+        for ig in InstanceGroup.objects.prefetch_related('instances'):
+            instance_groups[ig.name] = dict(capacity=ig.capacity,
+                                            instances=[i.hostname for i in ig.instances.all()])
+        cutoff = now() - datetime.timedelta(days=days)
+        unified_jobs = list(UnifiedJob.objects.filter(
+            finished__gte=cutoff, started__isnull=False,
+            status__in=('successful', 'failed', 'error', 'canceled')).order_by('created'))
+        UnifiedJob.prefetch_task_impact(unified_jobs)
+        if unified_jobs:
+            epoch = unified_jobs[0].created
+        tasks = []
+        for uj in unified_jobs:
+            tasks.append(dict(
+                id=uj.id,
+                created=(uj.created - epoch).total_seconds(),
+                duration=(uj.finished - uj.started).total_seconds(),
+                impact=uj.task_impact,
+                instance_groups=[ig.name for ig in uj.preferred_instance_groups],
+            ))
+        with open(filename, 'w') as f:
+            json.dump(dict(instance_groups=instance_groups, tasks=tasks), f, indent=2)
+        self.stdout.write('Recorded {} tasks to {}'.format(len(tasks), filename))
+
+    def replay(self, filename, cycle):
+        with open(filename) as f:
+            recording = json.load(f)
+        self.stdout.write('{:<10} {:<8} {:>12} {:>12} {:>12} {:>9}'.format(
+            'placement', 'reserve', 'utilization', 'mean wait', 'makespan', 'unplaced'))
+        for placement, reserve_capacity in self.STRATEGIES:
+            report = PlacementSimulation(recording, placement=placement,
+                                         reserve_capacity=reserve_capacity, cycle=cycle).report()
+            self.stdout.write('{:<10} {:<8} {:>11.1f}% {:>11.1f}s {:>11.1f}s {:>9}'.format(
+                placement, 'yes' if reserve_capacity else 'no', report['utilization'] * 100,
+                report['mean_wait'], report['makespan'], report['unplaced']))
+
+    def handle(self, *args, **options):
+        if bool(options.get('record')) == bool(options.get('replay')):
+            raise CommandError('Specify one of --record or --replay.')
+        if options.get('record'):
+            self.record(options['record'], options['days'])
+        else:
+            self.replay(options['replay'], options['cycle'])
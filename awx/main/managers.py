@@ -7,12 +7,12 @@ import logging
 
 from django.db import models
 from django.utils.timezone import now
-from django.db.models import Sum
+from django.db.models import Sum, Count
 from django.conf import settings
 
 from awx.main.utils.filters import SmartFilter
 
-___all__ = ['HostManager', 'InstanceManager', 'InstanceGroupManager']
+___all__ = ['HostManager', 'InstanceManager', 'InstanceGroupManager', 'TaskLeaseManager']
 
 logger = logging.getLogger('awx.main.managers')
 
@@ -27,6 +27,16 @@ class HostManager(models.Manager):
         except NotImplementedError: # For unit tests only, SQLite doesn't support distinct('name')
             return len(set(self.values_list('name', flat=True)))
 
+    def count_by_inventory(self, inventory_ids, **kwargs):
+        """Return a dict of inventory_id -> number of hosts, using a single
+        grouped query.
+        """
+        inventory_ids = [pk for pk in inventory_ids if pk is not None]
+        if not inventory_ids:
+            return {}
+        qs = self.filter(inventory_id__in=inventory_ids, **kwargs).order_by()
+        return dict(qs.values_list('inventory_id').annotate(host_count=Count('id')))
+
     def get_queryset(self):
         """When the parent instance of the host query set has a `kind=smart` and a `host_filter`
         set. Use the `host_filter` to generate the queryset for the hosts.
@@ -146,9 +156,13 @@ class InstanceGroupManager(models.Manager):
             qs = self.all().prefetch_related('instances')
         instance_ig_mapping, ig_ig_mapping = self.capacity_mapping(qs=qs)
 
+        UnifiedJob = self.model.unifiedjob_set.related.related_model
         if tasks is None:
-            tasks = self.model.unifiedjob_set.related.related_model.objects.filter(
-                status__in=('running', 'waiting'))
+            tasks = UnifiedJob.objects.filter(status__in=('running', 'waiting'))
+        if isinstance(tasks, models.QuerySet):
+            # Count hosts for all jobs at once instead of once per job
+            tasks = list(tasks)
+            UnifiedJob.prefetch_task_impact(tasks)
 
         if graph is None:
             graph = {group.name: {} for group in qs}
@@ -194,3 +208,30 @@ class InstanceGroupManager(models.Manager):
             else:
                 logger.error('Programming error, %s not in ["running", "waiting"]', t.log_format)
         return graph
+
+
+class TaskLeaseManager(models.Manager):
+    """A custom manager class for the TaskLease model.
+
+    Used by workers to take and renew the lease on the tasks they run.
+    """
+
+    def get_expiry(self):
+        return now() + timedelta(seconds=settings.AWX_TASK_LEASE_TIMEOUT)
+
+    def acquire(self, unified_job):
+        """Create or refresh the lease of a task that is starting to run."""
+        fields = dict(celery_task_id=unified_job.celery_task_id or '',
+                      execution_node=unified_job.execution_node or '',
+                      expires=self.get_expiry())
+        if not self.filter(unified_job_id=unified_job.pk).update(**fields):
+            self.create(unified_job_id=unified_job.pk, **fields)
+
+    def renew(self, unified_job_id):
+        """
+        Extend the lease of a task that is still waiting or running. Returns
+        False once there is nothing left to renew.
+        """
+        return bool(self.filter(unified_job_id=unified_job_id,
+                                unified_job__status__in=('waiting', 'running'))
+                        .update(expires=self.get_expiry()))
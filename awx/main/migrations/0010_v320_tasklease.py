@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0009_v320_unifiedjob_modified_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskLease',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('celery_task_id', models.CharField(max_length=100, blank=True)),
+                ('execution_node', models.TextField(blank=True)),
+                ('expires', models.DateTimeField(db_index=True)),
+                ('unified_job', models.OneToOneField(related_name='task_lease', to='main.UnifiedJob')),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+EVENT_TABLES = ('main_jobevent', 'main_adhoccommandevent')
+
+
+def create_brin_indexes(apps, schema_editor):
+    # Events are inserted in time order, so a BRIN index over created is a
+    # tiny fraction of the size of a btree and just as selective
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in EVENT_TABLES:
+        schema_editor.execute('CREATE INDEX {0}_created_brin ON {0} USING brin (created)'.format(table))
+
+
+def drop_brin_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    for table in EVENT_TABLES:
+        schema_editor.execute('DROP INDEX IF EXISTS {0}_created_brin'.format(table))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('main', '0010_v320_tasklease'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_brin_indexes, drop_brin_indexes),
+    ]
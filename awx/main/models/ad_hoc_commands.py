@@ -191,9 +191,18 @@ class AdHocCommand(UnifiedJob, JobNotificationMixin):
     def task_impact(self):
         # NOTE: We sorta have to assume the host count matches and that forks default to 5
         from awx.main.models.inventory import Host
-        count_hosts = Host.objects.filter( enabled=True, inventory__ad_hoc_commands__pk=self.pk).count()
+        count_hosts = getattr(self, '_task_impact_host_count', None)
+        if count_hosts is None:
+            count_hosts = Host.objects.filter( enabled=True, inventory__ad_hoc_commands__pk=self.pk).count()
         return min(count_hosts, 5 if self.forks == 0 else self.forks) * 10
 
+    @classmethod
+    def _prefetch_task_impact(cls, ad_hoc_commands):
+        from awx.main.models.inventory import Host
+        host_counts = Host.objects.count_by_inventory(set(a.inventory_id for a in ad_hoc_commands), enabled=True)
+        for ad_hoc_command in ad_hoc_commands:
+            ad_hoc_command._task_impact_host_count = host_counts.get(ad_hoc_command.inventory_id, 0)
+
     def copy(self):
         data = {}
         for field in ('job_type', 'inventory_id', 'limit', 'credential_id',
@@ -11,13 +11,13 @@ from django.utils.timezone import now, timedelta
 from solo.models import SingletonModel
 
 from awx.api.versioning import reverse
-from awx.main.managers import InstanceManager, InstanceGroupManager
+from awx.main.managers import InstanceManager, InstanceGroupManager, TaskLeaseManager
 from awx.main.models.inventory import InventoryUpdate
 from awx.main.models.jobs import Job
 from awx.main.models.projects import ProjectUpdate
 from awx.main.models.unified_jobs import UnifiedJob
 
-__all__ = ('Instance', 'InstanceGroup', 'JobOrigin', 'TowerScheduleState',)
+__all__ = ('Instance', 'InstanceGroup', 'JobOrigin', 'TaskLease', 'TowerScheduleState',)
 
 
 class Instance(models.Model):
@@ -47,8 +47,10 @@ class Instance(models.Model):
 
     @property
     def consumed_capacity(self):
-        return sum(x.task_impact for x in UnifiedJob.objects.filter(execution_node=self.hostname,
-                                                                    status__in=('running', 'waiting')))
+        tasks = list(UnifiedJob.objects.filter(execution_node=self.hostname,
+                                               status__in=('running', 'waiting')))
+        UnifiedJob.prefetch_task_impact(tasks)
+        return sum(x.task_impact for x in tasks)
 
     @property
     def role(self):
@@ -119,6 +121,24 @@ class JobOrigin(models.Model):
         app_label = 'main'
 
 
+class TaskLease(models.Model):
+    """A model representing the lease a worker holds on a task it runs.
+
+    The worker renews the lease for as long as the task runs. The task
+    manager fails waiting and running tasks whose lease has expired, rather
+    than asking every celery worker for its active tasks.
+    """
+    objects = TaskLeaseManager()
+
+    unified_job = models.OneToOneField(UnifiedJob, related_name='task_lease', on_delete=models.CASCADE)
+    celery_task_id = models.CharField(max_length=100, blank=True)
+    execution_node = models.TextField(blank=True)
+    expires = models.DateTimeField(db_index=True)
+
+    class Meta:
+        app_label = 'main'
+
+
 # Unfortunately, the signal can't just be connected against UnifiedJob; it
 # turns out that creating a model's subclass doesn't fire the signal for the
 # superclass model.
@@ -13,15 +13,16 @@ from urlparse import urljoin
 
 # Django
 from django.conf import settings
-from django.db import models
+from django.db import models, transaction, connection, DatabaseError, IntegrityError
+from django.db.models.signals import post_save
 #from django.core.cache import cache
 import memcache
-from django.db.models import Q, Count
+from django.db.models import Count, Sum, Case, When, Value
 from django.utils.dateparse import parse_datetime
 from dateutil import parser
 from dateutil.tz import tzutc
 from django.utils.encoding import force_text, smart_str
-from django.utils.timezone import utc
+from django.utils.timezone import utc, now
 from django.utils.translation import ugettext_lazy as _
 from django.core.exceptions import ValidationError
 
@@ -34,9 +35,9 @@ from awx.main.models.notifications import (
     JobNotificationMixin,
 )
 from awx.main.utils import (
-    ignore_inventory_computed_fields,
     parse_yaml_or_json,
 )
+from awx.main.utils.db import allocate_ids
 from awx.main.fields import ImplicitRoleField
 from awx.main.models.mixins import ResourceMixin, SurveyJobTemplateMixin, SurveyJobMixin, TaskManagerJobMixin
 from awx.main.models.base import PERM_INVENTORY_SCAN
@@ -600,9 +601,18 @@ class Job(UnifiedJob, JobOptions, SurveyJobMixin, JobNotificationMixin, TaskMana
         if self.launch_type == 'callback':
             count_hosts = 1
         else:
-            count_hosts = Host.objects.filter(inventory__jobs__pk=self.pk).count()
+            count_hosts = getattr(self, '_task_impact_host_count', None)
+            if count_hosts is None:
+                count_hosts = Host.objects.filter(inventory__jobs__pk=self.pk).count()
         return min(count_hosts, 5 if self.forks == 0 else self.forks) * 10
 
+    @classmethod
+    def _prefetch_task_impact(cls, jobs):
+        from awx.main.models.inventory import Host
+        host_counts = Host.objects.count_by_inventory(set(job.inventory_id for job in jobs))
+        for job in jobs:
+            job._task_impact_host_count = host_counts.get(job.inventory_id, 0)
+
     @property
     def successful_hosts(self):
         return self._get_hosts(job_host_summaries__ok__gt=0)
@@ -942,6 +952,9 @@ class JobEvent(CreatedModifiedModel):
         (0, 'error', _('Error'), True),
     ]
     FAILED_EVENTS = [x[1] for x in EVENT_TYPES if x[3]]
+    HOST_SUMMARY_STATS = ('changed', 'dark', 'failures', 'ok', 'processed', 'skipped')
+    # Rows per bulk_create() / UPDATE when writing job host summaries
+    BULK_UPDATE_BATCH_SIZE = 500
     EVENT_CHOICES = [(x[1], x[2]) for x in EVENT_TYPES]
     LEVEL_FOR_EVENT = dict([(x[1], x[0]) for x in EVENT_TYPES])
 
@@ -1157,16 +1170,25 @@ class JobEvent(CreatedModifiedModel):
 
     def _update_parents_failed_and_changed(self):
         # Update parent events to reflect failed, changed
-        runner_events = JobEvent.objects.filter(job=self.job,
-                                                event__startswith='runner_on')
-        changed_events = runner_events.filter(changed=True)
-        failed_events = runner_events.filter(failed=True)
-        JobEvent.objects.filter(uuid__in=changed_events.values_list('parent_uuid', flat=True)).update(changed=True)
-        JobEvent.objects.filter(uuid__in=failed_events.values_list('parent_uuid', flat=True)).update(failed=True)
-
-    def _update_hosts(self, extra_host_pks=None):
-        # Update job event hosts m2m from host_name, propagate to parent events.
-        extra_host_pks = set(extra_host_pks or [])
+        parents = JobEvent.objects.filter(job_id=self.job_id, event__startswith='runner_on')
+        parents = parents.exclude(parent_uuid='').values('parent_uuid').annotate(
+            changed_count=Sum(Case(When(changed=True, then=Value(1)), default=Value(0), output_field=models.IntegerField())),
+            failed_count=Sum(Case(When(failed=True, then=Value(1)), default=Value(0), output_field=models.IntegerField())),
+        )
+        changed_uuids, failed_uuids = [], []
+        for parent in parents:
+            if parent['changed_count']:
+                changed_uuids.append(parent['parent_uuid'])
+            if parent['failed_count']:
+                failed_uuids.append(parent['parent_uuid'])
+        parent_events = JobEvent.objects.filter(job_id=self.job_id)
+        if changed_uuids:
+            parent_events.filter(uuid__in=changed_uuids, changed=False).update(changed=True)
+        if failed_uuids:
+            parent_events.filter(uuid__in=failed_uuids, failed=False).update(failed=True)
+
+    def _event_hostnames(self):
+        # Names of the hosts this event is about.
         hostnames = set()
         if self.host_name:
             hostnames.add(self.host_name)
@@ -1176,51 +1198,154 @@ class JobEvent(CreatedModifiedModel):
                     hostnames.update(v.keys())
             except AttributeError: # In case event_data or v isn't a dict.
                 pass
-        qs = self.job.inventory.hosts.all()
-        qs = qs.filter(Q(name__in=hostnames) | Q(pk__in=extra_host_pks))
-        qs = qs.exclude(job_events__pk=self.id).only('id')
-        for host in qs:
-            self.hosts.add(host)
-        if self.parent_uuid:
-            parent = JobEvent.objects.filter(uuid=self.parent_uuid)
-            if parent.exists():
-                parent = parent[0]
-                parent._update_hosts(qs.values_list('id', flat=True))
+        return hostnames
+
+    @classmethod
+    def _get_host_ids(self, job, hostnames):
+        # Map hostnames to the ids of the job's inventory hosts (None when not
+        # in the inventory). The hosts of smart inventories are only selected
+        # through inventory.hosts.
+        found = {}
+        if job.inventory_id and hostnames:
+            found = dict(job.inventory.hosts.filter(name__in=hostnames).values_list('name', 'id'))
+        return dict((name, found.get(name)) for name in hostnames)
+
+    @classmethod
+    def _update_hosts(self, job_events, host_ids=None):
+        '''
+        Update the hosts m2m of saved job events from their host names and
+        propagate the hosts to their parent events.
+
+        host_ids maps job ids to {hostname: host id} and is looked up here
+        when not given. Ancestors are fetched one generation at a time for the
+        whole batch and the missing m2m rows are inserted in bulk.
+        '''
+        by_job = {}
+        for job_event in job_events:
+            by_job.setdefault(job_event.job_id, []).append(job_event)
+        host_ids = host_ids or {}
+        links = set()
+        for job_id, events in by_job.items():
+            if job_id not in host_ids:
+                hostnames = set()
+                for job_event in events:
+                    hostnames.update(job_event._event_hostnames())
+                host_ids[job_id] = self._get_host_ids(events[0].job, hostnames)
+            job_host_ids = host_ids[job_id]
+            parent_hosts = {}
+            for job_event in events:
+                pks = set(job_host_ids[name] for name in job_event._event_hostnames() if job_host_ids.get(name))
+                links.update((job_event.pk, pk) for pk in pks)
+                if job_event.parent_uuid and pks:
+                    parent_hosts.setdefault(job_event.parent_uuid, set()).update(pks)
+            seen = set()
+            while parent_hosts:
+                seen.update(parent_hosts)
+                grandparent_hosts = {}
+                parents = JobEvent.objects.filter(job_id=job_id, uuid__in=parent_hosts.keys())
+                for pk, uuid, parent_uuid in parents.values_list('pk', 'uuid', 'parent_uuid'):
+                    links.update((pk, host_pk) for host_pk in parent_hosts[uuid])
+                    if parent_uuid and parent_uuid not in seen:
+                        grandparent_hosts.setdefault(parent_uuid, set()).update(parent_hosts[uuid])
+                parent_hosts = grandparent_hosts
+        if not links:
+            return
+
+        through = JobEvent.hosts.through
+        existing = through.objects.filter(jobevent_id__in=set(link[0] for link in links),
+                                          host_id__in=set(link[1] for link in links))
+        links -= set(existing.values_list('jobevent_id', 'host_id'))
+        rows = [through(jobevent_id=event_pk, host_id=host_pk) for event_pk, host_pk in links]
+        try:
+            with transaction.atomic():
+                through.objects.bulk_create(rows, batch_size=self.BULK_UPDATE_BATCH_SIZE)
+        except IntegrityError:
+            # Other workers link the hosts of sibling events to the same
+            # parents, skip the rows they inserted in the meantime.
+            for row in rows:
+                try:
+                    with transaction.atomic():
+                        row.save(force_insert=True)
+                except IntegrityError:
+                    pass
 
     def _hostnames(self):
         hostnames = set()
         try:
-            for stat in ('changed', 'dark', 'failures', 'ok', 'processed', 'skipped'):
+            for stat in self.HOST_SUMMARY_STATS:
                 hostnames.update(self.event_data.get(stat, {}).keys())
         except AttributeError:  # In case event_data or v isn't a dict.
             pass
         return hostnames
 
     def _update_host_summary_from_stats(self, hostnames):
-        with ignore_inventory_computed_fields():
-            qs = self.job.inventory.hosts.filter(name__in=hostnames)
-            job = self.job
-            for host in hostnames:
-                host_stats = {}
-                for stat in ('changed', 'dark', 'failures', 'ok', 'processed', 'skipped'):
-                    try:
-                        host_stats[stat] = self.event_data.get(stat, {}).get(host, 0)
-                    except AttributeError:  # in case event_data[stat] isn't a dict.
-                        pass
-                if qs.filter(name=host).exists():
-                    host_actual = qs.get(name=host)
-                    host_summary, created = job.job_host_summaries.get_or_create(host=host_actual, host_name=host_actual.name, defaults=host_stats)
-                else:
-                    host_summary, created = job.job_host_summaries.get_or_create(host_name=host, defaults=host_stats)
+        from awx.main.models.inventory import Host
 
-                if not created:
-                    update_fields = []
-                    for stat, value in host_stats.items():
-                        if getattr(host_summary, stat) != value:
-                            setattr(host_summary, stat, value)
-                            update_fields.append(stat)
-                    if update_fields:
-                        host_summary.save(update_fields=update_fields)
+        job = self.job
+        host_ids = {}
+        if job.inventory_id:
+            host_ids = dict(job.inventory.hosts.filter(name__in=hostnames).values_list('name', 'id'))
+        summaries = dict((summary.host_name, summary)
+                         for summary in job.job_host_summaries.filter(host_name__in=hostnames))
+        created = []
+        updated = []
+        for host in hostnames:
+            host_stats = {}
+            for stat in self.HOST_SUMMARY_STATS:
+                try:
+                    host_stats[stat] = self.event_data.get(stat, {}).get(host, 0)
+                except AttributeError:  # in case event_data[stat] isn't a dict.
+                    pass
+            summary = summaries.get(host)
+            if summary is None:
+                summary = JobHostSummary(job=job, host_id=host_ids.get(host), host_name=host, **host_stats)
+                created.append(summary)
+            elif any(getattr(summary, stat) != value for stat, value in host_stats.items()):
+                for stat, value in host_stats.items():
+                    setattr(summary, stat, value)
+                updated.append(summary)
+            # Done by JobHostSummary.save() otherwise
+            summary.failed = bool(summary.dark or summary.failures)
+
+        timestamp = now()
+        for summary, pk in zip(created, allocate_ids(JobHostSummary, len(created))):
+            summary.pk = pk
+            summary.created = summary.modified = timestamp
+        JobHostSummary.objects.bulk_create(created, batch_size=self.BULK_UPDATE_BATCH_SIZE)
+
+        for i in range(0, len(updated), self.BULK_UPDATE_BATCH_SIZE):
+            batch = updated[i:i + self.BULK_UPDATE_BATCH_SIZE]
+            values = {}
+            for field, output_field in [(stat, models.IntegerField()) for stat in self.HOST_SUMMARY_STATS] + [('failed', models.BooleanField())]:
+                values[field] = Case(*[When(pk=summary.pk, then=Value(getattr(summary, field))) for summary in batch],
+                                     output_field=output_field)
+            JobHostSummary.objects.filter(pk__in=[summary.pk for summary in batch]).update(modified=timestamp, **values)
+
+        # Point the hosts at this job, done by JobHostSummary.save() otherwise
+        summaries = [summary for summary in created + updated if summary.host_id]
+        for i in range(0, len(summaries), self.BULK_UPDATE_BATCH_SIZE):
+            batch = summaries[i:i + self.BULK_UPDATE_BATCH_SIZE]
+            Host.objects.filter(pk__in=[summary.host_id for summary in batch]).update(
+                last_job_id=job.id,
+                last_job_host_summary_id=Case(*[When(pk=summary.host_id, then=Value(summary.pk)) for summary in batch],
+                                              output_field=models.IntegerField()),
+            )
+
+    def update_from_stats(self):
+        '''
+        Apply a playbook_on_stats event to its job: flag the parents of failed
+        and changed runner events, write the job host summaries and update
+        the inventory computed fields. This runs outside of the callback
+        receiver, see awx.main.tasks.finalize_job_stats.
+        '''
+        self._update_parents_failed_and_changed()
+
+        hostnames = self._hostnames()
+        self._update_host_summary_from_stats(hostnames)
+        if self.job.inventory_id:
+            self.job.inventory.update_computed_fields()
+
+        emit_channel_notification('jobs-summary', dict(group_name='jobs', unified_job_id=self.job.id))
 
     def save(self, *args, **kwargs):
         # If update_fields has been specified, add our field names to it,
@@ -1247,22 +1372,25 @@ class JobEvent(CreatedModifiedModel):
         # Update related objects after this event is saved.
         if not from_parent_update:
             if getattr(settings, 'CAPTURE_JOB_EVENT_HOSTS', False):
-                self._update_hosts()
+                JobEvent._update_hosts([self])
             if self.event == 'playbook_on_stats':
-                self._update_parents_failed_and_changed()
-
-                hostnames = self._hostnames()
-                self._update_host_summary_from_stats(hostnames)
-                self.job.inventory.update_computed_fields()
-
-                emit_channel_notification('jobs-summary', dict(group_name='jobs', unified_job_id=self.job.id))
+                JobEvent.finalize_stats([self.pk])
 
     @classmethod
-    def create_from_data(self, **kwargs):
-        # Must have a job_id specified.
-        if not kwargs.get('job_id', None):
-            return
+    def finalize_stats(self, job_event_ids):
+        '''
+        Queue the playbook_on_stats events with the given ids for
+        update_from_stats() once the current transaction commits.
+        '''
+        from awx.main.tasks import finalize_job_stats
+        connection.on_commit(lambda: finalize_job_stats.delay(job_event_ids))
 
+    @classmethod
+    def _from_data(self, **kwargs):
+        '''
+        Build an unsaved job event from a callback payload, returns the event
+        and the artifact data it carries for its job (if any).
+        '''
         # Convert the datetime for the job event's creation appropriately,
         # and include a time zone for it.
         #
@@ -1288,35 +1416,138 @@ class JobEvent(CreatedModifiedModel):
         artifact_dict = None
         if event_data:
             artifact_dict = event_data.pop('artifact_data', None)
+        return JobEvent(**kwargs), artifact_dict
 
-        job_event = JobEvent.objects.create(**kwargs)
+    @classmethod
+    def _update_job_artifacts(self, job_id, artifact_dict):
+        # Save artifact data to parent job (if provided).
+        if artifact_dict:
+            # Note: Core has not added support for marking artifacts as
+            # sensitive yet. Going forward, core will not use
+            # _ansible_no_log to denote sensitive set_stats calls.
+            # Instead, they plan to add a flag outside of the traditional
+            # no_log mechanism. no_log will not work for this feature,
+            # in core, because sensitive data is scrubbed before sending
+            # data to the callback. The playbook_on_stats is the callback
+            # in which the set_stats data is used.
+
+            # Again, the sensitive artifact feature has not yet landed in
+            # core. The below is how we mark artifacts payload as
+            # senstive
+            # artifact_dict['_ansible_no_log'] = True
+            #
+            parent_job = Job.objects.filter(pk=job_id).first()
+            if parent_job and parent_job.artifacts != artifact_dict:
+                parent_job.artifacts = artifact_dict
+                parent_job.save(update_fields=['artifacts'])
+
+    @classmethod
+    def create_from_data(self, **kwargs):
+        # Must have a job_id specified.
+        if not kwargs.get('job_id', None):
+            return
+
+        job_event, artifact_dict = self._from_data(**kwargs)
+        job_event.save(force_insert=True)
 
         analytics_logger.info('Job event data saved.', extra=dict(python_objects=dict(job_event=job_event)))
 
-        # Save artifact data to parent job (if provided).
-        if artifact_dict:
-            if event_data and isinstance(event_data, dict):
-                # Note: Core has not added support for marking artifacts as
-                # sensitive yet. Going forward, core will not use
-                # _ansible_no_log to denote sensitive set_stats calls.
-                # Instead, they plan to add a flag outside of the traditional
-                # no_log mechanism. no_log will not work for this feature,
-                # in core, because sensitive data is scrubbed before sending
-                # data to the callback. The playbook_on_stats is the callback
-                # in which the set_stats data is used.
-
-                # Again, the sensitive artifact feature has not yet landed in
-                # core. The below is how we mark artifacts payload as
-                # senstive
-                # artifact_dict['_ansible_no_log'] = True
-                #
-                parent_job = Job.objects.filter(pk=kwargs['job_id']).first()
-                if parent_job and parent_job.artifacts != artifact_dict:
-                    parent_job.artifacts = artifact_dict
-                    parent_job.save(update_fields=['artifacts'])
+        self._update_job_artifacts(job_event.job_id, artifact_dict)
 
         return job_event
 
+    @classmethod
+    def bulk_create_from_data(self, payloads, host_cache=None):
+        '''
+        Create the job events of many callback payloads with a single INSERT.
+
+        The jobs and hosts of the whole batch are looked up at once, and
+        artifacts are saved once per job. If the INSERT fails the events
+        are inserted one by one, so that a bad event doesn't take down the
+        rest of the batch. Returns the created events.
+
+        host_cache is an optional object whose get_host_ids(job, hostnames)
+        replaces the lookup of host ids by name, see HostIdCache in the
+        run_callback_receiver command.
+        '''
+        job_events = []
+        artifacts = {}
+        for kwargs in payloads:
+            if not kwargs.get('job_id', None):
+                continue
+            job_event, artifact_dict = self._from_data(**kwargs)
+            job_events.append(job_event)
+            if artifact_dict:
+                artifacts[job_event.job_id] = artifact_dict
+
+        # Events of jobs that no longer exist would violate the foreign key
+        jobs = Job.objects.select_related('inventory').in_bulk(set(event.job_id for event in job_events))
+        job_events = [event for event in job_events if event.job_id in jobs]
+        if not job_events:
+            return []
+
+        capture_hosts = getattr(settings, 'CAPTURE_JOB_EVENT_HOSTS', False)
+        hostnames = dict((job_id, set()) for job_id in jobs)
+        for job_event in job_events:
+            job_event.job = jobs[job_event.job_id]
+            job_event._update_from_event_data()
+            if capture_hosts:
+                hostnames[job_event.job_id].update(job_event._event_hostnames())
+            elif job_event.host_name:
+                hostnames[job_event.job_id].add(job_event.host_name)
+        get_host_ids = host_cache.get_host_ids if host_cache is not None else self._get_host_ids
+        host_ids = dict((job_id, get_host_ids(jobs[job_id], names)) for job_id, names in hostnames.items())
+
+        # Done by CreatedModifiedModel.save() otherwise
+        created = now()
+        for job_event, pk in zip(job_events, allocate_ids(JobEvent, len(job_events))):
+            job_event.pk = pk
+            job_event.host_id = host_ids[job_event.job_id].get(job_event.host_name)
+            job_event.created = job_event.created or created
+            job_event.modified = created
+
+        try:
+            with transaction.atomic():
+                JobEvent.objects.bulk_create(job_events)
+        except DatabaseError as e:
+            logger.error('Database Error Saving Job Events, saving them one by one: {}'.format(e))
+            if host_cache is not None:
+                # Cached hosts may have been deleted since, e.g. by an inventory sync
+                for job_id in jobs:
+                    host_cache.evict_job(job_id)
+                host_ids = dict((job_id, self._get_host_ids(jobs[job_id], names)) for job_id, names in hostnames.items())
+                for job_event in job_events:
+                    job_event.host_id = host_ids[job_event.job_id].get(job_event.host_name)
+            saved = []
+            for job_event in job_events:
+                try:
+                    with transaction.atomic():
+                        JobEvent.objects.bulk_create([job_event])
+                    saved.append(job_event)
+                except DatabaseError as e:
+                    logger.error('Database Error Saving Job Event: {}'.format(e))
+            job_events = saved
+
+        # bulk_create() doesn't send post_save, which streams the events to
+        # the websocket listeners.
+        stats_event_ids = []
+        for job_event in job_events:
+            post_save.send(sender=JobEvent, instance=job_event, created=True, update_fields=None,
+                           raw=False, using=JobEvent.objects.db)
+            analytics_logger.info('Job event data saved.', extra=dict(python_objects=dict(job_event=job_event)))
+            if job_event.event == 'playbook_on_stats':
+                stats_event_ids.append(job_event.pk)
+        if capture_hosts and job_events:
+            JobEvent._update_hosts(job_events, host_ids)
+        if stats_event_ids:
+            JobEvent.finalize_stats(stats_event_ids)
+
+        for job_id, artifact_dict in artifacts.items():
+            if job_id in jobs:
+                self._update_job_artifacts(job_id, artifact_dict)
+
+        return job_events
+
     @classmethod
     def get_startevent_queryset(cls, parent_task, starting_events, ordering=None):
         '''
@@ -36,6 +36,7 @@ from awx.main.utils import (
     copy_model_by_class, copy_m2m_relationships,
     get_type_for_model
 )
+from awx.main.utils.stdout import open_stdout_file, stdout_file_size, read_stdout_lines, remove_stdout_file
 from awx.main.redact import UriCleaner, REPLACE_STR
 from awx.main.consumers import emit_channel_notification
 from awx.main.fields import JSONField
@@ -442,6 +443,9 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
 
     class Meta:
         app_label = 'main'
+        index_together = [
+            ('modified', 'status'),
+        ]
 
     old_pk = models.PositiveIntegerField(
         null=True,
@@ -728,10 +732,7 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
 
     def delete(self):
         if self.result_stdout_file != "":
-            try:
-                os.remove(self.result_stdout_file)
-            except Exception:
-                pass
+            remove_stdout_file(self.result_stdout_file)
         super(UnifiedJob, self).delete()
 
     def copy_unified_job(self):
@@ -774,8 +775,7 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
             # file does not exist), reload info from the database and
             # try again.
             try:
-                return codecs.open(self.result_stdout_file, "r",
-                                   encoding='utf-8')
+                return codecs.getreader('utf-8')(open_stdout_file(self.result_stdout_file))
             except IOError:
                 if attempt < 3:
                     self.result_stdout_text = type(self).objects.get(id=self.id).result_stdout_text
@@ -809,27 +809,34 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
     @property
     def result_stdout_size(self):
         try:
-            return os.stat(self.result_stdout_file).st_size
+            return stdout_file_size(self.result_stdout_file)
         except:
             return len(self.result_stdout)
 
     def _result_stdout_raw_limited(self, start_line=0, end_line=None, redact_sensitive=True, escape_ascii=False):
-        return_buffer = u""
+        start_line = int(start_line)
         if end_line is not None:
             end_line = int(end_line)
-        stdout_lines = self.result_stdout_raw_handle().readlines()
-        absolute_end = len(stdout_lines)
-        for line in stdout_lines[int(start_line):end_line]:
-            return_buffer += line
-        if int(start_line) < 0:
-            start_actual = len(stdout_lines) + int(start_line)
-            end_actual = len(stdout_lines)
+        limited = None
+        if not self.result_stdout_text and self.result_stdout_file:
+            # Seek straight to the lines asked for with the line-offset
+            # index written along with the stdout file.
+            limited = read_stdout_lines(self.result_stdout_file, start_line, end_line)
+        if limited is not None and limited[3]:
+            return_buffer, start_actual, end_actual, absolute_end = limited
         else:
-            start_actual = int(start_line)
-            if end_line is not None:
-                end_actual = min(int(end_line), len(stdout_lines))
+            stdout_lines = self.result_stdout_raw_handle().readlines()
+            absolute_end = len(stdout_lines)
+            return_buffer = u"".join(stdout_lines[start_line:end_line])
+            if start_line < 0:
+                start_actual = max(absolute_end + start_line, 0)
+                end_actual = absolute_end
             else:
-                end_actual = len(stdout_lines)
+                start_actual = start_line
+                if end_line is not None:
+                    end_actual = min(end_line, absolute_end)
+                else:
+                    end_actual = absolute_end
 
         if redact_sensitive:
             return_buffer = UriCleaner.remove_sensitive(return_buffer)
@@ -903,6 +910,27 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
     def task_impact(self):
         raise NotImplementedError # Implement in subclass.
 
+    @classmethod
+    def _prefetch_task_impact(cls, unified_jobs):
+        '''
+        Load whatever task_impact needs for the given jobs of this class in
+        bulk. Override in subclasses whose impact depends on the database.
+        '''
+        pass
+
+    @staticmethod
+    def prefetch_task_impact(unified_jobs):
+        '''
+        Memoize task_impact inputs (such as host counts) on a list of
+        unified jobs of mixed types, so that capacity calculations don't
+        issue a query per job.
+        '''
+        jobs_by_class = {}
+        for unified_job in unified_jobs:
+            jobs_by_class.setdefault(type(unified_job), []).append(unified_job)
+        for cls, jobs in jobs_by_class.items():
+            cls._prefetch_task_impact(jobs)
+
     def websocket_emit_data(self):
         ''' Return extra data that should be included when submitting data to the browser over the websocket connection '''
         websocket_data = dict()
@@ -1028,7 +1056,7 @@ class UnifiedJob(PolymorphicModel, PasswordFieldsModel, CommonModelNameNotUnique
         self.websocket_emit_status("pending")
 
         from awx.main.scheduler.tasks import run_job_launch
-        connection.on_commit(lambda: run_job_launch.delay(self.id))
+        connection.on_commit(lambda: run_job_launch.trigger(self.id))
 
         # Each type of unified job has a different Task class; get the
         # appropirate one.
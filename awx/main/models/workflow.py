@@ -227,12 +227,14 @@ class WorkflowJobNode(WorkflowNodeBase):
     def get_absolute_url(self, request=None):
         return reverse('api:workflow_job_node_detail', kwargs={'pk': self.pk}, request=request)
 
-    def get_job_kwargs(self):
+    def get_job_kwargs(self, parent_nodes=None):
         '''
         In advance of creating a new unified job as part of a workflow,
         this method builds the attributes to use
         It alters the node by saving its updated version of
         ancestor_artifacts, making it available to subsequent nodes.
+        parent_nodes may be passed in by callers that already have them
+        loaded, e.g. from the workflow graph.
         '''
         # reject/accept prompted fields
         data = {}
@@ -244,7 +246,9 @@ class WorkflowJobNode(WorkflowNodeBase):
             data.update(accepted_fields)  # missing fields are handled in the scheduler
         # build ancestor artifacts, save them to node model for later
         aa_dict = {}
-        for parent_node in self.get_parent_nodes():
+        if parent_nodes is None:
+            parent_nodes = self.get_parent_nodes()
+        for parent_node in parent_nodes:
             aa_dict.update(parent_node.ancestor_artifacts)
             if parent_node.job and hasattr(parent_node.job, 'artifacts'):
                 aa_dict.update(parent_node.job.artifacts)
@@ -2,8 +2,10 @@
 # All Rights Reserved.
 
 # Python
+import json
 import logging
 import os
+import threading
 
 # Django
 from django.conf import settings
@@ -15,17 +17,56 @@ __all__ = ['CallbackQueueDispatcher']
 
 
 class CallbackQueueDispatcher(object):
+    '''
+    Publishes job events to the callback receiver queue.
+
+    Events are sent in batches: a JSON list of events per message, published
+    once CALLBACK_QUEUE_BATCH_SIZE events or CALLBACK_QUEUE_BATCH_BYTES of
+    JSON are buffered, or CALLBACK_QUEUE_BATCH_LATENCY seconds after the first
+    event of the batch was buffered, whichever comes first.  Call flush() once
+    the last event has been dispatched.
+    '''
 
     def __init__(self):
         self.callback_connection = getattr(settings, 'BROKER_URL', None)
         self.connection_queue = getattr(settings, 'CALLBACK_QUEUE', '')
         self.connection = None
         self.exchange = None
+        self.producer = None
+        self.batch = []
+        self.batch_bytes = 0
+        self.timer = None
+        self.lock = threading.RLock()
         self.logger = logging.getLogger('awx.main.queue.CallbackQueueDispatcher')
 
     def dispatch(self, obj):
         if not self.callback_connection or not self.connection_queue:
             return
+        data = json.dumps(obj)
+        with self.lock:
+            self.batch.append(data)
+            self.batch_bytes += len(data)
+            if (len(self.batch) >= settings.CALLBACK_QUEUE_BATCH_SIZE or
+                    self.batch_bytes >= settings.CALLBACK_QUEUE_BATCH_BYTES):
+                self.flush()
+            elif self.timer is None:
+                self.timer = threading.Timer(settings.CALLBACK_QUEUE_BATCH_LATENCY, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self):
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.batch:
+                return
+            body = '[{}]'.format(','.join(self.batch))
+            self.batch = []
+            self.batch_bytes = 0
+            self.publish(body)
+
+    def publish(self, body):
         active_pid = os.getpid()
         for retry_count in xrange(4):
             try:
@@ -33,19 +74,24 @@ class CallbackQueueDispatcher(object):
                     self.connection_pid = active_pid
                 if self.connection_pid != active_pid:
                     self.connection = None
+                    self.connection_pid = active_pid
                 if self.connection is None:
                     self.connection = Connection(self.callback_connection)
                     self.exchange = Exchange(self.connection_queue, type='direct')
+                    self.producer = None
+                if self.producer is None:
+                    self.producer = Producer(self.connection)
 
-                producer = Producer(self.connection)
-                producer.publish(obj,
-                                 serializer='json',
-                                 compression='bzip2',
-                                 exchange=self.exchange,
-                                 declare=[self.exchange],
-                                 delivery_mode="persistent" if settings.PERSISTENT_CALLBACK_MESSAGES else "transient",
-                                 routing_key=self.connection_queue)
+                self.producer.publish(body,
+                                      content_type='application/json',
+                                      content_encoding='utf-8',
+                                      compression=settings.CALLBACK_QUEUE_COMPRESSION,
+                                      exchange=self.exchange,
+                                      declare=[self.exchange],
+                                      delivery_mode="persistent" if settings.PERSISTENT_CALLBACK_MESSAGES else "transient",
+                                      routing_key=self.connection_queue)
                 return
             except Exception, e:
                 self.logger.info('Publish Job Event Exception: %r, retry=%d', e,
                                  retry_count, exc_info=True)
+                self.producer = None
@@ -3,54 +3,144 @@ import urlparse
 
 REPLACE_STR = '$encrypted$'
 
+# https://regex101.com/r/sV2dO2/2
+# Case insensitivity is spelled out rather than set with (?i), so that the
+# pattern can be part of one that has case sensitive parts; the repetitions
+# consume a character (or a parenthesized part) at a time, as repeating a
+# repetition backtracks exponentially on text that doesn't end a URI.
+SENSITIVE_URI_RE = (
+    ur'\b((?:[hH][tT][tT][pP][sS]?://|[wW][wW][wW]\d{0,3}[.]|[a-zA-Z0-9.\-]+[.][a-zA-Z]{2,4}/)'
+    ur'(?:[^\s()<>]|\((?:[^\s()<>]|\([^\s()<>]+\))*\))+'
+    ur'(?:\((?:[^\s()<>]|\([^\s()<>]+\))*\)|[^\s`!()\[\]{};:\'".,<>?\xab\xbb\u201c\u201d\u2018\u2019]))'
+)
+
+# How much of the end of a chunk Redactor.redact_stream holds back at most,
+# for a match that may go on in the next chunk.
+MAX_STREAM_MATCH_LENGTH = 65536
+
+
+def _redact_uri(uri_str):
+    try:
+        o = urlparse.urlsplit(uri_str)
+    except ValueError:
+        # e.g. an unbalanced [ in what looks like an IPv6 host
+        return uri_str
+    if not o.username and not o.password:
+        if o.netloc and ":" in o.netloc:
+            # Handle the special case url http://username:password that can appear in SCM url
+            # on account of a bug? in ansible redaction
+            (username, password) = o.netloc.split(':', 1)
+        else:
+            return uri_str
+    else:
+        username = o.username
+        password = o.password
+
+    # Replace the first occurance of username and the first and second
+    # occurance of password
+    if username:
+        uri_str = uri_str.replace(username, REPLACE_STR, 1)
+    # 2, just in case the password is $encrypted$
+    if password:
+        uri_str = uri_str.replace(password, REPLACE_STR, 2)
+    return uri_str
+
+
+class Redactor(object):
+    '''
+    Replaces secrets, given as (secret, replacement) pairs, and the
+    credentials in URIs if redact_uris, in a single pass over the text: all
+    of them make up one compiled pattern, and the redacted text is joined
+    from its pieces once.
+    '''
+
+    def __init__(self, replacements=(), redact_uris=False):
+        self.replacements = {}
+        for secret, replacement in replacements:
+            # Like replacing them one after the other, the first wins.
+            if secret and secret not in self.replacements:
+                self.replacements[secret] = replacement
+        self.redact_uris = redact_uris
+        # At any position, the longest secret that matches is replaced.
+        secrets = sorted(self.replacements, key=len, reverse=True)
+        self.max_secret_length = len(secrets[0]) if secrets else 0
+        self.secrets_pattern = None
+        if secrets:
+            self.secrets_pattern = re.compile('|'.join(re.escape(s) for s in secrets))
+        branches = [re.escape(s) for s in secrets]
+        if redact_uris:
+            branches.append(u'(?P<uri>' + SENSITIVE_URI_RE + u')')
+        self.pattern = re.compile('|'.join(branches)) if branches else None
+
+    def _replace_secret(self, match):
+        return self.replacements[match.group(0)]
+
+    def _replace(self, match):
+        if self.redact_uris:
+            uri_str = match.group('uri')
+            if uri_str is not None:
+                if self.secrets_pattern is not None:
+                    uri_str = self.secrets_pattern.sub(self._replace_secret, uri_str)
+                return _redact_uri(uri_str)
+        return self.replacements[match.group(0)]
+
+    def _redact(self, text, final=True):
+        '''
+        Redact text, return the redacted text and, unless final, the end of
+        text that a match might go on from, left for the next call.
+        '''
+        cut = len(text)
+        if not final:
+            if self.max_secret_length:
+                cut = len(text) - self.max_secret_length + 1
+            if self.redact_uris:
+                # A URI doesn't go on past whitespace.
+                cut = min(cut, max(text.rfind(c) for c in ' \t\n\r\f\v') + 1)
+            cut = max(cut, len(text) - MAX_STREAM_MATCH_LENGTH, 0)
+        redacted = []
+        pos = 0
+        for match in self.pattern.finditer(text):
+            if not final and match.start() >= cut:
+                break
+            redacted.append(text[pos:match.start()])
+            redacted.append(self._replace(match))
+            pos = match.end()
+        end = len(text) if final else max(pos, cut)
+        redacted.append(text[pos:end])
+        return ''.join(redacted), text[end:]
+
+    def redact(self, text):
+        if self.pattern is None or not text:
+            return text
+        return self._redact(text)[0]
+
+    def redact_stream(self, chunks):
+        '''
+        Redact a stream of text chunks; matches may span chunks.
+        '''
+        if self.pattern is None:
+            for chunk in chunks:
+                yield chunk
+            return
+        tail = ''
+        for chunk in chunks:
+            redacted, tail = self._redact(tail + chunk, final=False)
+            if redacted:
+                yield redacted
+        if tail:
+            yield self._redact(tail)[0]
+
+
+uri_redactor = Redactor(redact_uris=True)
+
 
 class UriCleaner(object):
     REPLACE_STR = REPLACE_STR
-    # https://regex101.com/r/sV2dO2/2
-    SENSITIVE_URI_PATTERN = re.compile(ur'(?i)\b((?:https?://|www\d{0,3}[.]|[a-z0-9.\-]+[.][a-z]{2,4}/)(?:[^\s()<>]+|\(([^\s()<>]+|(\([^\s()<>]+\)))*\))+(?:\(([^\s()<>]+|(\([^\s()<>]+\)))*\)|[^\s`!()\[\]{};:\'".,<>?\xab\xbb\u201c\u201d\u2018\u2019]))', re.MULTILINE)
+    SENSITIVE_URI_PATTERN = re.compile(SENSITIVE_URI_RE, re.MULTILINE)
 
     @staticmethod
     def remove_sensitive(cleartext):
-        redactedtext = cleartext
-        text_index = 0
-        while True:
-            match = UriCleaner.SENSITIVE_URI_PATTERN.search(redactedtext, text_index)
-            if not match:
-                break
-            o = urlparse.urlsplit(match.group(1))
-            if not o.username and not o.password:
-                if o.netloc and ":" in o.netloc:
-                    # Handle the special case url http://username:password that can appear in SCM url
-                    # on account of a bug? in ansible redaction
-                    (username, password) = o.netloc.split(':')
-                else:
-                    text_index += len(match.group(1))
-                    continue
-            else:
-                username = o.username
-                password = o.password
-
-            # Given a python MatchObject, with respect to redactedtext, find and
-            # replace the first occurance of username and the first and second
-            # occurance of password
-
-            uri_str = redactedtext[match.start():match.end()]
-            if username:
-                uri_str = uri_str.replace(username, UriCleaner.REPLACE_STR, 1)
-            # 2, just in case the password is $encrypted$
-            if password:
-                uri_str = uri_str.replace(password, UriCleaner.REPLACE_STR, 2)
-
-            t = redactedtext[:match.start()] + uri_str
-            text_index = len(t)
-            if (match.end() < len(redactedtext)):
-                t += redactedtext[match.end():]
-
-            redactedtext = t
-            if text_index >= len(redactedtext):
-                text_index = len(redactedtext) - 1
-
-        return redactedtext
+        return uri_redactor.redact(cleartext)
 
 
 class PlainTextCleaner(object):
@@ -14,12 +14,15 @@ class SimpleDAG(object):
     def __init__(self):
         self.nodes = []
         self.edges = []
+        # node object -> index in self.nodes. Model instances hash and
+        # compare by (model, pk), so this is keyed by id.
+        self.node_obj_to_node_index = {}
+        # label -> {node index: [node indexes]}, in both directions
+        self.node_from_edges_by_label = {}
+        self.node_to_edges_by_label = {}
 
     def __contains__(self, obj):
-        for node in self.nodes:
-            if node['node_object'] == obj:
-                return True
-        return False
+        return obj in self.node_obj_to_node_index
 
     def __len__(self):
         return len(self.nodes)
@@ -65,7 +68,8 @@ class SimpleDAG(object):
         gv_file.close()
 
     def add_node(self, obj, metadata=None):
-        if self.find_ord(obj) is None:
+        if obj not in self.node_obj_to_node_index:
+            self.node_obj_to_node_index[obj] = len(self.nodes)
             self.nodes.append(dict(node_object=obj, metadata=metadata))
 
     def add_edge(self, from_obj, to_obj, label=None):
@@ -74,51 +78,42 @@ class SimpleDAG(object):
         if from_obj_ord is None or to_obj_ord is None:
             raise LookupError("Object not found")
         self.edges.append((from_obj_ord, to_obj_ord, label))
+        self.node_from_edges_by_label.setdefault(label, {}).setdefault(from_obj_ord, []).append(to_obj_ord)
+        self.node_to_edges_by_label.setdefault(label, {}).setdefault(to_obj_ord, []).append(from_obj_ord)
 
     def add_edges(self, edgelist):
         for edge_pair in edgelist:
             self.add_edge(edge_pair[0], edge_pair[1], edge_pair[2])
 
     def find_ord(self, obj):
-        for idx in range(len(self.nodes)):
-            if obj == self.nodes[idx]['node_object']:
-                return idx
-        return None
+        return self.node_obj_to_node_index.get(obj, None)
 
-    def get_dependencies(self, obj, label=None):
-        antecedents = []
+    def _get_adjacent(self, edges_by_label, obj, label=None):
         this_ord = self.find_ord(obj)
-        for node, dep, lbl in self.edges:
-            if label:
-                if node == this_ord and lbl == label:
-                    antecedents.append(self.nodes[dep])
-            else:
-                if node == this_ord:
-                    antecedents.append(self.nodes[dep])
-        return antecedents
+        if label:
+            labels = [label]
+        else:
+            labels = edges_by_label.keys()
+        adjacent = []
+        for lbl in labels:
+            for idx in edges_by_label.get(lbl, {}).get(this_ord, []):
+                adjacent.append(self.nodes[idx])
+        return adjacent
+
+    def get_dependencies(self, obj, label=None):
+        return self._get_adjacent(self.node_from_edges_by_label, obj, label)
 
     def get_dependents(self, obj, label=None):
-        decendents = []
-        this_ord = self.find_ord(obj)
-        for node, dep, lbl in self.edges:
-            if label:
-                if dep == this_ord and lbl == label:
-                    decendents.append(self.nodes[node])
-            else:
-                if dep == this_ord:
-                    decendents.append(self.nodes[node])
-        return decendents
+        return self._get_adjacent(self.node_to_edges_by_label, obj, label)
+
+    def _get_unconnected_nodes(self, edges_by_label):
+        connected = set()
+        for edges in edges_by_label.values():
+            connected.update(edges.keys())
+        return [n for idx, n in enumerate(self.nodes) if idx not in connected]
 
     def get_leaf_nodes(self):
-        leafs = []
-        for n in self.nodes:
-            if len(self.get_dependencies(n['node_object'])) < 1:
-                leafs.append(n)
-        return leafs
+        return self._get_unconnected_nodes(self.node_from_edges_by_label)
 
     def get_root_nodes(self):
-        roots = []
-        for n in self.nodes:
-            if len(self.get_dependents(n['node_object'])) < 1:
-                roots.append(n)
-        return roots
+        return self._get_unconnected_nodes(self.node_to_edges_by_label)
@@ -1,9 +1,12 @@
 
 # AWX
+from awx.main.models import UnifiedJob, UnifiedJobTemplate, WorkflowJobNode
 from awx.main.scheduler.dag_simple import SimpleDAG
 
 
 class WorkflowDAG(SimpleDAG):
+    EDGE_TYPES = ['success_nodes', 'failure_nodes', 'always_nodes']
+
     def __init__(self, workflow_job=None):
         super(WorkflowDAG, self).__init__()
         if workflow_job:
@@ -11,19 +14,75 @@ class WorkflowDAG(SimpleDAG):
 
     def _init_graph(self, workflow_job):
         node_qs = workflow_job.workflow_job_nodes
-        workflow_nodes = node_qs.prefetch_related('success_nodes', 'failure_nodes', 'always_nodes').all()
+        workflow_nodes = node_qs.prefetch_related(*self.EDGE_TYPES).all()
+        self.load_related_objects(workflow_nodes)
+        self._add_workflow_nodes(workflow_nodes)
+
+    def _add_workflow_nodes(self, workflow_nodes):
         for workflow_node in workflow_nodes:
             self.add_node(workflow_node)
 
-        for node_type in ['success_nodes', 'failure_nodes', 'always_nodes']:
+        for node_type in self.EDGE_TYPES:
             for workflow_node in workflow_nodes:
                 related_nodes = getattr(workflow_node, node_type).all()
                 for related_node in related_nodes:
                     self.add_edge(workflow_node, related_node, node_type)
 
+    @classmethod
+    def from_workflow_jobs(cls, workflow_jobs):
+        '''
+        Build the graphs of several workflow jobs with the same handful of
+        queries it takes to build one. Returns a dict of workflow job id ->
+        WorkflowDAG.
+        '''
+        workflow_jobs = dict((workflow_job.id, workflow_job) for workflow_job in workflow_jobs)
+        nodes_by_workflow_job = dict((workflow_job_id, []) for workflow_job_id in workflow_jobs)
+        if workflow_jobs:
+            workflow_nodes = list(WorkflowJobNode.objects.filter(workflow_job_id__in=workflow_jobs.keys())
+                                                         .prefetch_related(*cls.EDGE_TYPES))
+            cls.load_related_objects(workflow_nodes)
+            for workflow_node in workflow_nodes:
+                workflow_node.workflow_job = workflow_jobs[workflow_node.workflow_job_id]
+                nodes_by_workflow_job[workflow_node.workflow_job_id].append(workflow_node)
+
+        dags = {}
+        for workflow_job_id, workflow_nodes in nodes_by_workflow_job.items():
+            dag = cls()
+            dag._add_workflow_nodes(workflow_nodes)
+            dags[workflow_job_id] = dag
+        return dags
+
+    @staticmethod
+    def load_related_objects(workflow_nodes):
+        '''
+        Load the job and unified job template of every node in bulk.
+
+        select_related() would hand back UnifiedJob and UnifiedJobTemplate
+        base class rows, so the polymorphic managers are used to get one
+        query per subclass instead of one per node.
+        '''
+        job_ids = set(n.job_id for n in workflow_nodes if n.job_id)
+        template_ids = set(n.unified_job_template_id for n in workflow_nodes if n.unified_job_template_id)
+        jobs = UnifiedJob.objects.in_bulk(job_ids) if job_ids else {}
+        templates = UnifiedJobTemplate.objects.in_bulk(template_ids) if template_ids else {}
+        for workflow_node in workflow_nodes:
+            if workflow_node.job_id in jobs:
+                workflow_node.job = jobs[workflow_node.job_id]
+            if workflow_node.unified_job_template_id in templates:
+                workflow_node.unified_job_template = templates[workflow_node.unified_job_template_id]
+
+    def _extend_unvisited(self, nodes, visited, children):
+        # Nodes reachable through more than one parent are only walked once
+        for child in children:
+            idx = self.find_ord(child['node_object'])
+            if idx not in visited:
+                visited.add(idx)
+                nodes.append(child)
+
     def bfs_nodes_to_run(self):
         root_nodes = self.get_root_nodes()
         nodes = root_nodes
+        visited = set(self.find_ord(n['node_object']) for n in nodes)
         nodes_found = []
 
         for index, n in enumerate(nodes):
@@ -41,12 +100,12 @@ class WorkflowDAG(SimpleDAG):
                 children_failed = self.get_dependencies(obj, 'failure_nodes')
                 children_always = self.get_dependencies(obj, 'always_nodes')
                 children_all = children_failed + children_always
-                nodes.extend(children_all)
+                self._extend_unvisited(nodes, visited, children_all)
             elif job.status == 'successful':
                 children_success = self.get_dependencies(obj, 'success_nodes')
                 children_always = self.get_dependencies(obj, 'always_nodes')
                 children_all = children_success + children_always
-                nodes.extend(children_all)
+                self._extend_unvisited(nodes, visited, children_all)
         return [n['node_object'] for n in nodes_found]
 
     def cancel_node_jobs(self):
@@ -62,6 +121,7 @@ class WorkflowDAG(SimpleDAG):
     def is_workflow_done(self):
         root_nodes = self.get_root_nodes()
         nodes = root_nodes
+        visited = set(self.find_ord(n['node_object']) for n in nodes)
 
         for index, n in enumerate(nodes):
             obj = n['node_object']
@@ -82,11 +142,11 @@ class WorkflowDAG(SimpleDAG):
                 children_failed = self.get_dependencies(obj, 'failure_nodes')
                 children_always = self.get_dependencies(obj, 'always_nodes')
                 children_all = children_failed + children_always
-                nodes.extend(children_all)
+                self._extend_unvisited(nodes, visited, children_all)
             elif job.status == 'successful':
                 children_success = self.get_dependencies(obj, 'success_nodes')
                 children_always = self.get_dependencies(obj, 'always_nodes')
                 children_all = children_success + children_always
-                nodes.extend(children_all)
+                self._extend_unvisited(nodes, visited, children_all)
         return True
 
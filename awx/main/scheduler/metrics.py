@@ -0,0 +1,151 @@
+# Copyright (c) 2017 Ansible by Red Hat
+# All Rights Reserved.
+
+# Python
+from collections import OrderedDict
+from contextlib import contextmanager
+import logging
+import time
+
+# Django
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.utils.timezone import now as tz_now
+
+logger = logging.getLogger('awx.main.scheduler')
+analytics_logger = logging.getLogger('awx.analytics.task_manager')
+
+CACHE_KEY = 'task_manager_metrics'
+
+
+def get_schedule_interval():
+    '''
+    Seconds between two task manager runs scheduled by celery beat.
+    '''
+    schedule = settings.CELERYBEAT_SCHEDULE.get('task_manager', {}).get('schedule')
+    return schedule.total_seconds() if schedule else None
+
+
+def get_recent_cycles():
+    '''
+    Metrics of the most recent task manager cycles, newest first.
+    '''
+    return cache.get(CACHE_KEY) or []
+
+
+class TaskManagerMetrics(object):
+    '''
+    Timings and counters of one task manager cycle.
+
+    Phases may be entered several times in a cycle (e.g. dependency
+    generation for each pending task), their time and query counts add up.
+    Queries are counted from the connection's query log, which is turned on
+    for the duration of the cycle (counts saturate at
+    connection.queries_limit).
+    '''
+
+    def __init__(self):
+        self.cycle_started = tz_now()
+        self.start = time.time()
+        self.lock_requested = None
+        self.lock_acquired = None
+        self.lock_released = None
+        self.acquired = None
+        self.phases = OrderedDict()
+        self.counters = OrderedDict()
+        self.blocked = OrderedDict()
+        self.queries = 0
+        self.duration = None
+
+    def query_count(self):
+        return len(connection.queries_log)
+
+    def begin(self):
+        # Unless something else already logs queries (e.g. DEBUG), don't
+        # keep this cycle's queries around once they have been counted
+        self._owns_query_log = not connection.queries_logged
+        self._force_debug_cursor = connection.force_debug_cursor
+        connection.force_debug_cursor = True
+        if self._owns_query_log:
+            connection.queries_log.clear()
+        self._queries_before = self.query_count()
+
+    def end(self):
+        self.queries = self.query_count() - self._queries_before
+        connection.force_debug_cursor = self._force_debug_cursor
+        if self._owns_query_log:
+            connection.queries_log.clear()
+        self.duration = time.time() - self.start
+
+    @contextmanager
+    def lock(self):
+        '''
+        Wraps the advisory lock; call acquire() with the lock result once it
+        has been requested.
+        '''
+        self.lock_requested = time.time()
+        try:
+            yield
+        finally:
+            self.lock_released = time.time()
+
+    def acquire(self, acquired):
+        self.lock_acquired = time.time()
+        self.acquired = acquired
+
+    @contextmanager
+    def phase(self, name):
+        start = time.time()
+        queries_before = self.query_count()
+        try:
+            yield
+        finally:
+            phase = self.phases.setdefault(name, dict(time=0.0, queries=0, calls=0))
+            phase['time'] += time.time() - start
+            phase['queries'] += self.query_count() - queries_before
+            phase['calls'] += 1
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    def block(self, reason):
+        self.count('tasks_blocked')
+        self.blocked[reason] = self.blocked.get(reason, 0) + 1
+
+    def as_dict(self):
+        lock_wait = lock_hold = None
+        if self.lock_acquired is not None:
+            lock_wait = self.lock_acquired - self.lock_requested
+            if self.acquired and self.lock_released is not None:
+                lock_hold = self.lock_released - self.lock_acquired
+        interval = get_schedule_interval()
+        return OrderedDict([
+            ('cycle_started', self.cycle_started.isoformat()),
+            ('cluster_node', settings.CLUSTER_HOST_ID),
+            ('lock_acquired', bool(self.acquired)),
+            ('duration', self.duration),
+            ('lock_wait', lock_wait),
+            ('lock_hold', lock_hold),
+            ('queries', self.queries),
+            ('exceeded_interval', bool(interval) and self.duration > interval),
+            ('phases', self.phases),
+            ('counters', self.counters),
+            ('blocked', self.blocked),
+        ])
+
+    def publish(self):
+        '''
+        Send the metrics to the awx.analytics logger and keep them in the
+        cache for the task manager metrics API endpoint.
+        '''
+        data = self.as_dict()
+        analytics_logger.info('task manager cycle', extra=dict(data))
+        if data['exceeded_interval']:
+            logger.warning('Task manager cycle took %0.2fs, more than the %ss scheduling interval',
+                           data['duration'], get_schedule_interval())
+        history = getattr(settings, 'AWX_TASK_MANAGER_METRICS_HISTORY', 0)
+        if history:
+            cycles = [data] + get_recent_cycles()
+            cache.set(CACHE_KEY, cycles[:history])
+        return data
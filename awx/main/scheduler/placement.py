@@ -0,0 +1,132 @@
+# Copyright (c) 2017 Ansible by Red Hat
+# All Rights Reserved.
+
+# Python
+import logging
+
+# Django
+from django.conf import settings
+
+logger = logging.getLogger('awx.main.scheduler')
+
+
+class GreedyPlacement(object):
+    '''
+    Places a task in the first of its preferred instance groups with enough
+    remaining capacity.
+
+    graph is the task manager capacity graph, a dict of instance group name
+    -> {'capacity_total': ..., 'consumed_capacity': ...}. Placement classes
+    don't touch the database so they can be replayed by the simulator.
+    '''
+
+    def __init__(self, graph, ig_ig_mapping=None, reserve_capacity=False):
+        self.graph = graph
+        # instance group name -> names of groups sharing instances with it
+        self.ig_ig_mapping = ig_ig_mapping or {}
+        self.reserve_capacity = reserve_capacity
+        # instance group names held back for a task that couldn't be placed
+        self.reserved = set()
+
+    def get_remaining_capacity(self, group_name):
+        return (self.graph[group_name]['capacity_total'] - self.graph[group_name]['consumed_capacity'])
+
+    def would_exceed_capacity(self, impact, group_name):
+        current_capacity = self.graph[group_name]['consumed_capacity']
+        capacity_total = self.graph[group_name]['capacity_total']
+        if current_capacity == 0:
+            return False
+        return (impact + current_capacity > capacity_total)
+
+    def is_available(self, impact, group_name):
+        if group_name in self.reserved:
+            logger.debug("Skipping group %s, capacity is reserved", group_name)
+            return False
+        remaining_capacity = self.get_remaining_capacity(group_name)
+        if remaining_capacity <= 0:
+            logger.debug("Skipping group %s, remaining_capacity %s <= 0",
+                         group_name, remaining_capacity)
+            return False
+        if self.would_exceed_capacity(impact, group_name):
+            logger.debug("Not enough capacity to run impact %s on %s (remaining_capacity=%s)",
+                         impact, group_name, remaining_capacity)
+            return False
+        return True
+
+    def select(self, impact, group_names):
+        '''
+        Return the name of the instance group to run a task with the given
+        impact in, or None if none of group_names has capacity for it.
+        '''
+        for group_name in group_names:
+            if self.is_available(impact, group_name):
+                return group_name
+        return None
+
+    def consume(self, impact, group_name):
+        self.graph[group_name]['consumed_capacity'] += impact
+
+    def reserve(self, impact, group_names):
+        '''
+        Called for a task that couldn't be placed. When capacity reservation
+        is enabled, the largest of its preferred groups is held back for the
+        rest of the cycle so smaller tasks behind it can't keep it starved.
+        Returns the name of the reserved group, if any.
+        '''
+        if not self.reserve_capacity:
+            return None
+        candidates = [name for name in group_names if name not in self.reserved]
+        if not candidates:
+            return None
+        group_name = max(candidates, key=lambda name: (self.graph[name]['capacity_total'],
+                                                       -group_names.index(name)))
+        self.reserved.add(group_name)
+        return group_name
+
+
+class BestFitPlacement(GreedyPlacement):
+    '''
+    Places a task in whichever preferred instance group it fits most
+    tightly, so that large tasks still find room in the others. Capacity
+    consumed in a group is also counted against the groups that share
+    instances with it.
+    '''
+
+    def select(self, impact, group_names):
+        best = None
+        for index, group_name in enumerate(group_names):
+            if not self.is_available(impact, group_name):
+                continue
+            leftover = self.get_remaining_capacity(group_name) - impact
+            if leftover >= 0:
+                key = (0, leftover, index)
+            else:
+                # Only possible on an idle group too small for the task
+                key = (1, -leftover, index)
+            if best is None or key < best[0]:
+                best = (key, group_name)
+        return best[1] if best else None
+
+    def consume(self, impact, group_name):
+        for name in self.ig_ig_mapping.get(group_name, [group_name]):
+            if name in self.graph:
+                self.graph[name]['consumed_capacity'] += impact
+
+
+PLACEMENT_STRATEGIES = {
+    'greedy': GreedyPlacement,
+    'best_fit': BestFitPlacement,
+}
+
+
+def get_placement(graph, ig_ig_mapping=None, name=None, reserve_capacity=None):
+    if name is None:
+        name = getattr(settings, 'AWX_TASK_MANAGER_PLACEMENT', 'greedy')
+    if reserve_capacity is None:
+        reserve_capacity = getattr(settings, 'AWX_TASK_MANAGER_RESERVE_CAPACITY', False)
+    if name not in PLACEMENT_STRATEGIES:
+        logger.error('Unknown task manager placement %s, expected one of %s. Falling back to greedy.',
+                     name, ', '.join(sorted(PLACEMENT_STRATEGIES)))
+        name = 'greedy'
+    return PLACEMENT_STRATEGIES[name](graph, ig_ig_mapping=ig_ig_mapping,
+                                      reserve_capacity=reserve_capacity)
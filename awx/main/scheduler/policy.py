@@ -0,0 +1,170 @@
+# Copyright (c) 2017 Ansible by Red Hat
+# All Rights Reserved.
+
+# Python
+import logging
+
+# Django
+from django.conf import settings
+
+# AWX
+from awx.main.models import (
+    AdHocCommand,
+    InventorySource,
+    InventoryUpdate,
+    Inventory,
+    Job,
+    Project,
+    ProjectUpdate,
+    WorkflowJob,
+    WorkflowJobTemplate,
+)
+
+logger = logging.getLogger('awx.main.scheduler')
+
+
+class SchedulingPolicy(object):
+    '''
+    Decides in which order the task manager considers pending tasks for
+    placement on an instance group.
+
+    Subclasses implement sort_keys(), which returns one sort key per pending
+    task. Ties are always broken by creation time and id so that the order
+    is deterministic.
+    '''
+
+    def order(self, pending_tasks, running_tasks, instance_group_for):
+        '''
+        pending_tasks: pending tasks sorted by creation time
+        running_tasks: waiting and running tasks
+        instance_group_for: callable returning the name of the instance group
+                            a pending task would be placed in first
+        '''
+        keys = self.sort_keys(pending_tasks, running_tasks, instance_group_for)
+        decorated = [(key, task.created, task.pk, task) for key, task in zip(keys, pending_tasks)]
+        decorated.sort(key=lambda d: d[:3])
+        return [d[3] for d in decorated]
+
+    def sort_keys(self, pending_tasks, running_tasks, instance_group_for):
+        raise NotImplementedError # Implement in subclass.
+
+
+class FIFOPolicy(SchedulingPolicy):
+    '''
+    Oldest task first.
+    '''
+
+    def sort_keys(self, pending_tasks, running_tasks, instance_group_for):
+        return [0] * len(pending_tasks)
+
+
+class TemplatePriorityPolicy(SchedulingPolicy):
+    '''
+    Tasks launched from templates with a higher priority in
+    AWX_TASK_MANAGER_TEMPLATE_PRIORITIES run first, oldest first within the
+    same priority.
+    '''
+
+    def sort_keys(self, pending_tasks, running_tasks, instance_group_for):
+        priorities = getattr(settings, 'AWX_TASK_MANAGER_TEMPLATE_PRIORITIES', {})
+        return [-priorities.get(task.unified_job_template_id, 0) for task in pending_tasks]
+
+
+class FairSharePolicy(SchedulingPolicy):
+    '''
+    Weighted fair share between organizations, per instance group.
+
+    Each pending task gets a virtual finish time: the capacity already
+    consumed by its organization on the instance group, plus the impact of
+    the organization's older pending tasks and its own, divided by the
+    organization weight from AWX_TASK_MANAGER_ORGANIZATION_WEIGHTS. Tasks
+    are considered by increasing virtual finish time, so an organization
+    submitting many tasks can't starve the others.
+    '''
+
+    def get_organization_ids(self, tasks):
+        '''
+        Return a list with the organization id of each task (None for tasks
+        that don't belong to an organization), in a constant number of
+        queries.
+        '''
+        project_ids = set()
+        inventory_ids = set()
+        inventory_source_ids = set()
+        workflow_job_template_ids = set()
+        for task in tasks:
+            if type(task) in (Job, ProjectUpdate):
+                project_ids.add(task.project_id)
+            elif type(task) is AdHocCommand:
+                inventory_ids.add(task.inventory_id)
+            elif type(task) is InventoryUpdate:
+                inventory_source_ids.add(task.inventory_source_id)
+            elif type(task) is WorkflowJob:
+                workflow_job_template_ids.add(task.workflow_job_template_id)
+
+        def org_map(model, ids, field_name='organization_id'):
+            ids.discard(None)
+            if not ids:
+                return {}
+            return dict(model.objects.filter(id__in=ids).values_list('id', field_name))
+
+        project_orgs = org_map(Project, project_ids)
+        inventory_orgs = org_map(Inventory, inventory_ids)
+        inventory_source_orgs = org_map(InventorySource, inventory_source_ids, 'inventory__organization_id')
+        workflow_orgs = org_map(WorkflowJobTemplate, workflow_job_template_ids)
+
+        organization_ids = []
+        for task in tasks:
+            if type(task) in (Job, ProjectUpdate):
+                organization_ids.append(project_orgs.get(task.project_id))
+            elif type(task) is AdHocCommand:
+                organization_ids.append(inventory_orgs.get(task.inventory_id))
+            elif type(task) is InventoryUpdate:
+                organization_ids.append(inventory_source_orgs.get(task.inventory_source_id))
+            elif type(task) is WorkflowJob:
+                organization_ids.append(workflow_orgs.get(task.workflow_job_template_id))
+            else:
+                organization_ids.append(None)
+        return organization_ids
+
+    def sort_keys(self, pending_tasks, running_tasks, instance_group_for):
+        weights = getattr(settings, 'AWX_TASK_MANAGER_ORGANIZATION_WEIGHTS', {})
+        organization_ids = self.get_organization_ids(list(running_tasks) + list(pending_tasks))
+        running_orgs = organization_ids[:len(running_tasks)]
+        pending_orgs = organization_ids[len(running_tasks):]
+
+        # (instance group name, organization id) -> consumed capacity
+        usage = {}
+        for task, org_id in zip(running_tasks, running_orgs):
+            group_name = task.instance_group.name if task.instance_group else None
+            key = (group_name, org_id)
+            usage[key] = usage.get(key, 0) + self.impact(task)
+
+        keys = []
+        for task, org_id in zip(pending_tasks, pending_orgs):
+            key = (instance_group_for(task), org_id)
+            usage[key] = usage.get(key, 0) + self.impact(task)
+            keys.append(float(usage[key]) / max(weights.get(org_id, 1), 1e-6))
+        return keys
+
+    @staticmethod
+    def impact(task):
+        # Tasks with no impact (e.g. workflow jobs) still count as a share
+        return max(task.task_impact, 1)
+
+
+SCHEDULING_POLICIES = {
+    'fifo': FIFOPolicy,
+    'fair_share': FairSharePolicy,
+    'template_priority': TemplatePriorityPolicy,
+}
+
+
+def get_scheduling_policy(name=None):
+    if name is None:
+        name = getattr(settings, 'AWX_TASK_MANAGER_POLICY', 'fifo')
+    if name not in SCHEDULING_POLICIES:
+        logger.error('Unknown task manager policy %s, expected one of %s. Falling back to fifo.',
+                     name, ', '.join(sorted(SCHEDULING_POLICIES)))
+        name = 'fifo'
+    return SCHEDULING_POLICIES[name]()
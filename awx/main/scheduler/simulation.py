@@ -0,0 +1,125 @@
+# Copyright (c) 2017 Ansible by Red Hat
+# All Rights Reserved.
+
+# AWX
+from awx.main.scheduler.placement import get_placement
+
+
+class PlacementSimulation(object):
+    '''
+    Replays a recorded task queue against a placement strategy without
+    touching the database.
+
+    The recording is a dict of the form:
+
+        {
+            "instance_groups": {
+                "<name>": {"capacity": 100, "instances": ["<hostname>", ...]},
+                ...
+            },
+            "tasks": [
+                {"id": 1, "created": 0.0, "duration": 30.0, "impact": 20,
+                 "instance_groups": ["<preferred name>", ...]},
+                ...
+            ]
+        }
+
+    where created and duration are in seconds. Like the task manager, every
+    cycle rebuilds the consumed capacity of each group from the running
+    tasks (counting tasks running on any group that shares an instance with
+    it) and then walks the pending tasks oldest first.
+    '''
+
+    def __init__(self, recording, placement='greedy', reserve_capacity=False, cycle=20, max_cycles=100000):
+        self.instance_groups = recording['instance_groups']
+        self.tasks = sorted(recording['tasks'], key=lambda t: (t['created'], t['id']))
+        self.placement = placement
+        self.reserve_capacity = reserve_capacity
+        self.cycle = cycle
+        self.max_cycles = max_cycles
+        self.ig_ig_mapping = self.get_ig_ig_mapping()
+
+    def get_ig_ig_mapping(self):
+        instances = dict((name, set(ig.get('instances', [])))
+                         for name, ig in self.instance_groups.items())
+        mapping = {}
+        for name, hostnames in instances.items():
+            mapping[name] = [name] + sorted(other for other, other_hostnames in instances.items()
+                                            if other != name and hostnames & other_hostnames)
+        return mapping
+
+    def build_graph(self, running):
+        graph = {}
+        for name, ig in self.instance_groups.items():
+            graph[name] = dict(capacity_total=ig['capacity'], consumed_capacity=0)
+        for task, group_name, end in running:
+            for name in self.ig_ig_mapping[group_name]:
+                graph[name]['consumed_capacity'] += task['impact']
+        return graph
+
+    def run(self):
+        '''
+        Returns a dict with one entry per task id: {'start': ..., 'end': ...,
+        'instance_group': ...}. Tasks that could never be placed are left
+        out.
+        '''
+        placed = {}
+        running = []
+        pending = []
+        upcoming = list(self.tasks)
+        if not upcoming:
+            return placed
+        now = upcoming[0]['created']
+        for i in range(self.max_cycles):
+            while upcoming and upcoming[0]['created'] <= now:
+                task = upcoming.pop(0)
+                if [name for name in task['instance_groups'] if name in self.instance_groups]:
+                    pending.append(task)
+            running = [r for r in running if r[2] > now]
+            if not (upcoming or pending or running):
+                break
+
+            graph = self.build_graph(running)
+            placement = get_placement(graph, ig_ig_mapping=self.ig_ig_mapping, name=self.placement,
+                                      reserve_capacity=self.reserve_capacity)
+            still_pending = []
+            for task in pending:
+                group_names = [name for name in task['instance_groups'] if name in graph]
+                group_name = placement.select(task['impact'], group_names)
+                if group_name is None:
+                    placement.reserve(task['impact'], group_names)
+                    still_pending.append(task)
+                    continue
+                placement.consume(task['impact'], group_name)
+                end = now + task['duration']
+                running.append((task, group_name, end))
+                placed[task['id']] = dict(start=now, end=end, instance_group=group_name)
+            pending = still_pending
+            now += self.cycle
+        return placed
+
+    def report(self):
+        placed = self.run()
+        tasks = [t for t in self.tasks if t['id'] in placed]
+        if not tasks:
+            return dict(tasks=0, unplaced=len(self.tasks), mean_wait=0.0, makespan=0.0, utilization=0.0)
+        first = min(t['created'] for t in tasks)
+        makespan = max(p['end'] for p in placed.values()) - first
+        waits = [placed[t['id']]['start'] - t['created'] for t in tasks]
+
+        # Capacity-seconds used against capacity-seconds available, per group
+        used = dict((name, 0.0) for name in self.instance_groups)
+        for t in tasks:
+            used[placed[t['id']]['instance_group']] += t['impact'] * t['duration']
+        utilization = {}
+        for name, ig in self.instance_groups.items():
+            available = ig['capacity'] * makespan
+            utilization[name] = used[name] / available if available else 0.0
+        return dict(
+            tasks=len(tasks),
+            unplaced=len(self.tasks) - len(tasks),
+            mean_wait=float(sum(waits)) / len(waits),
+            makespan=makespan,
+            utilization=float(sum(utilization.values())) / len(utilization) if utilization else 0.0,
+            utilization_by_group=utilization,
+        )
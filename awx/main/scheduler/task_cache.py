@@ -0,0 +1,117 @@
+# Copyright (c) 2017 Ansible by Red Hat
+# All Rights Reserved.
+
+# Python
+from datetime import timedelta
+import logging
+
+# Django
+from django.conf import settings
+from django.utils.timezone import now as tz_now
+
+# AWX
+from awx.main.models import (
+    AdHocCommand,
+    InventoryUpdate,
+    Job,
+    ProjectUpdate,
+    SystemJob,
+    WorkflowJob,
+)
+
+logger = logging.getLogger('awx.main.scheduler')
+
+
+class TaskCache(object):
+    '''
+    In-process view of the task queue used by the TaskManager.
+
+    Instead of reloading every pending, waiting and running task on each
+    scheduler cycle, the cache applies the rows modified since the previous
+    sync (launches, completions and cancels all save the task, which bumps
+    `modified`).  A full reconcile against the database still happens every
+    AWX_TASK_MANAGER_RECONCILE_INTERVAL seconds to pick up anything a delta
+    could have missed (e.g. deleted jobs or long running transactions).
+    '''
+
+    STATUS_LIST = ('pending', 'waiting', 'running')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        # (model, pk) -> task
+        self.tasks = {}
+        self.last_sync = None
+        self.last_reconcile = None
+
+    def get_querysets(self):
+        return [
+            Job.objects.prefetch_related('instance_group'),
+            InventoryUpdate.objects.exclude(source='file').prefetch_related('inventory_source', 'instance_group'),
+            ProjectUpdate.objects.prefetch_related('instance_group'),
+            SystemJob.objects.prefetch_related('instance_group'),
+            AdHocCommand.objects.prefetch_related('instance_group'),
+            WorkflowJob.objects.all(),
+        ]
+
+    def needs_reconcile(self, now):
+        if self.last_reconcile is None or self.last_sync is None:
+            return True
+        interval = getattr(settings, 'AWX_TASK_MANAGER_RECONCILE_INTERVAL', 0)
+        return (now - self.last_reconcile).total_seconds() >= interval
+
+    def reconcile(self, now):
+        tasks = {}
+        for qs in self.get_querysets():
+            for task in qs.filter(status__in=self.STATUS_LIST):
+                tasks[(type(task), task.pk)] = task
+        self.tasks = tasks
+        self.last_sync = self.last_reconcile = now
+        logger.debug("Task cache reconciled, %s tasks in queue", len(self.tasks))
+
+    def apply_delta(self, now):
+        overlap = timedelta(seconds=getattr(settings, 'AWX_TASK_MANAGER_DELTA_OVERLAP', 60))
+        since = self.last_sync - overlap
+        changed = set()
+        for qs in self.get_querysets():
+            for task in qs.filter(modified__gte=since):
+                key = (type(task), task.pk)
+                if task.status in self.STATUS_LIST:
+                    self.tasks[key] = task
+                else:
+                    self.tasks.pop(key, None)
+                changed.add(key)
+        for key, task in self.tasks.iteritems():
+            if task.status == 'pending' and key not in changed:
+                self.clear_related_caches(task)
+        self.last_sync = now
+        logger.debug("Task cache applied %s changed tasks, %s tasks in queue", len(changed), len(self.tasks))
+
+    @staticmethod
+    def clear_related_caches(task):
+        '''
+        Pending tasks may sit in the cache for several cycles, drop any
+        related objects cached on them so dependency generation sees the
+        current project and inventory settings.
+        '''
+        for field in task._meta.fields:
+            if field.is_relation:
+                cache_name = field.get_cache_name()
+                if hasattr(task, cache_name):
+                    delattr(task, cache_name)
+
+    def sync(self):
+        now = tz_now()
+        if self.needs_reconcile(now):
+            self.reconcile(now)
+        else:
+            self.apply_delta(now)
+
+    def get_tasks(self, status_list=STATUS_LIST):
+        self.sync()
+        return sorted([t for t in self.tasks.itervalues() if t.status in status_list],
+                      key=lambda task: (task.created, task.pk))
+
+
+task_cache = TaskCache()
@@ -14,12 +14,11 @@ from django.core.cache import cache
 from django.db import transaction, connection, DatabaseError
 from django.utils.translation import ugettext_lazy as _
 from django.utils.timezone import now as tz_now, utc
-from django.db.models import Q
+from django.db.models import Q, Max, Case, When, Value, IntegerField
 from django.contrib.contenttypes.models import ContentType
 
 # AWX
 from awx.main.models import (
-    AdHocCommand,
     Instance,
     InstanceGroup,
     InventorySource,
@@ -27,11 +26,16 @@ from awx.main.models import (
     Job,
     Project,
     ProjectUpdate,
-    SystemJob,
+    TaskLease,
     UnifiedJob,
     WorkflowJob,
+    WorkflowJobNode,
 )
 from awx.main.scheduler.dag_workflow import WorkflowDAG
+from awx.main.scheduler.task_cache import task_cache
+from awx.main.scheduler.policy import get_scheduling_policy
+from awx.main.scheduler.placement import get_placement
+from awx.main.scheduler.metrics import TaskManagerMetrics
 from awx.main.utils.pglock import advisory_lock
 from awx.main.utils import get_type_for_model
 from awx.main.signals import disable_activity_stream
@@ -40,9 +44,6 @@ from awx.main.scheduler.dependency_graph import DependencyGraph
 from awx.main import tasks as awx_tasks
 from awx.main.utils import decrypt_field
 
-# Celery
-from celery.task.control import inspect
-
 
 logger = logging.getLogger('awx.main.scheduler')
 
@@ -51,10 +52,26 @@ class TaskManager():
 
     def __init__(self):
         self.graph = dict()
+        # project_id -> Project
+        self.projects = {}
+        # project_id -> latest check ProjectUpdate
+        self.latest_project_updates = {}
+        # inventory_id -> [InventorySource]
+        self.inventory_sources = {}
+        # inventory_source_id -> latest InventoryUpdate
+        self.latest_inventory_updates = {}
+        # ids of jobs whose dependencies were already generated
+        self.jobs_with_dependencies = Set()
+        # (model, pk) -> [InstanceGroup]
+        self.preferred_instance_groups = {}
+        self.policy = get_scheduling_policy()
+        self.metrics = TaskManagerMetrics()
         for rampart_group in InstanceGroup.objects.prefetch_related('instances'):
             self.graph[rampart_group.name] = dict(graph=DependencyGraph(rampart_group.name),
                                                   capacity_total=rampart_group.capacity,
-                                                  consumed_capacity=0)
+                                                  consumed_capacity=0,
+                                                  instance_group=rampart_group)
+        self.placement = get_placement(self.graph)
 
     def is_job_blocked(self, task):
         # TODO: I'm not happy with this, I think blocking behavior should be decided outside of the dependency graph
@@ -70,16 +87,7 @@ class TaskManager():
         return False
 
     def get_tasks(self, status_list=('pending', 'waiting', 'running')):
-        jobs = [j for j in Job.objects.filter(status__in=status_list).prefetch_related('instance_group')]
-        inventory_updates_qs = InventoryUpdate.objects.filter(status__in=status_list).exclude(source='file').prefetch_related('inventory_source', 'instance_group')
-        inventory_updates = [i for i in inventory_updates_qs]
-        project_updates = [p for p in ProjectUpdate.objects.filter(status__in=status_list).prefetch_related('instance_group')]
-        system_jobs = [s for s in SystemJob.objects.filter(status__in=status_list).prefetch_related('instance_group')]
-        ad_hoc_commands = [a for a in AdHocCommand.objects.filter(status__in=status_list).prefetch_related('instance_group')]
-        workflow_jobs = [w for w in WorkflowJob.objects.filter(status__in=status_list)]
-        all_tasks = sorted(jobs + project_updates + inventory_updates + system_jobs + ad_hoc_commands + workflow_jobs,
-                           key=lambda task: task.created)
-        return all_tasks
+        return task_cache.get_tasks(status_list=status_list)
 
     '''
     Tasks that are running and SHOULD have a celery task.
@@ -89,84 +97,79 @@ class TaskManager():
         ...
     }
     '''
-    def get_running_tasks(self):
-        execution_nodes = {}
-        waiting_jobs = []
+    def get_lost_tasks(self):
+        '''
+        Waiting and running tasks whose lease expired, or that never got
+        one from a worker within AWX_TASK_LEASE_TIMEOUT seconds.
+        '''
         now = tz_now()
         workflow_ctype_id = ContentType.objects.get_for_model(WorkflowJob).id
-        jobs = UnifiedJob.objects.filter((Q(status='running') |
-                                         Q(status='waiting', modified__lte=now - timedelta(seconds=60))) &
-                                         ~Q(polymorphic_ctype_id=workflow_ctype_id))
-        for j in jobs:
-            if j.execution_node:
-                execution_nodes.setdefault(j.execution_node, []).append(j)
-            else:
-                waiting_jobs.append(j)
-        return (execution_nodes, waiting_jobs)
-
-    '''
-    Tasks that are currently running in celery
+        lease_timeout = timedelta(seconds=settings.AWX_TASK_LEASE_TIMEOUT)
+        return list(UnifiedJob.objects.filter(status__in=('waiting', 'running'))
+                                      .exclude(polymorphic_ctype_id=workflow_ctype_id)
+                                      .filter(Q(task_lease__expires__lt=now) |
+                                              Q(task_lease__isnull=True, modified__lt=now - lease_timeout)))
 
-    Transform:
-    {
-        "celery@ec2-54-204-222-62.compute-1.amazonaws.com": [],
-        "celery@ec2-54-163-144-168.compute-1.amazonaws.com": [{
-            ...
-            "id": "5238466a-f8c7-43b3-9180-5b78e9da8304",
-            ...
-        }, {
-            ...,
-        }, ...]
-    }
-
-    to:
-    {
-        "ec2-54-204-222-62.compute-1.amazonaws.com": [
-            "5238466a-f8c7-43b3-9180-5b78e9da8304",
-            "5238466a-f8c7-43b3-9180-5b78e9da8306",
-            ...
-        ]
-    }
-    '''
-    def get_active_tasks(self):
-        inspector = inspect()
-        if not hasattr(settings, 'IGNORE_CELERY_INSPECTOR'):
-            active_task_queues = inspector.active()
-        else:
-            logger.warn("Ignoring celery task inspector")
-            active_task_queues = None
-
-        queues = None
-
-        if active_task_queues is not None:
-            queues = {}
-            for queue in active_task_queues:
-                active_tasks = set()
-                map(lambda at: active_tasks.add(at['id']), active_task_queues[queue])
-
-                # celery worker name is of the form celery@myhost.com
-                queue_name = queue.split('@')
-                queue_name = queue_name[1 if len(queue_name) > 1 else 0]
-                queues[queue_name] = active_tasks
-        else:
-            if not hasattr(settings, 'CELERY_UNIT_TEST'):
-                return (None, None)
-
-        return (active_task_queues, queues)
+    def _latest_by_created(self, qs, field_name):
+        '''
+        Return a dict mapping field_name -> the most recently created object
+        of qs, using one aggregate query and one fetch query.
+        '''
+        latest_created = dict(
+            (row[field_name], row['latest'])
+            for row in qs.order_by().values(field_name).annotate(latest=Max('created'))
+        )
+        if not latest_created:
+            return {}
+        latest = {}
+        filter_kwargs = {'created__in': set(latest_created.values())}
+        for obj in qs.filter(**filter_kwargs).order_by('id'):
+            key = getattr(obj, field_name)
+            if obj.created == latest_created.get(key):
+                latest[key] = obj
+        return latest
 
     def get_latest_project_update_tasks(self, all_sorted_tasks):
         project_ids = Set()
         for task in all_sorted_tasks:
-            if isinstance(task, Job):
+            if type(task) is Job and task.project_id:
                 project_ids.add(task.project_id)
-        return ProjectUpdate.objects.filter(id__in=project_ids)
+        if not project_ids:
+            return {}
+        qs = ProjectUpdate.objects.filter(project_id__in=project_ids, job_type='check').select_related('project')
+        return self._latest_by_created(qs, 'project_id')
+
+    def get_latest_inventory_update_tasks(self, inventory_sources):
+        inventory_source_ids = Set(invsrc.id for invsrc in inventory_sources)
+        if not inventory_source_ids:
+            return {}
+        qs = InventoryUpdate.objects.filter(inventory_source_id__in=inventory_source_ids).select_related('inventory_source')
+        return self._latest_by_created(qs, 'inventory_source_id')
+
+    def get_jobs_with_dependencies(self, all_sorted_tasks):
+        job_ids = [task.id for task in all_sorted_tasks if type(task) is Job]
+        if not job_ids:
+            return Set()
+        through = UnifiedJob.dependent_jobs.through
+        return Set(through.objects.filter(from_unifiedjob_id__in=job_ids)
+                                  .values_list('from_unifiedjob_id', flat=True))
+
+    def prefetch_dependency_data(self, pending_tasks):
+        '''
+        Load everything generate_dependencies() needs for the pending jobs
+        in a constant number of queries, rather than several per job.
+        '''
+        project_ids = Set(task.project_id for task in pending_tasks if type(task) is Job and task.project_id)
+        self.projects = Project.objects.in_bulk(project_ids) if project_ids else {}
+        self.latest_project_updates = self.get_latest_project_update_tasks(pending_tasks)
 
-    def get_latest_inventory_update_tasks(self, all_sorted_tasks):
-        inventory_ids = Set()
-        for task in all_sorted_tasks:
-            if isinstance(task, Job):
-                inventory_ids.add(task.inventory_id)
-        return InventoryUpdate.objects.filter(id__in=inventory_ids)
+        self.inventory_sources = {}
+        all_inventory_sources = self.get_inventory_source_tasks(pending_tasks)
+        for inventory_source in all_inventory_sources:
+            self.inventory_sources.setdefault(inventory_source.inventory_id, []).append(inventory_source)
+        self.latest_inventory_updates = self.get_latest_inventory_update_tasks(all_inventory_sources)
+
+        self.jobs_with_dependencies = self.get_jobs_with_dependencies(pending_tasks)
 
     def get_running_workflow_jobs(self):
         graph_workflow_jobs = [wf for wf in
@@ -180,17 +183,42 @@ class TaskManager():
                 inventory_ids.add(task.inventory_id)
         return [invsrc for invsrc in InventorySource.objects.filter(inventory_id__in=inventory_ids, update_on_launch=True)]
 
-    def spawn_workflow_graph_jobs(self, workflow_jobs):
+    def get_workflow_dags(self, workflow_jobs):
+        return WorkflowDAG.from_workflow_jobs(workflow_jobs)
+
+    def link_spawned_jobs(self, spawned_nodes):
+        '''
+        Save the job of each spawned workflow node, one UPDATE per batch of
+        nodes instead of a save() per node.
+        '''
+        batch_size = getattr(settings, 'AWX_TASK_MANAGER_WORKFLOW_BATCH_SIZE', 500)
+        modified = tz_now()
+        for i in range(0, len(spawned_nodes), batch_size):
+            batch = spawned_nodes[i:i + batch_size]
+            job_id = Case(*[When(pk=node.pk, then=Value(node.job_id)) for node in batch],
+                          output_field=IntegerField())
+            WorkflowJobNode.objects.filter(pk__in=[node.pk for node in batch]).update(job=job_id, modified=modified)
+            for node in batch:
+                node.modified = modified
+
+    def spawn_workflow_graph_jobs(self, workflow_jobs, workflow_dags=None):
+        if workflow_dags is None:
+            workflow_dags = self.get_workflow_dags(workflow_jobs)
+        spawned_nodes = []
         for workflow_job in workflow_jobs:
-            dag = WorkflowDAG(workflow_job)
+            if workflow_job.status != 'running':
+                # Finished or canceled earlier in this cycle
+                continue
+            dag = workflow_dags[workflow_job.id]
             spawn_nodes = dag.bfs_nodes_to_run()
             for spawn_node in spawn_nodes:
                 if spawn_node.unified_job_template is None:
                     continue
-                kv = spawn_node.get_job_kwargs()
+                parent_nodes = [n['node_object'] for n in dag.get_dependents(spawn_node)]
+                kv = spawn_node.get_job_kwargs(parent_nodes=parent_nodes)
                 job = spawn_node.unified_job_template.create_unified_job(**kv)
                 spawn_node.job = job
-                spawn_node.save()
+                spawned_nodes.append(spawn_node)
                 if job._resources_sufficient_for_launch():
                     can_start = job.signal_start(**kv)
                     if not can_start:
@@ -203,21 +231,25 @@ class TaskManager():
                 if not can_start:
                     job.status = 'failed'
                     job.save(update_fields=['status', 'job_explanation'])
-                    connection.on_commit(lambda: job.websocket_emit_status('failed'))
+                    connection.on_commit(lambda job=job: job.websocket_emit_status('failed'))
 
                 # TODO: should we emit a status on the socket here similar to tasks.py awx_periodic_scheduler() ?
                 #emit_websocket_notification('/socket.io/jobs', '', dict(id=))
+        self.link_spawned_jobs(spawned_nodes)
 
     # See comment in tasks.py::RunWorkflowJob::run()
-    def process_finished_workflow_jobs(self, workflow_jobs):
+    def process_finished_workflow_jobs(self, workflow_jobs, workflow_dags=None):
+        if workflow_dags is None:
+            workflow_dags = self.get_workflow_dags(workflow_jobs)
         result = []
         for workflow_job in workflow_jobs:
-            dag = WorkflowDAG(workflow_job)
+            dag = workflow_dags[workflow_job.id]
             if workflow_job.cancel_flag:
                 workflow_job.status = 'canceled'
                 workflow_job.save()
                 dag.cancel_node_jobs()
-                connection.on_commit(lambda: workflow_job.websocket_emit_status(workflow_job.status))
+                connection.on_commit(lambda workflow_job=workflow_job:
+                                     workflow_job.websocket_emit_status(workflow_job.status))
             elif dag.is_workflow_done():
                 result.append(workflow_job.id)
                 if workflow_job._has_failed():
@@ -225,7 +257,8 @@ class TaskManager():
                 else:
                     workflow_job.status = 'successful'
                 workflow_job.save()
-                connection.on_commit(lambda: workflow_job.websocket_emit_status(workflow_job.status))
+                connection.on_commit(lambda workflow_job=workflow_job:
+                                     workflow_job.websocket_emit_status(workflow_job.status))
         return result
 
     def get_dependent_jobs_for_inv_and_proj_update(self, job_obj):
@@ -269,6 +302,7 @@ class TaskManager():
                 task.save()
 
             self.consume_capacity(task, rampart_group.name)
+            self.metrics.count('tasks_started')
 
         def post_commit():
             task.websocket_emit_status(task.status)
@@ -277,26 +311,54 @@ class TaskManager():
 
         connection.on_commit(post_commit)
 
+    def get_preferred_instance_groups(self, task):
+        key = (type(task), task.pk)
+        if key not in self.preferred_instance_groups:
+            self.preferred_instance_groups[key] = task.preferred_instance_groups
+        return self.preferred_instance_groups[key]
+
+    def get_preferred_group_names(self, task):
+        return [g.name for g in self.get_preferred_instance_groups(task) if g.name in self.graph]
+
+    def select_instance_group(self, task):
+        group_name = self.placement.select(task.task_impact, self.get_preferred_group_names(task))
+        if group_name is None:
+            return None
+        return self.graph[group_name]['instance_group']
+
+    def get_primary_instance_group(self, task):
+        preferred_instance_groups = self.get_preferred_instance_groups(task)
+        if not preferred_instance_groups:
+            return None
+        return preferred_instance_groups[0].name
+
     def process_running_tasks(self, running_tasks):
         map(lambda task: self.graph[task.instance_group.name]['graph'].add_job(task), running_tasks)
 
+    def _set_latest(self, latest_map, key, unified_job):
+        current = latest_map.get(key)
+        if current is None or unified_job.created >= current.created:
+            latest_map[key] = unified_job
+
     def create_project_update(self, task):
-        project_task = Project.objects.get(id=task.project_id).create_project_update(launch_type='dependency')
+        project = self.projects.get(task.project_id) or Project.objects.get(id=task.project_id)
+        project_task = project.create_project_update(launch_type='dependency')
 
         # Project created 1 seconds behind
         project_task.created = task.created - timedelta(seconds=1)
         project_task.status = 'pending'
         project_task.save()
+        if project_task.job_type == 'check':
+            self._set_latest(self.latest_project_updates, task.project_id, project_task)
         return project_task
 
     def create_inventory_update(self, task, inventory_source_task):
-        inventory_task = InventorySource.objects.get(id=inventory_source_task.id).create_inventory_update(launch_type='dependency')
+        inventory_task = inventory_source_task.create_inventory_update(launch_type='dependency')
 
         inventory_task.created = task.created - timedelta(seconds=2)
         inventory_task.status = 'pending'
         inventory_task.save()
-        # inventory_sources = self.get_inventory_source_tasks([task])
-        # self.process_inventory_sources(inventory_sources)
+        self._set_latest(self.latest_inventory_updates, inventory_source_task.id, inventory_task)
         return inventory_task
 
     def capture_chain_failure_dependencies(self, task, dependencies):
@@ -306,18 +368,16 @@ class TaskManager():
             for dep in dependencies:
                 # Add task + all deps except self
                 dep.dependent_jobs.add(*([task] + filter(lambda d: d != dep, dependencies)))
+        self.jobs_with_dependencies.add(task.id)
 
     def get_latest_inventory_update(self, inventory_source):
-        latest_inventory_update = InventoryUpdate.objects.filter(inventory_source=inventory_source).order_by("-created")
-        if not latest_inventory_update.exists():
-            return None
-        return latest_inventory_update.first()
+        return self.latest_inventory_updates.get(inventory_source.id)
 
     def should_update_inventory_source(self, job, latest_inventory_update):
         now = tz_now()
 
         # Already processed dependencies for this job
-        if job.dependent_jobs.all():
+        if job.id in self.jobs_with_dependencies:
             return False
 
         if latest_inventory_update is None:
@@ -338,14 +398,11 @@ class TaskManager():
         return False
 
     def get_latest_project_update(self, job):
-            latest_project_update = ProjectUpdate.objects.filter(project=job.project, job_type='check').order_by("-created")
-            if not latest_project_update.exists():
-                return None
-            return latest_project_update.first()
+        return self.latest_project_updates.get(job.project_id)
 
     def should_update_related_project(self, job, latest_project_update):
         now = tz_now()
-        if job.dependent_jobs.all():
+        if job.id in self.jobs_with_dependencies:
             return False
 
         if latest_project_update is None:
@@ -382,7 +439,8 @@ class TaskManager():
         dependencies = []
         if type(task) is Job:
             # TODO: Can remove task.project None check after scan-job-default-playbook is removed
-            if task.project is not None and task.project.scm_update_on_launch is True:
+            project = self.projects.get(task.project_id)
+            if project is not None and project.scm_update_on_launch is True:
                 latest_project_update = self.get_latest_project_update(task)
                 if self.should_update_related_project(task, latest_project_update):
                     project_task = self.create_project_update(task)
@@ -392,11 +450,14 @@ class TaskManager():
                         dependencies.append(latest_project_update)
 
             # Inventory created 2 seconds behind job
-            try:
-                start_args = json.loads(decrypt_field(task, field_name="start_args"))
-            except ValueError:
-                start_args = dict()
-            for inventory_source in [invsrc for invsrc in self.all_inventory_sources if invsrc.inventory == task.inventory]:
+            inventory_sources = self.inventory_sources.get(task.inventory_id, [])
+            start_args = dict()
+            if inventory_sources:
+                try:
+                    start_args = json.loads(decrypt_field(task, field_name="start_args"))
+                except ValueError:
+                    pass
+            for inventory_source in inventory_sources:
                 if "inventory_sources_already_updated" in start_args and inventory_source.id in start_args['inventory_sources_already_updated']:
                     continue
                 if not inventory_source.update_on_launch:
@@ -418,208 +479,183 @@ class TaskManager():
             if self.is_job_blocked(task):
                 logger.debug("Dependent %s is blocked from running", task.log_format)
                 continue
-            preferred_instance_groups = task.preferred_instance_groups
-            found_acceptable_queue = False
-            for rampart_group in preferred_instance_groups:
-                if self.get_remaining_capacity(rampart_group.name) <= 0:
-                    logger.debug("Skipping group %s capacity <= 0", rampart_group.name)
-                    continue
-                if not self.would_exceed_capacity(task, rampart_group.name):
-                    logger.debug("Starting dependent %s in group %s", task.log_format, rampart_group.name)
-                    self.graph[rampart_group.name]['graph'].add_job(task)
-                    tasks_to_fail = filter(lambda t: t != task, dependency_tasks)
-                    tasks_to_fail += [dependent_task]
-                    self.start_task(task, rampart_group, tasks_to_fail)
-                    found_acceptable_queue = True
-            if not found_acceptable_queue:
+            rampart_group = self.select_instance_group(task)
+            if rampart_group is None:
                 logger.debug("Dependent %s couldn't be scheduled on graph, waiting for next cycle", task.log_format)
+                self.metrics.block('dependency_no_capacity')
+                continue
+            logger.debug("Starting dependent %s in group %s", task.log_format, rampart_group.name)
+            self.graph[rampart_group.name]['graph'].add_job(task)
+            tasks_to_fail = filter(lambda t: t != task, dependency_tasks)
+            tasks_to_fail += [dependent_task]
+            self.start_task(task, rampart_group, tasks_to_fail)
 
     def process_pending_tasks(self, pending_tasks):
+        self.prefetch_dependency_data(pending_tasks)
         for task in pending_tasks:
-            self.process_dependencies(task, self.generate_dependencies(task))
+            with self.metrics.phase('generate_dependencies'):
+                dependencies = self.generate_dependencies(task)
+            self.metrics.count('dependencies_created', len(dependencies))
+            self.process_dependencies(task, dependencies)
             if self.is_job_blocked(task):
                 logger.debug("%s is blocked from running", task.log_format)
+                self.metrics.block('blocked_by_running_job')
                 continue
-            preferred_instance_groups = task.preferred_instance_groups
-            found_acceptable_queue = False
-            for rampart_group in preferred_instance_groups:
-                remaining_capacity = self.get_remaining_capacity(rampart_group.name)
-                if remaining_capacity <= 0:
-                    logger.debug("Skipping group %s, remaining_capacity %s <= 0",
-                                 rampart_group.name, remaining_capacity)
-                    continue
-                if not self.would_exceed_capacity(task, rampart_group.name):
-                    logger.debug("Starting %s in group %s (remaining_capacity=%s)",
-                                 task.log_format, rampart_group.name, remaining_capacity)
-                    self.graph[rampart_group.name]['graph'].add_job(task)
-                    self.start_task(task, rampart_group, task.get_jobs_fail_chain())
-                    found_acceptable_queue = True
-                    break
-                else:
-                    logger.debug("Not enough capacity to run %s on %s (remaining_capacity=%s)",
-                                 task.log_format, rampart_group.name, remaining_capacity)
-            if not found_acceptable_queue:
+            rampart_group = self.select_instance_group(task)
+            if rampart_group is None:
+                self.metrics.block('no_capacity')
+                reserved_group = self.placement.reserve(task.task_impact, self.get_preferred_group_names(task))
+                if reserved_group is not None:
+                    logger.debug("Reserving capacity of group %s for %s", reserved_group, task.log_format)
                 logger.debug("%s couldn't be scheduled on graph, waiting for next cycle", task.log_format)
-
-    def fail_jobs_if_not_in_celery(self, node_jobs, active_tasks, celery_task_start_time,
-                                   isolated=False):
-        for task in node_jobs:
-            if (task.celery_task_id not in active_tasks and not hasattr(settings, 'IGNORE_CELERY_INSPECTOR')):
-                if isinstance(task, WorkflowJob):
-                    continue
-                if task.modified > celery_task_start_time:
-                    continue
-                new_status = 'failed'
-                if isolated:
-                    new_status = 'error'
-                task.status = new_status
-                if isolated:
-                    # TODO: cancel and reap artifacts of lost jobs from heartbeat
-                    task.job_explanation += ' '.join((
-                        'Task was marked as running in Tower but its ',
-                        'controller management daemon was not present in',
-                        'Celery, so it has been marked as failed.',
-                        'Task may still be running, but contactability is unknown.'
-                    ))
-                else:
-                    task.job_explanation += ' '.join((
-                        'Task was marked as running in Tower but was not present in',
-                        'Celery, so it has been marked as failed.',
-                    ))
-                try:
-                    task.save(update_fields=['status', 'job_explanation'])
-                except DatabaseError:
-                    logger.error("Task {} DB error in marking failed. Job possibly deleted.".format(task.log_format))
-                    continue
-                awx_tasks._send_notification_templates(task, 'failed')
-                task.websocket_emit_status(new_status)
-                logger.error("{}Task {} has no record in celery. Marking as failed".format(
-                    'Isolated ' if isolated else '', task.log_format))
+                continue
+            logger.debug("Starting %s in group %s (remaining_capacity=%s)",
+                         task.log_format, rampart_group.name, self.get_remaining_capacity(rampart_group.name))
+            self.graph[rampart_group.name]['graph'].add_job(task)
+            self.start_task(task, rampart_group, task.get_jobs_fail_chain())
+
+    def fail_lost_tasks(self, lost_tasks, isolated_nodes):
+        for task in lost_tasks:
+            isolated = task.execution_node in isolated_nodes
+            new_status = 'failed'
+            if isolated:
+                new_status = 'error'
+            task.status = new_status
+            if isolated:
+                # TODO: cancel and reap artifacts of lost jobs from heartbeat
+                task.job_explanation += ' '.join((
+                    'Task was marked as running in Tower but its',
+                    'controller management daemon stopped renewing its',
+                    'lease, so it has been marked as failed.',
+                    'Task may still be running, but contactability is unknown.'
+                ))
+            else:
+                task.job_explanation += ' '.join((
+                    'Task was marked as running in Tower but its worker',
+                    'stopped renewing its lease, so it has been marked as failed.',
+                ))
+            try:
+                task.save(update_fields=['status', 'job_explanation'])
+            except DatabaseError:
+                logger.error("Task {} DB error in marking failed. Job possibly deleted.".format(task.log_format))
+                continue
+            awx_tasks._send_notification_templates(task, 'failed')
+            task.websocket_emit_status(new_status)
+            logger.error("{}Task {} lease expired on {}. Marking as failed".format(
+                'Isolated ' if isolated else '', task.log_format, task.execution_node or 'no node'))
 
     def cleanup_inconsistent_celery_tasks(self):
         '''
         Rectify tower db <-> celery inconsistent view of jobs state
+
+        Workers renew a lease on every task they run (see
+        BaseTask.acquire_lease), so lost tasks are found with one query
+        instead of a broadcast to every celery worker.
         '''
         last_cleanup = cache.get('last_celery_task_cleanup') or datetime.min.replace(tzinfo=utc)
         if (tz_now() - last_cleanup).seconds < settings.AWX_INCONSISTENT_TASK_INTERVAL:
             return
 
         logger.debug("Failing inconsistent running jobs.")
-        celery_task_start_time = tz_now()
-        active_task_queues, active_queues = self.get_active_tasks()
         cache.set('last_celery_task_cleanup', tz_now())
 
-        if active_queues is None:
-            logger.error('Failed to retrieve active tasks from celery')
-            return None
-
-        '''
-        Only consider failing tasks on instances for which we obtained a task 
-        list from celery for.
-        '''
-        running_tasks, waiting_tasks = self.get_running_tasks()
-        all_celery_task_ids = []
-        for node, node_jobs in active_queues.iteritems():
-            all_celery_task_ids.extend(node_jobs)
-
-        self.fail_jobs_if_not_in_celery(waiting_tasks, all_celery_task_ids, celery_task_start_time)
-
-        for node, node_jobs in running_tasks.iteritems():
-            isolated = False
-            if node in active_queues:
-                active_tasks = active_queues[node]
-            else:
-                '''
-                Node task list not found in celery. We may branch into cases:
-                 - instance is unknown to tower, system is improperly configured
-                 - instance is reported as down, then fail all jobs on the node
-                 - instance is an isolated node, then check running tasks
-                   among all allowed controller nodes for management process
-                 - valid healthy instance not included in celery task list
-                   probably a netsplit case, leave it alone
-                '''
-                instance = Instance.objects.filter(hostname=node).first()
-
-                if instance is None:
-                    logger.error("Execution node Instance {} not found in database. "
-                                 "The node is currently executing jobs {}".format(
-                                     node, [j.log_format for j in node_jobs]))
-                    active_tasks = []
-                elif instance.capacity == 0:
-                    active_tasks = []
-                elif instance.rampart_groups.filter(controller__isnull=False).exists():
-                    active_tasks = all_celery_task_ids
-                    isolated = True
-                else:
-                    continue
-
-            self.fail_jobs_if_not_in_celery(
-                node_jobs, active_tasks, celery_task_start_time,
-                isolated=isolated
-            )
+        lost_tasks = self.get_lost_tasks()
+        if lost_tasks:
+            isolated_nodes = set(Instance.objects.filter(rampart_groups__controller__isnull=False)
+                                                 .values_list('hostname', flat=True))
+            self.fail_lost_tasks(lost_tasks, isolated_nodes)
+        TaskLease.objects.filter(expires__lt=tz_now()).delete()
 
     def calculate_capacity_consumed(self, tasks):
         self.graph = InstanceGroup.objects.capacity_values(tasks=tasks, graph=self.graph)
 
+    def get_ig_ig_mapping(self):
+        return InstanceGroup.objects.capacity_mapping()[1]
+
     def would_exceed_capacity(self, task, instance_group):
-        current_capacity = self.graph[instance_group]['consumed_capacity']
-        capacity_total = self.graph[instance_group]['capacity_total']
-        if current_capacity == 0:
-            return False
-        return (task.task_impact + current_capacity > capacity_total)
+        return self.placement.would_exceed_capacity(task.task_impact, instance_group)
 
     def consume_capacity(self, task, instance_group):
         logger.debug('%s consumed %s capacity units from %s with prior total of %s',
                      task.log_format, task.task_impact, instance_group,
                      self.graph[instance_group]['consumed_capacity'])
-        self.graph[instance_group]['consumed_capacity'] += task.task_impact
+        self.placement.consume(task.task_impact, instance_group)
 
     def get_remaining_capacity(self, instance_group):
-        return (self.graph[instance_group]['capacity_total'] - self.graph[instance_group]['consumed_capacity'])
+        return self.placement.get_remaining_capacity(instance_group)
 
     def process_tasks(self, all_sorted_tasks):
+        UnifiedJob.prefetch_task_impact(all_sorted_tasks)
+
         running_tasks = filter(lambda t: t.status in ['waiting', 'running'], all_sorted_tasks)
+        self.metrics.count('tasks_running', len(running_tasks))
 
-        self.calculate_capacity_consumed(running_tasks)
+        with self.metrics.phase('calculate_capacity'):
+            self.calculate_capacity_consumed(running_tasks)
+            if getattr(settings, 'AWX_TASK_MANAGER_PLACEMENT', 'greedy') == 'greedy':
+                self.placement = get_placement(self.graph)
+            else:
+                self.placement = get_placement(self.graph, ig_ig_mapping=self.get_ig_ig_mapping())
 
-        self.process_running_tasks(running_tasks)
+        with self.metrics.phase('process_running_tasks'):
+            self.process_running_tasks(running_tasks)
 
         pending_tasks = filter(lambda t: t.status in 'pending', all_sorted_tasks)
-        self.process_pending_tasks(pending_tasks)
+        self.metrics.count('tasks_pending', len(pending_tasks))
+        with self.metrics.phase('order_pending_tasks'):
+            pending_tasks = self.policy.order(pending_tasks, running_tasks, self.get_primary_instance_group)
+        with self.metrics.phase('process_pending_tasks'):
+            self.process_pending_tasks(pending_tasks)
 
     def _schedule(self):
         finished_wfjs = []
-        all_sorted_tasks = self.get_tasks()
+        with self.metrics.phase('get_tasks'):
+            all_sorted_tasks = self.get_tasks()
+        self.metrics.count('tasks', len(all_sorted_tasks))
         if len(all_sorted_tasks) > 0:
-            # TODO: Deal with
-            # latest_project_updates = self.get_latest_project_update_tasks(all_sorted_tasks)
-            # self.process_latest_project_updates(latest_project_updates)
+            with self.metrics.phase('workflows'):
+                running_workflow_tasks = self.get_running_workflow_jobs()
+                # One graph per workflow job, shared by both passes
+                workflow_dags = self.get_workflow_dags(running_workflow_tasks)
+                finished_wfjs = self.process_finished_workflow_jobs(running_workflow_tasks, workflow_dags)
 
-            # latest_inventory_updates = self.get_latest_inventory_update_tasks(all_sorted_tasks)
-            # self.process_latest_inventory_updates(latest_inventory_updates)
-
-            self.all_inventory_sources = self.get_inventory_source_tasks(all_sorted_tasks)
-
-            running_workflow_tasks = self.get_running_workflow_jobs()
-            finished_wfjs = self.process_finished_workflow_jobs(running_workflow_tasks)
-
-            self.spawn_workflow_graph_jobs(running_workflow_tasks)
+                self.spawn_workflow_graph_jobs(running_workflow_tasks, workflow_dags)
+            self.metrics.count('workflows_running', len(running_workflow_tasks))
+            self.metrics.count('workflows_finished', len(finished_wfjs))
 
             self.process_tasks(all_sorted_tasks)
         return finished_wfjs
 
     def schedule(self):
+        self.metrics.begin()
+        try:
+            self._schedule_locked()
+        finally:
+            self.metrics.end()
+        if self.metrics.acquired:
+            self.metrics.publish()
+
+    def _schedule_locked(self):
         with transaction.atomic():
             # Lock
-            with advisory_lock('task_manager_lock', wait=False) as acquired:
+            with self.metrics.lock(), advisory_lock('task_manager_lock', wait=False) as acquired:
+                self.metrics.acquire(acquired)
                 if acquired is False:
                     logger.debug("Not running scheduler, another task holds lock")
                     return
                 logger.debug("Starting Scheduler")
 
-                self.cleanup_inconsistent_celery_tasks()
-                finished_wfjs = self._schedule()
+                with self.metrics.phase('cleanup_inconsistent_tasks'):
+                    self.cleanup_inconsistent_celery_tasks()
+                try:
+                    finished_wfjs = self._schedule()
+                except Exception:
+                    # The cached tasks may have been modified in memory by a
+                    # transaction that is about to be rolled back.
+                    task_cache.reset()
+                    raise
 
                 # Operations whose queries rely on modifications made during the atomic scheduling session
-                for wfj in WorkflowJob.objects.filter(id__in=finished_wfjs):
-                    awx_tasks._send_notification_templates(wfj, 'succeeded' if wfj.status == 'successful' else 'failed')
+                with self.metrics.phase('workflow_notifications'):
+                    for wfj in WorkflowJob.objects.filter(id__in=finished_wfjs):
+                        awx_tasks._send_notification_templates(wfj, 'succeeded' if wfj.status == 'successful' else 'failed')
@@ -1,15 +1,22 @@
-
 # Python
 import logging
 
 # Celery
 from celery import Task, task
 
+# Django
+from django.conf import settings
+from django.core.cache import cache
+
 # AWX
 from awx.main.scheduler import TaskManager
+from awx.main.scheduler.metrics import get_schedule_interval
 
 logger = logging.getLogger('awx.main.scheduler')
 
+TRIGGER_PENDING_KEY = 'task_manager_trigger_pending'
+TRIGGER_GENERATION_KEY = 'task_manager_trigger_generation'
+
 # TODO: move logic to UnifiedJob model and use bind=True feature of celery.
 # Would we need the request loop then? I think so. Even if we get the in-memory
 # updated model, the call to schedule() may get stale data.
@@ -21,14 +28,58 @@ class LogErrorsTask(Task):
         super(LogErrorsTask, self).on_failure(exc, task_id, args, kwargs, einfo)
 
 
-@task
-def run_job_launch(job_id):
-    TaskManager().schedule()
+def get_trigger_generation():
+    return cache.get(TRIGGER_GENERATION_KEY, 0)
 
 
-@task
-def run_job_complete(job_id):
-    TaskManager().schedule()
+class DebouncedScheduleTask(Task):
+    '''
+    Task manager run requested by a job launch or completion.
+
+    Use trigger() rather than delay(): every trigger bumps a generation
+    counter, but only the first one in AWX_TASK_MANAGER_TRIGGER_WINDOW
+    seconds queues a message, so a burst of launches or completions results
+    in a single cycle. If triggers arrive while that cycle runs, it is run
+    once more when it is done.
+    '''
+
+    abstract = True
+
+    def trigger(self, job_id):
+        if not cache.add(TRIGGER_GENERATION_KEY, 1, None):
+            try:
+                cache.incr(TRIGGER_GENERATION_KEY)
+            except ValueError:
+                # Evicted between add() and incr()
+                cache.set(TRIGGER_GENERATION_KEY, 1, None)
+        window = getattr(settings, 'AWX_TASK_MANAGER_TRIGGER_WINDOW', 0)
+        # Should the message be lost, the periodic run_task_manager covers for
+        # it, so there is no use holding back triggers for longer than that.
+        timeout = window + (get_schedule_interval() or 60)
+        if cache.add(TRIGGER_PENDING_KEY, job_id, timeout):
+            self.apply_async(args=[job_id], countdown=window or None)
+        else:
+            logger.debug('Task manager run already requested, coalescing trigger for job %s.', job_id)
+
+    def schedule(self):
+        generation = get_trigger_generation()
+        TaskManager().schedule()
+        # Triggers from now on queue a new message ...
+        cache.delete(TRIGGER_PENDING_KEY)
+        # ... and those that arrived during the cycle get one more pass.
+        if get_trigger_generation() != generation:
+            logger.debug('Task manager triggered while running, scheduling again.')
+            TaskManager().schedule()
+
+
+@task(base=DebouncedScheduleTask, bind=True)
+def run_job_launch(self, job_id):
+    self.schedule()
+
+
+@task(base=DebouncedScheduleTask, bind=True)
+def run_job_complete(self, job_id):
+    self.schedule()
 
 
 @task(base=LogErrorsTask)
@@ -20,11 +20,11 @@ from crum.signals import current_user_getter
 from awx.main.models import * # noqa
 from awx.api.serializers import * # noqa
 from awx.main.utils import model_instance_diff, model_to_dict, camelcase_to_underscore
-from awx.main.utils import ignore_inventory_computed_fields, ignore_inventory_group_removal, _inventory_updates
+from awx.main.utils import ignore_inventory_computed_fields, ignore_inventory_group_removal, _inventory_updates, truncate_stdout
 from awx.main.tasks import update_inventory_computed_fields
 from awx.main.fields import is_implicit_parent
 
-from awx.main.consumers import emit_channel_notification
+from awx.main.consumers import emit_channel_notification, event_emitter
 
 __all__ = []
 
@@ -41,17 +41,50 @@ def get_current_user_or_none():
     return u
 
 
+def job_event_websocket_data(instance):
+    '''
+    The fields of JobEventSerializer that websocket listeners use, built
+    without the serializer's per-event queries for related links and
+    summary fields.
+    '''
+    return {
+        'id': instance.id,
+        'type': 'job_event',
+        'url': instance.get_absolute_url(),
+        'created': instance.created.isoformat(),
+        'modified': instance.modified.isoformat(),
+        'job': instance.job_id,
+        'event': instance.event,
+        'event_name': instance.event,
+        'counter': instance.counter,
+        'event_display': instance.get_event_display2(),
+        'event_data': instance.event_data,
+        'event_level': instance.event_level,
+        'failed': instance.failed,
+        'changed': instance.changed,
+        'uuid': instance.uuid,
+        'parent_uuid': instance.parent_uuid,
+        'host': instance.host_id,
+        'host_name': instance.host_name,
+        'parent': instance.parent_id,
+        'playbook': instance.playbook,
+        'play': instance.play,
+        'task': instance.task,
+        'role': instance.role,
+        'stdout': instance.stdout if instance.event.startswith('playbook_on') else
+        truncate_stdout(instance.stdout, settings.EVENT_STDOUT_MAX_BYTES_DISPLAY),
+        'start_line': instance.start_line,
+        'end_line': instance.end_line,
+        'verbosity': instance.verbosity,
+        'group_name': 'job_events',
+    }
+
+
 def emit_job_event_detail(sender, **kwargs):
     instance = kwargs['instance']
     created = kwargs['created']
     if created:
-        event_serialized = JobEventSerializer(instance).data
-        event_serialized['id'] = instance.id
-        event_serialized["created"] = event_serialized["created"].isoformat()
-        event_serialized["modified"] = event_serialized["modified"].isoformat()
-        event_serialized["event_name"] = instance.event
-        event_serialized["group_name"] = "job_events"
-        emit_channel_notification('job_events-' + str(instance.job.id), event_serialized)
+        event_emitter.send('job_events-' + str(instance.job_id), job_event_websocket_data(instance))
 
 
 def emit_ad_hoc_command_event_detail(sender, **kwargs):
@@ -2,7 +2,6 @@
 # All Rights Reserved.
 
 # Python
-import codecs
 from collections import OrderedDict
 import ConfigParser
 import cStringIO
@@ -15,6 +14,7 @@ import re
 import shutil
 import stat
 import tempfile
+import threading
 import time
 import traceback
 import urlparse
@@ -33,7 +33,7 @@ from celery.signals import celeryd_init, worker_process_init, worker_shutdown
 
 # Django
 from django.conf import settings
-from django.db import transaction, DatabaseError, IntegrityError
+from django.db import connection, transaction, DatabaseError, IntegrityError
 from django.utils.timezone import now, timedelta
 from django.utils.encoding import smart_str
 from django.core.mail import send_mail
@@ -52,6 +52,7 @@ from awx.main.models import * # noqa
 from awx.main.models.unified_jobs import ACTIVE_STATES
 from awx.main.exceptions import AwxTaskError, TaskCancel, TaskError
 from awx.main.queue import CallbackQueueDispatcher
+from awx.main.redact import Redactor
 from awx.main.expect import run, isolated_manager
 from awx.main.utils import (get_ansible_version, get_ssh_version, decrypt_field, update_scm_url,
                             check_proot_installed, build_proot_temp_dir, get_licenser,
@@ -59,6 +60,7 @@ from awx.main.utils import (get_ansible_version, get_ssh_version, decrypt_field,
                             parse_yaml_or_json, ignore_inventory_computed_fields, ignore_inventory_group_removal,
                             get_type_for_model)
 from awx.main.utils.reload import restart_local_services, stop_local_services
+from awx.main.utils.stdout import StdoutWriter
 from awx.main.utils.handlers import configure_external_logger
 from awx.main.consumers import emit_channel_notification
 from awx.conf import settings_registry
@@ -66,6 +68,7 @@ from awx.conf import settings_registry
 __all__ = ['RunJob', 'RunSystemJob', 'RunProjectUpdate', 'RunInventoryUpdate',
            'RunAdHocCommand', 'handle_work_error', 'handle_work_success',
            'update_inventory_computed_fields', 'update_host_smart_inventory_memberships',
+           'finalize_job_stats',
            'send_notifications', 'run_administrative_checks', 'purge_old_stdout_files']
 
 HIDDEN_PASSWORD = '**********'
@@ -354,7 +357,7 @@ def handle_work_success(self, result, task_actual):
     _send_notification_templates(instance, 'succeeded')
 
     from awx.main.scheduler.tasks import run_job_complete
-    run_job_complete.delay(instance.id)
+    run_job_complete.trigger(instance.id)
 
 
 @task(bind=True, queue='tower', base=LogErrorsTask)
@@ -396,7 +399,7 @@ def handle_work_error(self, task_id, subtasks=None):
     # completion event for each job here.
     if first_instance:
         from awx.main.scheduler.tasks import run_job_complete
-        run_job_complete.delay(first_instance.id)
+        run_job_complete.trigger(first_instance.id)
         pass
 
 
@@ -420,6 +423,18 @@ def update_inventory_computed_fields(inventory_id, should_update_hosts=True):
         raise
 
 
+@task(queue='tower', base=LogErrorsTask)
+def finalize_job_stats(job_event_ids):
+    '''
+    Apply playbook_on_stats events to their jobs, away from the callback
+    receiver workers.
+    '''
+    for job_event in JobEvent.objects.filter(pk__in=job_event_ids, event='playbook_on_stats').select_related('job'):
+        # The host summaries of the job are replaced, all or nothing
+        with transaction.atomic():
+            job_event.update_from_stats()
+
+
 @task(queue='tower', base=LogErrorsTask)
 def update_host_smart_inventory_memberships():
     try:
@@ -481,6 +496,22 @@ def with_path_cleanup(f):
     return _wrapped
 
 
+def renew_task_lease(unified_job_id, stop_renewing):
+    '''
+    Renew the lease of a task every AWX_TASK_LEASE_RENEW_INTERVAL seconds,
+    until stop_renewing is set or the task is no longer waiting or running.
+    '''
+    try:
+        while not stop_renewing.wait(settings.AWX_TASK_LEASE_RENEW_INTERVAL):
+            try:
+                if not TaskLease.objects.renew(unified_job_id):
+                    break
+            except DatabaseError:
+                logger.exception('Failed to renew the lease of unified job %s', unified_job_id)
+    finally:
+        connection.close()
+
+
 class BaseTask(LogErrorsTask):
     name = None
     model = None
@@ -488,11 +519,29 @@ class BaseTask(LogErrorsTask):
     cleanup_paths = []
     proot_show_paths = []
 
+    def acquire_lease(self, instance):
+        '''
+        Take the lease on a task that starts running and keep renewing it
+        from a background thread, so the task manager knows a worker still
+        owns the task. Returns the event that stops the renewals.
+        '''
+        TaskLease.objects.acquire(instance)
+        stop_renewing = threading.Event()
+        renewer = threading.Thread(target=renew_task_lease, args=(instance.pk, stop_renewing))
+        renewer.daemon = True
+        renewer.start()
+        return stop_renewing
+
+    def release_lease(self, pk, stop_renewing):
+        stop_renewing.set()
+        TaskLease.objects.filter(unified_job_id=pk).delete()
+
     def update_model(self, pk, _attempt=0, **updates):
         """Reload the model instance from the database and update the
         given fields.
         """
         output_replacements = updates.pop('output_replacements', None) or []
+        redactor = Redactor(output_replacements)
 
         try:
             with transaction.atomic():
@@ -502,11 +551,14 @@ class BaseTask(LogErrorsTask):
                 # Update the appropriate fields and save the model
                 # instance, then return the new instance.
                 if updates:
+                    # CreatedModifiedModel.save() leaves modified alone when
+                    # it is in update_fields; the task manager picks up status
+                    # changes by it.
+                    instance.modified = now()
                     update_fields = ['modified']
                     for field, value in updates.items():
                         if field in ('result_stdout', 'result_traceback'):
-                            for srch, repl in output_replacements:
-                                value = value.replace(srch, repl)
+                            value = redactor.redact(value)
                         setattr(instance, field, value)
                         update_fields.append(field)
                         if field == 'status':
@@ -745,7 +797,11 @@ class BaseTask(LogErrorsTask):
         if not os.path.exists(settings.JOBOUTPUT_ROOT):
             os.makedirs(settings.JOBOUTPUT_ROOT)
         stdout_filename = os.path.join(settings.JOBOUTPUT_ROOT, "%d-%s.out" % (instance.pk, str(uuid.uuid1())))
-        stdout_handle = codecs.open(stdout_filename, 'w', encoding='utf-8')
+        if settings.STDOUT_COMPRESSION:
+            stdout_filename += '.gz'
+        stdout_handle = StdoutWriter(stdout_filename, index_interval=settings.STDOUT_INDEX_INTERVAL,
+                                     compress=settings.STDOUT_COMPRESSION,
+                                     block_size=settings.STDOUT_COMPRESSION_BLOCK_SIZE)
         assert stdout_handle.name == stdout_filename
         return stdout_handle
 
@@ -773,140 +829,143 @@ class BaseTask(LogErrorsTask):
         if isolated_host is not None:
             execution_node = isolated_host
         instance = self.update_model(pk, status='running', execution_node=execution_node)
-
-        instance.websocket_emit_status("running")
-        status, rc, tb = 'error', None, ''
-        output_replacements = []
-        extra_update_fields = {}
+        lease = self.acquire_lease(instance)
         try:
-            kwargs['isolated'] = isolated_host is not None
-            self.pre_run_hook(instance, **kwargs)
-            if instance.cancel_flag:
-                instance = self.update_model(instance.pk, status='canceled')
-            if instance.status != 'running':
-                if hasattr(settings, 'CELERY_UNIT_TEST'):
-                    return
+            instance.websocket_emit_status("running")
+            status, rc, tb = 'error', None, ''
+            output_replacements = []
+            extra_update_fields = {}
+            try:
+                kwargs['isolated'] = isolated_host is not None
+                self.pre_run_hook(instance, **kwargs)
+                if instance.cancel_flag:
+                    instance = self.update_model(instance.pk, status='canceled')
+                if instance.status != 'running':
+                    if hasattr(settings, 'CELERY_UNIT_TEST'):
+                        return
+                    else:
+                        # Stop the task chain and prevent starting the job if it has
+                        # already been canceled.
+                        instance = self.update_model(pk)
+                        status = instance.status
+                        raise RuntimeError('not starting %s task' % instance.status)
+
+                if not os.path.exists(settings.AWX_PROOT_BASE_PATH):
+                    raise RuntimeError('AWX_PROOT_BASE_PATH=%s does not exist' % settings.AWX_PROOT_BASE_PATH)
+                # Fetch ansible version once here to support version-dependent features.
+                kwargs['ansible_version'] = get_ansible_version()
+                kwargs['private_data_dir'] = self.build_private_data_dir(instance, **kwargs)
+                # May have to serialize the value
+                kwargs['private_data_files'] = self.build_private_data_files(instance, **kwargs)
+                kwargs['passwords'] = self.build_passwords(instance, **kwargs)
+                kwargs['proot_show_paths'] = self.proot_show_paths
+                args = self.build_args(instance, **kwargs)
+                safe_args = self.build_safe_args(instance, **kwargs)
+                output_replacements = self.build_output_replacements(instance, **kwargs)
+                cwd = self.build_cwd(instance, **kwargs)
+                env = self.build_env(instance, **kwargs)
+                safe_env = self.build_safe_env(env, **kwargs)
+
+                # handle custom injectors specified on the CredentialType
+                if hasattr(instance, 'all_credentials'):
+                    credentials = instance.all_credentials
+                elif hasattr(instance, 'credential'):
+                    credentials = [instance.credential]
                 else:
-                    # Stop the task chain and prevent starting the job if it has
-                    # already been canceled.
-                    instance = self.update_model(pk)
-                    status = instance.status
-                    raise RuntimeError('not starting %s task' % instance.status)
-
-            if not os.path.exists(settings.AWX_PROOT_BASE_PATH):
-                raise RuntimeError('AWX_PROOT_BASE_PATH=%s does not exist' % settings.AWX_PROOT_BASE_PATH)
-            # Fetch ansible version once here to support version-dependent features.
-            kwargs['ansible_version'] = get_ansible_version()
-            kwargs['private_data_dir'] = self.build_private_data_dir(instance, **kwargs)
-            # May have to serialize the value
-            kwargs['private_data_files'] = self.build_private_data_files(instance, **kwargs)
-            kwargs['passwords'] = self.build_passwords(instance, **kwargs)
-            kwargs['proot_show_paths'] = self.proot_show_paths
-            args = self.build_args(instance, **kwargs)
-            safe_args = self.build_safe_args(instance, **kwargs)
-            output_replacements = self.build_output_replacements(instance, **kwargs)
-            cwd = self.build_cwd(instance, **kwargs)
-            env = self.build_env(instance, **kwargs)
-            safe_env = self.build_safe_env(env, **kwargs)
-
-            # handle custom injectors specified on the CredentialType
-            if hasattr(instance, 'all_credentials'):
-                credentials = instance.all_credentials
-            elif hasattr(instance, 'credential'):
-                credentials = [instance.credential]
-            else:
-                credentials = []
-            for credential in credentials:
-                if credential:
-                    credential.credential_type.inject_credential(
-                        credential, env, safe_env, args, safe_args, kwargs['private_data_dir']
+                    credentials = []
+                for credential in credentials:
+                    if credential:
+                        credential.credential_type.inject_credential(
+                            credential, env, safe_env, args, safe_args, kwargs['private_data_dir']
+                        )
+
+                if isolated_host is None:
+                    stdout_handle = self.get_stdout_handle(instance)
+                else:
+                    base_handle = super(self.__class__, self).get_stdout_handle(instance)
+                    stdout_handle = isolated_manager.IsolatedManager.wrap_stdout_handle(
+                        instance, kwargs['private_data_dir'], base_handle,
+                        event_data_key=self.event_data_key)
+                if self.should_use_proot(instance, **kwargs):
+                    if not check_proot_installed():
+                        raise RuntimeError('bubblewrap is not installed')
+                    kwargs['proot_temp_dir'] = build_proot_temp_dir()
+                    self.cleanup_paths.append(kwargs['proot_temp_dir'])
+                    args = wrap_args_with_proot(args, cwd, **kwargs)
+                    safe_args = wrap_args_with_proot(safe_args, cwd, **kwargs)
+                # If there is an SSH key path defined, wrap args with ssh-agent.
+                ssh_key_path = self.get_ssh_key_path(instance, **kwargs)
+                # If we're executing on an isolated host, don't bother adding the
+                # key to the agent in this environment
+                if ssh_key_path and isolated_host is None:
+                    ssh_auth_sock = os.path.join(kwargs['private_data_dir'], 'ssh_auth.sock')
+                    args = run.wrap_args_with_ssh_agent(args, ssh_key_path, ssh_auth_sock)
+                    safe_args = run.wrap_args_with_ssh_agent(safe_args, ssh_key_path, ssh_auth_sock)
+                instance = self.update_model(pk, job_args=json.dumps(safe_args),
+                                             job_cwd=cwd, job_env=safe_env, result_stdout_file=stdout_handle.name)
+
+                expect_passwords = {}
+                for k, v in self.get_password_prompts().items():
+                    expect_passwords[k] = kwargs['passwords'].get(v, '') or ''
+                _kw = dict(
+                    expect_passwords=expect_passwords,
+                    cancelled_callback=lambda: self.update_model(instance.pk).cancel_flag,
+                    job_timeout=self.get_instance_timeout(instance),
+                    idle_timeout=self.get_idle_timeout(),
+                    extra_update_fields=extra_update_fields,
+                    pexpect_timeout=getattr(settings, 'PEXPECT_TIMEOUT', 5),
+                    proot_cmd=getattr(settings, 'AWX_PROOT_CMD', 'bwrap'),
+                )
+                instance = self.update_model(instance.pk, output_replacements=output_replacements)
+                if isolated_host:
+                    manager_instance = isolated_manager.IsolatedManager(
+                        args, cwd, env, stdout_handle, ssh_key_path, **_kw
+                    )
+                    status, rc = manager_instance.run(instance, isolated_host,
+                                                      kwargs['private_data_dir'],
+                                                      kwargs.get('proot_temp_dir'))
+                else:
+                    status, rc = run.run_pexpect(
+                        args, cwd, env, stdout_handle, **_kw
                     )
 
-            if isolated_host is None:
-                stdout_handle = self.get_stdout_handle(instance)
-            else:
-                base_handle = super(self.__class__, self).get_stdout_handle(instance)
-                stdout_handle = isolated_manager.IsolatedManager.wrap_stdout_handle(
-                    instance, kwargs['private_data_dir'], base_handle,
-                    event_data_key=self.event_data_key)
-            if self.should_use_proot(instance, **kwargs):
-                if not check_proot_installed():
-                    raise RuntimeError('bubblewrap is not installed')
-                kwargs['proot_temp_dir'] = build_proot_temp_dir()
-                self.cleanup_paths.append(kwargs['proot_temp_dir'])
-                args = wrap_args_with_proot(args, cwd, **kwargs)
-                safe_args = wrap_args_with_proot(safe_args, cwd, **kwargs)
-            # If there is an SSH key path defined, wrap args with ssh-agent.
-            ssh_key_path = self.get_ssh_key_path(instance, **kwargs)
-            # If we're executing on an isolated host, don't bother adding the
-            # key to the agent in this environment
-            if ssh_key_path and isolated_host is None:
-                ssh_auth_sock = os.path.join(kwargs['private_data_dir'], 'ssh_auth.sock')
-                args = run.wrap_args_with_ssh_agent(args, ssh_key_path, ssh_auth_sock)
-                safe_args = run.wrap_args_with_ssh_agent(safe_args, ssh_key_path, ssh_auth_sock)
-            instance = self.update_model(pk, job_args=json.dumps(safe_args),
-                                         job_cwd=cwd, job_env=safe_env, result_stdout_file=stdout_handle.name)
-
-            expect_passwords = {}
-            for k, v in self.get_password_prompts().items():
-                expect_passwords[k] = kwargs['passwords'].get(v, '') or ''
-            _kw = dict(
-                expect_passwords=expect_passwords,
-                cancelled_callback=lambda: self.update_model(instance.pk).cancel_flag,
-                job_timeout=self.get_instance_timeout(instance),
-                idle_timeout=self.get_idle_timeout(),
-                extra_update_fields=extra_update_fields,
-                pexpect_timeout=getattr(settings, 'PEXPECT_TIMEOUT', 5),
-                proot_cmd=getattr(settings, 'AWX_PROOT_CMD', 'bwrap'),
-            )
-            instance = self.update_model(instance.pk, output_replacements=output_replacements)
-            if isolated_host:
-                manager_instance = isolated_manager.IsolatedManager(
-                    args, cwd, env, stdout_handle, ssh_key_path, **_kw
-                )
-                status, rc = manager_instance.run(instance, isolated_host,
-                                                  kwargs['private_data_dir'],
-                                                  kwargs.get('proot_temp_dir'))
-            else:
-                status, rc = run.run_pexpect(
-                    args, cwd, env, stdout_handle, **_kw
-                )
+            except Exception:
+                if status != 'canceled':
+                    tb = traceback.format_exc()
+                    if settings.DEBUG:
+                        logger.exception('%s Exception occurred while running task', instance.log_format)
+            finally:
+                try:
+                    stdout_handle.flush()
+                    stdout_handle.close()
+                except Exception:
+                    pass
 
-        except Exception:
-            if status != 'canceled':
-                tb = traceback.format_exc()
-                if settings.DEBUG:
-                    logger.exception('%s Exception occurred while running task', instance.log_format)
-        finally:
             try:
-                stdout_handle.flush()
-                stdout_handle.close()
+                self.post_run_hook(instance, status, **kwargs)
             except Exception:
-                pass
+                logger.exception('{} Post run hook errored.'.format(instance.log_format))
+            instance = self.update_model(pk)
+            if instance.cancel_flag:
+                status = 'canceled'
 
-        try:
-            self.post_run_hook(instance, status, **kwargs)
-        except Exception:
-            logger.exception('{} Post run hook errored.'.format(instance.log_format))
-        instance = self.update_model(pk)
-        if instance.cancel_flag:
-            status = 'canceled'
-
-        instance = self.update_model(pk, status=status, result_traceback=tb,
-                                     output_replacements=output_replacements,
-                                     **extra_update_fields)
-        try:
-            self.final_run_hook(instance, status, **kwargs)
-        except:
-            logger.exception('%s Final run hook errored.', instance.log_format)
-        instance.websocket_emit_status(status)
-        if status != 'successful' and not hasattr(settings, 'CELERY_UNIT_TEST'):
-            # Raising an exception will mark the job as 'failed' in celery
-            # and will stop a task chain from continuing to execute
-            if status == 'canceled':
-                raise TaskCancel(instance, rc)
-            else:
-                raise TaskError(instance, rc)
+            instance = self.update_model(pk, status=status, result_traceback=tb,
+                                         output_replacements=output_replacements,
+                                         **extra_update_fields)
+            try:
+                self.final_run_hook(instance, status, **kwargs)
+            except:
+                logger.exception('%s Final run hook errored.', instance.log_format)
+            instance.websocket_emit_status(status)
+            if status != 'successful' and not hasattr(settings, 'CELERY_UNIT_TEST'):
+                # Raising an exception will mark the job as 'failed' in celery
+                # and will stop a task chain from continuing to execute
+                if status == 'canceled':
+                    raise TaskCancel(instance, rc)
+                else:
+                    raise TaskError(instance, rc)
+        finally:
+            self.release_lease(pk, lease)
 
     def get_ssh_key_path(self, instance, **kwargs):
         '''
@@ -1026,7 +1085,6 @@ class RunJob(BaseTask):
             env['AWX_HOST'] = settings.TOWER_URL_BASE
             env['CALLBACK_QUEUE'] = settings.CALLBACK_QUEUE
             env['CALLBACK_CONNECTION'] = settings.BROKER_URL
-        env['CACHE'] = settings.CACHES['default']['LOCATION'] if 'LOCATION' in settings.CACHES['default'] else ''
         if getattr(settings, 'JOB_CALLBACK_DEBUG', False):
             env['JOB_CALLBACK_DEBUG'] = '2'
         elif settings.DEBUG:
@@ -1211,22 +1269,20 @@ class RunJob(BaseTask):
         '''
         stdout_handle = super(RunJob, self).get_stdout_handle(instance)
 
+        close_callback = None
         if getattr(settings, 'USE_CALLBACK_QUEUE', False):
             dispatcher = CallbackQueueDispatcher()
+            close_callback = dispatcher.flush
 
             def job_event_callback(event_data):
                 event_data.setdefault(self.event_data_key, instance.id)
-                if 'uuid' in event_data:
-                    cache_event = cache.get('ev-{}'.format(event_data['uuid']), None)
-                    if cache_event is not None:
-                        event_data.update(cache_event)
                 dispatcher.dispatch(event_data)
         else:
             def job_event_callback(event_data):
                 event_data.setdefault(self.event_data_key, instance.id)
                 JobEvent.create_from_data(**event_data)
 
-        return OutputEventFilter(stdout_handle, job_event_callback)
+        return OutputEventFilter(stdout_handle, job_event_callback, close_callback=close_callback)
 
     def should_use_proot(self, instance, **kwargs):
         '''
@@ -2075,7 +2131,6 @@ class RunAdHocCommand(BaseTask):
         env['CALLBACK_QUEUE'] = settings.CALLBACK_QUEUE
         env['CALLBACK_CONNECTION'] = settings.BROKER_URL
         env['ANSIBLE_SFTP_BATCH_MODE'] = 'False'
-        env['CACHE'] = settings.CACHES['default']['LOCATION'] if 'LOCATION' in settings.CACHES['default'] else ''
         if getattr(settings, 'JOB_CALLBACK_DEBUG', False):
             env['JOB_CALLBACK_DEBUG'] = '2'
         elif settings.DEBUG:
@@ -2166,22 +2221,20 @@ class RunAdHocCommand(BaseTask):
         '''
         stdout_handle = super(RunAdHocCommand, self).get_stdout_handle(instance)
 
+        close_callback = None
         if getattr(settings, 'USE_CALLBACK_QUEUE', False):
             dispatcher = CallbackQueueDispatcher()
+            close_callback = dispatcher.flush
 
             def ad_hoc_command_event_callback(event_data):
                 event_data.setdefault(self.event_data_key, instance.id)
-                if 'uuid' in event_data:
-                    cache_event = cache.get('ev-{}'.format(event_data['uuid']), None)
-                    if cache_event is not None:
-                        event_data.update(cache_event)
                 dispatcher.dispatch(event_data)
         else:
             def ad_hoc_command_event_callback(event_data):
                 event_data.setdefault(self.event_data_key, instance.id)
                 AdHocCommandEvent.create_from_data(**event_data)
 
-        return OutputEventFilter(stdout_handle, ad_hoc_command_event_callback)
+        return OutputEventFilter(stdout_handle, ad_hoc_command_event_callback, close_callback=close_callback)
 
     def should_use_proot(self, instance, **kwargs):
         '''
@@ -0,0 +1,37 @@
+import pytest
+
+from awx.api.versioning import reverse
+from awx.main.scheduler.metrics import TaskManagerMetrics
+
+
+@pytest.fixture
+def recorded_cycle():
+    metrics = TaskManagerMetrics()
+    metrics.begin()
+    with metrics.phase('get_tasks'):
+        metrics.count('tasks', 3)
+    metrics.block('no_capacity')
+    metrics.end()
+    return metrics.publish()
+
+
+@pytest.mark.django_db
+def test_metrics_forbidden_for_normal_user(get, alice):
+    get(reverse('api:task_manager_metrics_view'), alice, expect=403)
+
+
+@pytest.mark.django_db
+def test_metrics_visible_to_system_auditor(get, system_auditor, recorded_cycle):
+    response = get(reverse('api:task_manager_metrics_view'), system_auditor, expect=200)
+    assert response.data['count'] == 1
+
+
+@pytest.mark.django_db
+def test_metrics_recent_cycles(get, admin, recorded_cycle):
+    response = get(reverse('api:task_manager_metrics_view'), admin, expect=200)
+    assert response.data['schedule_interval'] == 20
+    assert response.data['count'] == 1
+    cycle = response.data['results'][0]
+    assert cycle['counters'] == {'tasks': 3, 'tasks_blocked': 1}
+    assert cycle['blocked'] == {'no_capacity': 1}
+    assert cycle['phases']['get_tasks']['calls'] == 1
@@ -1,9 +1,11 @@
+import mock
 import pytest
 
 from awx.api.versioning import reverse
-from awx.main.models import UnifiedJob, ProjectUpdate, InventoryUpdate
+from awx.main.models import UnifiedJob, ProjectUpdate, InventoryUpdate, JobEvent
 from awx.main.tests.base import URI
 from awx.main.models.unified_jobs import ACTIVE_STATES
+from awx.main.utils.stdout import rendered_stdout_cache
 
 
 TEST_STDOUTS = []
@@ -25,6 +27,12 @@ TEST_STDOUTS.append({
 
 
 
+@pytest.fixture(autouse=True)
+def clear_rendered_stdout_cache(request):
+    rendered_stdout_cache.clear()
+    request.addfinalizer(rendered_stdout_cache.clear)
+
+
 @pytest.fixture
 def test_cases(project):
     ret = []
@@ -81,6 +89,40 @@ def test_job_redaction_disabled(get, format, content_type, negative_test_cases,
         assert test_data['uri'].password in content
 
 
+@pytest.mark.parametrize("format,expected", [
+    ('txt_download', 'ok: [web1]\nchanged: [web2]\n\nPLAY RECAP\n'),
+    ('ansi_download', '\x1b[0;32mok: [web1]\x1b[0m\n\x1b[0;33mchanged: [web2]\x1b[0m\n\nPLAY RECAP\n'),
+])
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+def test_job_stdout_download_from_events(emit, get, format, expected, job_factory, admin):
+    job = job_factory()
+    for start_line, stdout in enumerate([
+        '\x1b[0;32mok: [web1]\x1b[0m\r\n\x1b[0;33mchanged: [web2]\x1b[0m',
+        '',
+        'PLAY RECAP',
+    ]):
+        JobEvent.objects.create(job=job, event='verbose', stdout=stdout, start_line=start_line * 2)
+    response = get(reverse("api:job_stdout", kwargs={'pk': job.pk}) + "?format=" + format, user=admin, expect=200)
+    assert response.streaming
+    assert ''.join(response.streaming_content) == expected
+
+
+@pytest.mark.parametrize("status,renders", [('successful', 1), ('running', 2)])
+@pytest.mark.django_db
+def test_finished_job_stdout_rendered_once(get, status, renders, job_factory, admin):
+    job = job_factory(initial_state=status)
+    job.result_stdout_text = '\x1b[0;32mok: [web1]\x1b[0m\n'
+    job.save()
+    url = reverse("api:job_stdout", kwargs={'pk': job.pk}) + "?format=json&start_line=0&end_line=1"
+    with mock.patch('awx.api.views.ansiconv.to_html', return_value='<span>ok: [web1]</span>') as to_html:
+        for i in range(2):
+            response = get(url, user=admin, expect=200)
+            assert response.data['content'] == '<span>ok: [web1]</span>'
+    assert to_html.call_count == renders
+    assert len(rendered_stdout_cache) == (1 if status == 'successful' else 0)
+
+
 @pytest.mark.django_db
 def test_options_fields_choices(instance, options, user):
     url = reverse('api:unified_job_list')
@@ -0,0 +1,119 @@
+# Python
+from Queue import Queue
+import pytest
+
+# Django
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+# AWX
+from awx.main.management.commands.run_callback_receiver import CallbackBrokerWorker, HostIdCache
+from awx.main.models import Inventory, Job
+
+
+@pytest.fixture
+def jobs(organization):
+    inventories = []
+    for i in range(2):
+        inventory = Inventory.objects.create(name='inv-{}'.format(i), organization=organization)
+        for name in ('web1', 'web2'):
+            inventory.hosts.create(name=name)
+        inventories.append(inventory)
+    return [Job.objects.create(inventory=inv) for inv in inventories]
+
+
+@pytest.mark.django_db
+def test_host_cache_loads_inventory_once(jobs):
+    cache = HostIdCache(max_size=100)
+    web1 = jobs[0].inventory.hosts.get(name='web1')
+    with CaptureQueriesContext(connection) as queries:
+        assert cache.get_host_ids(jobs[0], ['web1', 'db1']) == {'web1': web1.id, 'db1': None}
+        assert len(queries) == 1
+        assert cache.get_host_ids(jobs[0], ['web1']) == {'web1': web1.id}
+        assert len(queries) == 1
+
+    # Names missing from the inventory are looked up again
+    db1 = jobs[0].inventory.hosts.create(name='db1')
+    assert cache.get_host_ids(jobs[0], ['db1']) == {'db1': db1.id}
+    assert cache.size == 3
+
+
+@pytest.mark.django_db
+def test_host_cache_is_per_job(jobs):
+    cache = HostIdCache(max_size=100)
+    cache.get_host_ids(jobs[0], ['web1'])
+    # A later job on the same inventory loads it again
+    jobs[0].inventory.hosts.filter(name='web1').delete()
+    web1 = jobs[0].inventory.hosts.create(name='web1')
+    job = Job.objects.create(inventory=jobs[0].inventory)
+    assert cache.get_host_ids(job, ['web1']) == {'web1': web1.id}
+    assert list(cache.jobs) == [jobs[0].id, job.id]
+    assert cache.size == 4
+
+    cache.evict_job(jobs[0].id)
+    assert list(cache.jobs) == [job.id]
+    assert cache.size == 2
+
+
+@pytest.mark.django_db
+def test_host_cache_smart_inventory(jobs, organization):
+    smart_inventory = Inventory.objects.create(name='smart-inv', kind='smart', organization=organization,
+                                               host_filter='name=web1')
+    job = Job.objects.create(inventory=smart_inventory)
+    web1_ids = set(Inventory.objects.get(pk=j.inventory_id).hosts.get(name='web1').id for j in jobs)
+    cache = HostIdCache(max_size=100)
+    host_ids = cache.get_host_ids(job, ['web1', 'web2'])
+    assert host_ids['web1'] in web1_ids
+    assert host_ids['web2'] is None
+
+
+@pytest.mark.django_db
+def test_host_cache_eviction(jobs, mocker):
+    cache = HostIdCache(max_size=3, ttl=60)
+    time = mocker.patch('awx.main.management.commands.run_callback_receiver.time').time
+    time.return_value = 1000
+    cache.get_host_ids(jobs[0], ['web1'])
+    cache.get_host_ids(jobs[1], ['web1'])
+    assert list(cache.jobs) == [jobs[1].id]
+    assert cache.size == 2
+
+    # jobs that end without playbook_on_stats expire
+    time.return_value = 1060
+    cache.evict()
+    assert cache.jobs == {}
+    assert cache.size == 0
+
+
+@pytest.fixture
+def broker_worker(settings):
+    settings.JOB_EVENT_WORKERS = 3
+    settings.JOB_EVENT_QUEUE_TIMEOUT = 0.01
+    worker = CallbackBrokerWorker(None, use_workers=False)
+    worker.worker_queues = [[0, Queue(maxsize=1), None] for i in range(3)]
+    return worker
+
+
+def test_events_routed_by_job(broker_worker):
+    assert broker_worker.select_worker({'job_id': 4, 'uuid': 'abc'}) == 1
+    assert broker_worker.select_worker({'ad_hoc_command_id': 5}) == 2
+    assert broker_worker.select_worker({'job_id': 4, 'counter': 2}) == broker_worker.select_worker({'job_id': 4})
+
+
+def test_full_queue_overflows_then_drops(broker_worker):
+    for expected in (1, 2, 0, None):
+        assert broker_worker.write_queue_worker(1, {'job_id': 4}) == expected
+    metrics = broker_worker.metrics
+    assert metrics.queued == [1, 1, 1]
+    assert metrics.overflowed == [0, 2, 0]
+    assert metrics.dropped == [0, 1, 0]
+
+    data = metrics.publish([w[1] for w in broker_worker.worker_queues], force=True)
+    assert [w['queue_depth'] for w in data['workers']] == [1, 1, 1]
+    assert [w['dropped'] for w in data['workers']] == [0, 1, 0]
+
+
+def test_event_batches_unpacked(broker_worker, mocker):
+    message = mocker.Mock()
+    broker_worker.process_task([{'job_id': 3}, {'job_id': 4}], message)
+    assert broker_worker.metrics.queued == [1, 1, 0]
+    message.ack.assert_called_once_with()
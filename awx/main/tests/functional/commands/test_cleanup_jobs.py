@@ -0,0 +1,30 @@
+# Python
+import datetime
+import mock
+import pytest
+
+# Django
+from django.core.management import call_command
+from django.utils.timezone import now
+
+# AWX
+from awx.main.models import Job, JobEvent
+
+
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+def test_cleanup_jobs_deletes_events_in_bulk(emit, inventory):
+    host = inventory.hosts.create(name='web1')
+    old_job = Job.objects.create(inventory=inventory, status='successful')
+    new_job = Job.objects.create(inventory=inventory, status='successful')
+    Job.objects.filter(pk=old_job.pk).update(created=now() - datetime.timedelta(days=100))
+    for job in (old_job, new_job):
+        parent = JobEvent.objects.create(job=job, event='playbook_on_start', uuid='p')
+        event = JobEvent.objects.create(job=job, event='runner_on_ok', parent=parent, host=host)
+        event.hosts.add(host)
+
+    call_command('cleanup_jobs', days=90, only_jobs=True, verbosity=0)
+
+    assert list(Job.objects.values_list('pk', flat=True)) == [new_job.pk]
+    assert set(JobEvent.objects.values_list('job_id', flat=True)) == set([new_job.pk])
+    assert JobEvent.hosts.through.objects.count() == 1
@@ -46,6 +46,7 @@ from awx.main.models.notifications import (
 )
 from awx.main.models.workflow import WorkflowJobTemplate
 from awx.main.models.ad_hoc_commands import AdHocCommand
+from awx.main.scheduler.task_cache import task_cache
 
 
 @pytest.fixture(autouse=True)
@@ -56,6 +57,15 @@ def clear_cache():
     cache.clear()
 
 
+@pytest.fixture(autouse=True)
+def clear_task_cache():
+    '''
+    Reset the task manager's in-process view of the queue, the database is
+    rolled back between tests.
+    '''
+    task_cache.reset()
+
+
 @pytest.fixture(scope="session", autouse=True)
 def celery_memory_broker():
     '''
@@ -530,7 +540,8 @@ def _request(verb):
             if response.status_code != expect:
                 print(response.data)
             assert response.status_code == expect
-        response.render()
+        if not response.streaming:
+            response.render()
         return response
     return rf
 
@@ -0,0 +1,157 @@
+import mock
+import pytest
+
+from django.db import DatabaseError
+
+from awx.main.models import Job, JobEvent
+from awx.main.tasks import finalize_job_stats
+
+
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+def test_bulk_create_from_data(emit, inventory):
+    host = inventory.hosts.create(name='web1')
+    job = Job.objects.create(inventory=inventory)
+    job_events = JobEvent.bulk_create_from_data([
+        dict(job_id=job.id, event='runner_on_ok', uuid='a', counter=1, created='2017-01-01T00:00:00Z',
+             event_data=dict(host='web1', res=dict(changed=True))),
+        dict(job_id=job.id, event='runner_on_failed', uuid='b', counter=2, event_data=dict(host='db1')),
+        dict(job_id=job.id, event='playbook_on_start', uuid='c', counter=3, unknown_key='ignored',
+             event_data=dict(artifact_data={'foo': 'bar'})),
+        dict(job_id=job.id + 1, event='runner_on_ok', uuid='d', counter=4),
+        dict(event='runner_on_ok', uuid='e', counter=5),
+    ])
+
+    assert [e.uuid for e in job_events] == ['a', 'b', 'c']
+    assert len(set(e.pk for e in job_events)) == 3
+    assert emit.send.call_count == 3
+
+    saved = dict((e.uuid, e) for e in JobEvent.objects.filter(job=job))
+    assert set(saved) == set(['a', 'b', 'c'])
+    assert saved['a'].host_id == host.id
+    assert saved['a'].host_name == 'web1'
+    assert saved['a'].changed is True
+    assert saved['a'].created.year == 2017
+    assert saved['b'].host_id is None
+    assert saved['b'].failed is True
+    assert saved['c'].modified is not None
+    assert Job.objects.get(pk=job.id).artifacts == {'foo': 'bar'}
+
+
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+def test_bulk_create_from_data_smart_inventory(emit, inventory, settings):
+    settings.CAPTURE_JOB_EVENT_HOSTS = True
+    web1 = inventory.hosts.create(name='web1')
+    inventory.hosts.create(name='db1')
+    smart_inventory = inventory.organization.inventories.create(
+        name='smart-inv', kind='smart', host_filter='name__startswith=web')
+    job = Job.objects.create(inventory=smart_inventory)
+    JobEvent.objects.create(job=job, event='playbook_on_task_start', uuid='task')
+    JobEvent.bulk_create_from_data([
+        dict(job_id=job.id, event='runner_on_ok', uuid='ok1', parent_uuid='task', event_data=dict(host='web1')),
+        dict(job_id=job.id, event='runner_on_ok', uuid='ok2', parent_uuid='task', event_data=dict(host='db1')),
+    ])
+
+    assert JobEvent.objects.get(uuid='ok1').host_id == web1.id
+    assert JobEvent.objects.get(uuid='ok2').host_id is None
+    assert list(JobEvent.objects.get(uuid='task').hosts.values_list('id', flat=True)) == [web1.id]
+
+
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+def test_bulk_create_from_data_skips_bad_events(emit, inventory):
+    job = Job.objects.create(inventory=inventory)
+    bulk_create = JobEvent.objects.bulk_create
+
+    def fail_on_batches(objs, *args, **kwargs):
+        if len(objs) > 1 or objs[0].uuid == 'bad':
+            raise DatabaseError('boom')
+        return bulk_create(objs, *args, **kwargs)
+
+    with mock.patch.object(JobEvent.objects, 'bulk_create', side_effect=fail_on_batches):
+        job_events = JobEvent.bulk_create_from_data([
+            dict(job_id=job.id, event='runner_on_ok', uuid='good', counter=1),
+            dict(job_id=job.id, event='runner_on_ok', uuid='bad', counter=2),
+        ])
+    assert [e.uuid for e in job_events] == ['good']
+    assert list(JobEvent.objects.values_list('uuid', flat=True)) == ['good']
+
+
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+@mock.patch('awx.main.models.jobs.emit_channel_notification')
+def test_update_from_stats(emit, emit_event, inventory):
+    web1 = inventory.hosts.create(name='web1')
+    web2 = inventory.hosts.create(name='web2')
+    job = Job.objects.create(inventory=inventory)
+    job.job_host_summaries.create(host=web2, host_name='web2', ok=1)
+    JobEvent.objects.create(job=job, event='playbook_on_task_start', uuid='task1')
+    JobEvent.objects.create(job=job, event='playbook_on_task_start', uuid='task2')
+    JobEvent.objects.create(job=job, event='runner_on_ok', parent_uuid='task1',
+                            event_data=dict(host='web1', res=dict(changed=True)))
+    JobEvent.objects.create(job=job, event='runner_on_failed', parent_uuid='task2',
+                            event_data=dict(host='web2'))
+    stats = JobEvent.objects.create(job=job, event='playbook_on_stats', event_data=dict(
+        changed={'web1': 1}, failures={'web2': 1}, ok={'web1': 2, 'web2': 1, 'db1': 1}, processed={},
+    ))
+
+    stats.update_from_stats()
+
+    task1 = JobEvent.objects.get(uuid='task1')
+    task2 = JobEvent.objects.get(uuid='task2')
+    assert (task1.changed, task1.failed) == (True, False)
+    assert (task2.changed, task2.failed) == (False, True)
+
+    summaries = dict((s.host_name, s) for s in job.job_host_summaries.all())
+    assert set(summaries) == set(['web1', 'web2', 'db1'])
+    assert (summaries['web1'].host_id, summaries['web1'].ok, summaries['web1'].failed) == (web1.id, 2, False)
+    assert (summaries['web2'].ok, summaries['web2'].failures, summaries['web2'].failed) == (1, 1, True)
+    assert summaries['db1'].host_id is None
+
+    for host in (web1, web2):
+        host.refresh_from_db()
+        assert host.last_job_id == job.id
+        assert host.last_job_host_summary_id == summaries[host.name].id
+    emit.assert_called_once_with('jobs-summary', dict(group_name='jobs', unified_job_id=job.id))
+
+
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+def test_finalize_job_stats_is_atomic(emit, inventory):
+    web1 = inventory.hosts.create(name='web1')
+    job = Job.objects.create(inventory=inventory)
+    job.job_host_summaries.create(host=web1, host_name='web1', ok=1)
+    stats = JobEvent.objects.create(job=job, event='playbook_on_stats', event_data=dict(
+        changed={}, failures={'web1': 1}, ok={}, processed={},
+    ))
+
+    with mock.patch('awx.main.models.Inventory.update_computed_fields', side_effect=DatabaseError('boom')):
+        with pytest.raises(DatabaseError):
+            finalize_job_stats([stats.pk])
+    assert list(job.job_host_summaries.values_list('host_name', 'ok', 'failures')) == [('web1', 1, 0)]
+
+
+@pytest.mark.django_db
+@mock.patch('awx.main.signals.event_emitter')
+def test_capture_job_event_hosts(emit, inventory, settings):
+    settings.CAPTURE_JOB_EVENT_HOSTS = True
+    web1 = inventory.hosts.create(name='web1')
+    web2 = inventory.hosts.create(name='web2')
+    job = Job.objects.create(inventory=inventory)
+    JobEvent.objects.create(job=job, event='playbook_on_play_start', uuid='play')
+    JobEvent.bulk_create_from_data([
+        dict(job_id=job.id, event='playbook_on_task_start', uuid='task', parent_uuid='play'),
+        dict(job_id=job.id, event='runner_on_ok', uuid='ok1', parent_uuid='task', event_data=dict(host='web1')),
+        dict(job_id=job.id, event='runner_on_ok', uuid='ok2', parent_uuid='task', event_data=dict(host='web2')),
+        dict(job_id=job.id, event='runner_on_ok', uuid='ok3', parent_uuid='task', event_data=dict(host='db1')),
+    ])
+    JobEvent.objects.create(job=job, event='runner_on_ok', uuid='ok4', parent_uuid='task', event_data=dict(host='web1'))
+
+    def host_ids(uuid):
+        return set(JobEvent.objects.get(uuid=uuid).hosts.values_list('id', flat=True))
+
+    assert host_ids('ok1') == set([web1.id])
+    assert host_ids('ok3') == set()
+    assert host_ids('task') == set([web1.id, web2.id])
+    assert host_ids('play') == set([web1.id, web2.id])
@@ -35,6 +35,21 @@ class TestWorkflowDAGFunctional(TransactionTestCase):
         with self.assertNumQueries(4):
             dag._init_graph(wfj)
 
+    def test_build_many_WFJT_dags(self):
+        '''
+        Test that building the graphs of several workflows takes the same
+        queries as building one
+        '''
+        wfjs = [self.workflow_job() for i in range(3)]
+        with self.assertNumQueries(4):
+            dags = WorkflowDAG.from_workflow_jobs(wfjs)
+        assert sorted(dags.keys()) == sorted(wfj.id for wfj in wfjs)
+        for wfj in wfjs:
+            dag = dags[wfj.id]
+            assert len(dag) == 5
+            assert len(dag.get_root_nodes()) == 1
+            assert all(n['node_object'].workflow_job is wfj for n in dag)
+
 
 @pytest.mark.django_db
 class TestWorkflowJob:
@@ -1,10 +1,14 @@
 import pytest
 
+from django.db import connection
 from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
 
 from awx.main.models import (
     Instance,
     InstanceGroup,
+    Job,
+    UnifiedJob,
 )
 
 
@@ -32,3 +36,19 @@ class TestCapacityMapping(TransactionTestCase):
         assert ig_map['ig_small'] == set(['ig_small'])
         assert ig_map['ig_large'] == set(['ig_large', 'tower'])
         assert ig_map['tower'] == set(['ig_large', 'tower'])
+
+
+@pytest.mark.django_db
+def test_prefetch_task_impact(job_template_factory):
+    objects = job_template_factory('jt', organization='org1', project='proj',
+                                   inventory='inv', credential='cred',
+                                   jobs=["job1", "job2"])
+    for i in range(3):
+        objects.inventory.hosts.create(name='host-%d' % i)
+    jobs = [Job.objects.get(pk=j.pk) for j in objects.jobs.values()]
+    expected = [j.task_impact for j in jobs]
+
+    with CaptureQueriesContext(connection) as queries:
+        UnifiedJob.prefetch_task_impact(jobs)
+        assert [j.task_impact for j in jobs] == expected == [30, 30]
+    assert len(queries) == 1
@@ -7,11 +7,20 @@ from django.core.cache import cache
 from django.utils.timezone import now as tz_now
 
 from awx.main.scheduler import TaskManager
+from awx.main.scheduler.metrics import get_recent_cycles
+from awx.main.scheduler.task_cache import task_cache
+from awx.main.tasks import RunJob
 from awx.main.utils import encrypt_field
 from awx.main.models import (
     Job,
     Instance,
+    InstanceGroup,
+    InventoryUpdate,
+    ProjectUpdate,
+    TaskLease,
+    UnifiedJob,
     WorkflowJob,
+    WorkflowJobNode,
 )
 
 
@@ -239,6 +248,86 @@ def test_shared_dependencies_launch(default_instance_group, job_template_factory
     assert len(iu) == 1
 
 
+@pytest.mark.django_db
+def test_prefetch_dependency_data(default_instance_group, job_template_factory, inventory_source_factory):
+    objects = job_template_factory('jt', organization='org1', project='proj',
+                                   inventory='inv', credential='cred',
+                                   jobs=["job"])
+    j = objects.jobs["job"]
+    p = objects.project
+    old_pu = ProjectUpdate.objects.create(project=p, job_type='check')
+    old_pu.created = tz_now() - timedelta(hours=1)
+    old_pu.save()
+    new_pu = ProjectUpdate.objects.create(project=p, job_type='check')
+    ProjectUpdate.objects.create(project=p, job_type='run')
+
+    i = objects.inventory
+    ii = inventory_source_factory("ec2")
+    ii.source = "ec2"
+    ii.update_on_launch = True
+    ii.save()
+    i.inventory_sources.add(ii)
+    iu = InventoryUpdate.objects.create(inventory_source=ii)
+
+    tm = TaskManager()
+    tm.prefetch_dependency_data([j])
+    assert tm.projects == {p.id: p}
+    assert tm.latest_project_updates == {p.id: new_pu}
+    assert tm.inventory_sources == {i.id: [ii]}
+    assert tm.latest_inventory_updates == {ii.id: iu}
+    assert j.id not in tm.jobs_with_dependencies
+
+    tm.capture_chain_failure_dependencies(j, [new_pu, iu])
+    assert tm.get_jobs_with_dependencies([j]) == tm.jobs_with_dependencies
+
+
+@pytest.mark.django_db
+def test_task_cache_applies_changed_tasks(job_template_factory, settings):
+    settings.AWX_TASK_MANAGER_DELTA_OVERLAP = 0
+    objects = job_template_factory('jt', organization='org1', project='proj',
+                                   inventory='inv', credential='cred',
+                                   jobs=["first_job", "second_job"])
+    j1 = objects.jobs["first_job"]
+    j1.status = 'pending'
+    j1.save()
+    tm = TaskManager()
+    assert tm.get_tasks() == [j1]
+    last_reconcile = task_cache.last_reconcile
+
+    # Status changes are saved with update_fields, as the task manager and
+    # BaseTask.update_model do.
+    j2 = objects.jobs["second_job"]
+    j2.status = 'pending'
+    j2.save(update_fields=['status'])
+    assert tm.get_tasks() == [j1, j2]
+
+    RunJob().update_model(j1.pk, status='running')
+    assert [(j.pk, j.status) for j in tm.get_tasks()] == [(j1.pk, 'running'), (j2.pk, 'pending')]
+
+    RunJob().update_model(j1.pk, status='successful')
+    assert tm.get_tasks() == [j2]
+    assert task_cache.last_reconcile == last_reconcile
+
+
+@pytest.mark.django_db
+def test_task_cache_reconcile(job_template_factory, settings):
+    objects = job_template_factory('jt', organization='org1', project='proj',
+                                   inventory='inv', credential='cred',
+                                   jobs=["job"])
+    j = objects.jobs["job"]
+    j.status = 'pending'
+    j.save()
+    tm = TaskManager()
+    assert tm.get_tasks() == [j]
+
+    # Bypass save() so the change is invisible to the incremental load
+    Job.objects.filter(pk=j.pk).update(status='canceled', modified=tz_now() - timedelta(days=1))
+    assert tm.get_tasks() == [j]
+
+    settings.AWX_TASK_MANAGER_RECONCILE_INTERVAL = 0
+    assert tm.get_tasks() == []
+
+
 @pytest.mark.django_db
 def test_cleanup_interval():
     assert cache.get('last_celery_task_cleanup') is None
@@ -251,124 +340,175 @@ def test_cleanup_interval():
     assert cache.get('last_celery_task_cleanup') == last_cleanup
 
 
-class TestReaper():
-    @pytest.fixture
-    def all_jobs(self, mocker):
-        now = tz_now()
-
-        Instance.objects.create(hostname='host1', capacity=100)
-        Instance.objects.create(hostname='host2', capacity=100)
-        Instance.objects.create(hostname='host3_split', capacity=100)
-        Instance.objects.create(hostname='host4_offline', capacity=0)
-
-        j1 = Job.objects.create(status='pending', execution_node='host1')
-        j2 = Job.objects.create(status='waiting', celery_task_id='considered_j2')
-        j3 = Job.objects.create(status='waiting', celery_task_id='considered_j3')
-        j3.modified = now - timedelta(seconds=60)
-        j3.save(update_fields=['modified'])
-        j4 = Job.objects.create(status='running', celery_task_id='considered_j4', execution_node='host1')
-        j5 = Job.objects.create(status='waiting', celery_task_id='reapable_j5')
-        j5.modified = now - timedelta(seconds=60)
-        j5.save(update_fields=['modified'])
-        j6 = Job.objects.create(status='waiting', celery_task_id='considered_j6')
-        j6.modified = now - timedelta(seconds=60)
-        j6.save(update_fields=['modified'])
-        j7 = Job.objects.create(status='running', celery_task_id='considered_j7', execution_node='host2')
-        j8 = Job.objects.create(status='running', celery_task_id='reapable_j7', execution_node='host2')
-        j9 = Job.objects.create(status='waiting', celery_task_id='reapable_j8')
-        j9.modified = now - timedelta(seconds=60)
-        j9.save(update_fields=['modified'])
-        j10 = Job.objects.create(status='running', celery_task_id='host3_j10', execution_node='host3_split')
-
-        j11 = Job.objects.create(status='running', celery_task_id='host4_j11', execution_node='host4_offline')
-
-        j12 = WorkflowJob.objects.create(status='running', celery_task_id='workflow_job', execution_node='host1')
-
-        js = [j1, j2, j3, j4, j5, j6, j7, j8, j9, j10, j11, j12]
-        for j in js:
-            j.save = mocker.Mock(wraps=j.save)
-            j.websocket_emit_status = mocker.Mock()
-        return js
 
-    @pytest.fixture
-    def considered_jobs(self, all_jobs):
-        return all_jobs[2:7] + [all_jobs[10]]
+@pytest.mark.django_db
+def test_schedule_records_metrics(default_instance_group, job_template_factory, settings):
+    settings.AWX_TASK_MANAGER_METRICS_HISTORY = 2
+    objects = job_template_factory('jt', organization='org1', project='proj',
+                                   inventory='inv', credential='cred',
+                                   jobs=["job_should_start", "job_should_not_start"])
+    for j in objects.jobs.values():
+        j.status = 'pending'
+        j.save()
+    with mock.patch("awx.main.scheduler.TaskManager.start_task"):
+        for i in range(3):
+            TaskManager().schedule()
 
-    @pytest.fixture
-    def running_tasks(self, all_jobs):
-        return {
-            'host1': [all_jobs[3]],
-            'host2': [all_jobs[7], all_jobs[8]],
-            'host3_split': [all_jobs[9]],
-            'host4_offline': [all_jobs[10]],
-        }
+    cycles = get_recent_cycles()
+    assert len(cycles) == 2
+    cycle = cycles[0]
+    assert cycle['lock_acquired'] is True
+    assert cycle['queries'] > 0
+    assert cycle['counters']['tasks_pending'] == 2
+    assert cycle['blocked'] == {'blocked_by_running_job': 1}
+    assert cycle['phases']['generate_dependencies']['calls'] == 2
+    for name in ('cleanup_inconsistent_tasks', 'get_tasks', 'process_pending_tasks'):
+        assert name in cycle['phases']
 
-    @pytest.fixture
-    def waiting_tasks(self, all_jobs):
-        return [all_jobs[2], all_jobs[4], all_jobs[5], all_jobs[8]]
 
+class TestReaper():
     @pytest.fixture
-    def reapable_jobs(self, all_jobs):
-        return [all_jobs[4], all_jobs[7], all_jobs[10]]
+    def all_jobs(self, settings):
+        settings.AWX_TASK_LEASE_TIMEOUT = 60
+        now = tz_now()
+        old = now - timedelta(seconds=120)
 
-    @pytest.fixture
-    def unconsidered_jobs(self, all_jobs):
-        return all_jobs[0:1] + all_jobs[5:7]
+        Instance.objects.create(hostname='host1', capacity=100)
+        isolated = Instance.objects.create(hostname='isolated1', capacity=100)
+        controller = InstanceGroup.objects.create(name='controller')
+        InstanceGroup.objects.create(name='isolated', controller=controller).instances.add(isolated)
+
+        def create_job(modified=None, lease_expires=None, model=Job, **kwargs):
+            j = model.objects.create(**kwargs)
+            if modified:
+                model.objects.filter(pk=j.pk).update(modified=modified)
+            if lease_expires:
+                TaskLease.objects.create(unified_job=j, celery_task_id=j.celery_task_id, expires=lease_expires)
+            return model.objects.get(pk=j.pk)
+
+        return dict(
+            pending=create_job(status='pending', modified=old),
+            waiting_recent=create_job(status='waiting'),
+            waiting_without_lease=create_job(status='waiting', modified=old),
+            running_leased=create_job(status='running', execution_node='host1', modified=old,
+                                      lease_expires=now + timedelta(seconds=30)),
+            running_expired=create_job(status='running', execution_node='host1',
+                                       lease_expires=now - timedelta(seconds=1)),
+            running_without_lease=create_job(status='running', execution_node='host1', modified=old),
+            isolated_expired=create_job(status='running', execution_node='isolated1',
+                                        lease_expires=now - timedelta(seconds=1)),
+            workflow=create_job(model=WorkflowJob, status='running', modified=old),
+        )
 
-    @pytest.fixture
-    def active_tasks(self):
-        return ([], {
-            'host1': ['considered_j2', 'considered_j3', 'considered_j4',],
-            'host2': ['considered_j6', 'considered_j7'],
-        })
+    @pytest.mark.django_db
+    def test_get_lost_tasks(self, all_jobs):
+        lost_tasks = TaskManager().get_lost_tasks()
+        assert sorted(j.pk for j in lost_tasks) == sorted(all_jobs[name].pk for name in (
+            'waiting_without_lease', 'running_expired', 'running_without_lease', 'isolated_expired'))
 
     @pytest.mark.django_db
     @mock.patch('awx.main.tasks._send_notification_templates')
-    @mock.patch.object(TaskManager, 'get_active_tasks', lambda self: ([], []))
-    def test_cleanup_inconsistent_task(self, notify, active_tasks, considered_jobs, reapable_jobs, running_tasks, waiting_tasks, mocker):
-        tm = TaskManager()
+    def test_cleanup_inconsistent_task(self, notify, all_jobs, mocker):
+        mocker.patch.object(UnifiedJob, 'websocket_emit_status')
+        TaskManager().cleanup_inconsistent_celery_tasks()
+
+        statuses = dict((name, UnifiedJob.objects.get(pk=j.pk).status) for name, j in all_jobs.items())
+        assert statuses == dict(
+            pending='pending',
+            waiting_recent='waiting',
+            waiting_without_lease='failed',
+            running_leased='running',
+            running_expired='failed',
+            running_without_lease='failed',
+            isolated_expired='error',
+            workflow='running',
+        )
+        assert notify.call_count == 4
+        assert UnifiedJob.objects.get(pk=all_jobs['running_expired'].pk).job_explanation == (
+            'Task was marked as running in Tower but its worker stopped renewing its lease, '
+            'so it has been marked as failed.'
+        )
+        assert list(TaskLease.objects.values_list('unified_job_id', flat=True)) == [all_jobs['running_leased'].pk]
 
-        tm.get_running_tasks = mocker.Mock(return_value=(running_tasks, waiting_tasks))
-        tm.get_active_tasks = mocker.Mock(return_value=active_tasks)
-        
-        tm.cleanup_inconsistent_celery_tasks()
-        
-        for j in considered_jobs:
-            if j not in reapable_jobs:
-                j.save.assert_not_called()
+    @pytest.mark.django_db
+    def test_lease_renewal(self, all_jobs):
+        job = all_jobs['running_without_lease']
+        assert not TaskLease.objects.renew(job.pk)
+        TaskLease.objects.acquire(job)
+        assert TaskLease.objects.renew(job.pk)
+        assert job not in TaskManager().get_lost_tasks()
 
-        assert notify.call_count == 4
-        notify.assert_has_calls([mock.call(j, 'failed') for j in reapable_jobs], any_order=True)
+        Job.objects.filter(pk=job.pk).update(status='successful')
+        assert not TaskLease.objects.renew(job.pk)
 
-        for j in reapable_jobs:
-            j.websocket_emit_status.assert_called_once_with('failed')
-            assert j.status == 'failed'
-            assert j.job_explanation == (
-                'Task was marked as running in Tower but was not present in Celery, so it has been marked as failed.'
-            )
 
-    @pytest.mark.django_db
-    def test_get_running_tasks(self, all_jobs):
+class TestSchedulingPolicy():
+    @pytest.fixture
+    def org_jobs(self, job_template_factory):
+        objects1 = job_template_factory('jt1', organization='org1', project='proj1',
+                                        inventory='inv1', credential='cred1',
+                                        jobs=["org1_job1", "org1_job2", "org1_job3"])
+        objects2 = job_template_factory('jt2', organization='org2', project='proj2',
+                                        inventory='inv2', credential='cred2',
+                                        jobs=["org2_job1"])
+        jobs = [objects1.jobs["org1_job1"], objects1.jobs["org1_job2"],
+                objects1.jobs["org1_job3"], objects2.jobs["org2_job1"]]
+        for j in jobs:
+            j.allow_simultaneous = True
+            j.status = 'pending'
+            j.save()
+        return jobs
+
+    def schedule(self):
         tm = TaskManager()
+        with mock.patch('awx.main.models.Job.task_impact', new_callable=mock.PropertyMock) as mock_task_impact:
+            mock_task_impact.return_value = 40
+            with mock.patch.object(TaskManager, "start_task", wraps=tm.start_task) as mock_job:
+                tm.schedule()
+                return [c[0][0] for c in mock_job.call_args_list]
 
-        # Ensure the query grabs the expected jobs
-        execution_nodes_jobs, waiting_jobs = tm.get_running_tasks()
-        assert 'host1' in execution_nodes_jobs
-        assert 'host2' in execution_nodes_jobs
-        assert 'host3_split' in execution_nodes_jobs
+    @pytest.mark.django_db
+    def test_fifo(self, default_instance_group, org_jobs, settings):
+        settings.AWX_TASK_MANAGER_POLICY = 'fifo'
+        assert self.schedule() == org_jobs[:2]
 
-        assert all_jobs[3] in execution_nodes_jobs['host1']
+    @pytest.mark.django_db
+    def test_fair_share(self, default_instance_group, org_jobs, settings):
+        settings.AWX_TASK_MANAGER_POLICY = 'fair_share'
+        assert self.schedule() == [org_jobs[0], org_jobs[3]]
 
-        assert all_jobs[6] in execution_nodes_jobs['host2']
-        assert all_jobs[7] in execution_nodes_jobs['host2']
-        
-        assert all_jobs[9] in execution_nodes_jobs['host3_split']
+    @pytest.mark.django_db
+    def test_fair_share_weights(self, default_instance_group, org_jobs, settings):
+        settings.AWX_TASK_MANAGER_POLICY = 'fair_share'
+        settings.AWX_TASK_MANAGER_ORGANIZATION_WEIGHTS = {org_jobs[0].project.organization_id: 2}
+        assert self.schedule() == org_jobs[:2]
 
-        assert all_jobs[10] in execution_nodes_jobs['host4_offline']
+    @pytest.mark.django_db
+    def test_template_priority(self, default_instance_group, org_jobs, settings):
+        settings.AWX_TASK_MANAGER_POLICY = 'template_priority'
+        settings.AWX_TASK_MANAGER_TEMPLATE_PRIORITIES = {org_jobs[3].unified_job_template_id: 10}
+        assert self.schedule() == [org_jobs[3], org_jobs[0]]
 
-        assert all_jobs[11] not in execution_nodes_jobs['host1']
 
-        assert all_jobs[2] in waiting_jobs
-        assert all_jobs[4] in waiting_jobs
-        assert all_jobs[5] in waiting_jobs
-        assert all_jobs[8] in waiting_jobs
+@pytest.mark.django_db
+def test_spawn_workflow_graph_jobs(job_template_factory, mocker):
+    jt = job_template_factory('jt', organization='org1', project='proj',
+                              inventory='inv', credential='cred').job_template
+    wfj = WorkflowJob.objects.create(status='running')
+    roots = [WorkflowJobNode.objects.create(workflow_job=wfj, unified_job_template=jt) for i in range(3)]
+    child = WorkflowJobNode.objects.create(workflow_job=wfj, unified_job_template=jt)
+    roots[0].success_nodes.add(child)
+    done_wfj = WorkflowJob.objects.create(status='successful')
+    WorkflowJobNode.objects.create(workflow_job=done_wfj, unified_job_template=jt)
+
+    mocker.patch.object(Job, 'signal_start', return_value=True)
+    tm = TaskManager()
+    tm.spawn_workflow_graph_jobs([wfj, done_wfj])
+
+    for node in roots:
+        node.refresh_from_db()
+        assert isinstance(node.job, Job)
+        assert node.job.launch_type == 'workflow'
+    child.refresh_from_db()
+    assert child.job is None
+    assert not done_wfj.workflow_job_nodes.filter(job__isnull=False).exists()
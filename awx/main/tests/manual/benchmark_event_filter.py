@@ -0,0 +1,77 @@
+# Python
+import base64
+import cStringIO
+import json
+import os
+import timeit
+
+if __name__ == "__main__":
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'awx.settings.development')
+    import django
+    django.setup()
+
+# AWX
+from awx.main.utils import OutputEventFilter # noqa
+
+# Size of the reads of a job's stdout by pexpect
+READ_SIZE = 4096
+
+
+def encode_event_data(data, max_width=78):
+    # Same encoding as awx_display_callback.events.EventContext.dump()
+    b64data = base64.b64encode(json.dumps(data))
+    chunks = ['\x1b[K']
+    for offset in xrange(0, len(b64data), max_width):
+        chunk = b64data[offset:offset + max_width]
+        chunks.append('{}\x1b[{}D'.format(chunk, len(chunk)))
+    chunks.append('\x1b[K')
+    return ''.join(chunks)
+
+
+def playbook_stdout(events):
+    # Stdout of a playbook run where each event prints a couple of lines,
+    # as recorded from the display callback.
+    chunks = []
+    for i in range(events):
+        chunks.append(encode_event_data({'uuid': '%08d-fe6d-4091-8faf-bdc8021d65dd' % i}))
+        chunks.append('\r\nTASK [debug %d] %s\r\n' % (i, '*' * 60))
+        chunks.append('\x1b[0;32mok: [host%d] => {"msg": "%s"}\x1b[0m\r\n' % (i, 'x' * 40))
+        chunks.append(encode_event_data({}))
+    return ''.join(chunks)
+
+
+def verbose_stdout(events, lines_per_event=100):
+    # Stdout of a -vvvv run: long stretches of text between event markers.
+    chunks = []
+    for i in range(events // lines_per_event):
+        chunks.append(encode_event_data({'uuid': '%08d-fe6d-4091-8faf-bdc8021d65dd' % i}))
+        chunks.append('<host%d> SSH: EXEC ssh -o ControlPersist=60s %s\r\n' % (i, 'y' * 80) * lines_per_event)
+        chunks.append(encode_event_data({}))
+    return ''.join(chunks)
+
+
+def unmarked_stdout(events):
+    # Stdout without any event marker, e.g. of an inventory update or a
+    # single task printing a large result, one line per "event".
+    return ''.join('line %d of a large task result %s\r\n' % (i, 'z' * 80) for i in range(events))
+
+
+def parse(stdout):
+    events = []
+    f = OutputEventFilter(cStringIO.StringIO(), events.append)
+    for offset in xrange(0, len(stdout), READ_SIZE):
+        f.write(stdout[offset:offset + READ_SIZE])
+    return events
+
+
+def run(sizes=(1000, 10000, 100000), number=3):
+    for shape in (playbook_stdout, verbose_stdout, unmarked_stdout):
+        for size in sizes:
+            stdout = shape(size)
+            parse_time = timeit.timeit(lambda: parse(stdout), number=number) / number
+            print("%-16s events=%-6d bytes=%-10d parse=%.4fs (%.1f MB/s)" % (
+                shape.__name__, size, len(stdout), parse_time, len(stdout) / parse_time / 1e6))
+
+
+if __name__ == "__main__":
+    run()
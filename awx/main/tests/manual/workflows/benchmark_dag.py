@@ -0,0 +1,70 @@
+# Python
+import os
+import timeit
+
+if __name__ == "__main__":
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'awx.settings.development')
+    import django
+    django.setup()
+
+# AWX
+from awx.main.scheduler.dag_workflow import WorkflowDAG # noqa
+
+
+class Job(object):
+    def __init__(self, status):
+        self.status = status
+
+
+class WorkflowNode(object):
+    def __init__(self, id, job=None):
+        self.id = id
+        self.job = job
+        self.unified_job_template = 'jt'
+
+
+def chain(size):
+    nodes = [WorkflowNode(i, job=Job('successful')) for i in range(size)]
+    nodes[-1].job = None
+    return nodes, [(i, i + 1, 'success_nodes') for i in range(size - 1)]
+
+
+def fan_out(size):
+    nodes = [WorkflowNode(i, job=Job('successful') if i == 0 else None) for i in range(size)]
+    return nodes, [(0, i, 'success_nodes') for i in range(1, size)]
+
+
+def lattice(size, width=10):
+    # Every node of a layer leads to every node of the next one, the
+    # worst case for a traversal that doesn't remember visited nodes.
+    nodes = [WorkflowNode(i, job=Job('failed' if i % 2 else 'successful')) for i in range(size)]
+    edges = []
+    for i in range(size - width):
+        layer_start = (i // width + 1) * width
+        for j in range(layer_start, min(layer_start + width, size)):
+            edges.append((i, j, 'always_nodes'))
+    return nodes, edges
+
+
+def build(nodes, edges):
+    dag = WorkflowDAG()
+    for n in nodes:
+        dag.add_node(n)
+    for from_idx, to_idx, label in edges:
+        dag.add_edge(nodes[from_idx], nodes[to_idx], label)
+    return dag
+
+
+def run(size=1000, number=10):
+    for shape in (chain, fan_out, lattice):
+        nodes, edges = shape(size)
+        build_time = timeit.timeit(lambda: build(nodes, edges), number=number) / number
+        dag = build(nodes, edges)
+        bfs_time = timeit.timeit(dag.bfs_nodes_to_run, number=number) / number
+        done_time = timeit.timeit(dag.is_workflow_done, number=number) / number
+        print("%-8s nodes=%d edges=%d build=%.4fs bfs_nodes_to_run=%.4fs is_workflow_done=%.4fs" % (
+            shape.__name__, len(nodes), len(edges), build_time, bfs_time, done_time))
+
+
+if __name__ == "__main__":
+    run()
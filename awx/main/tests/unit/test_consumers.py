@@ -0,0 +1,51 @@
+import pytest
+
+from awx.main.consumers import EventEmitter
+
+
+@pytest.fixture
+def emitter(settings):
+    settings.WEBSOCKET_EVENT_INTERVAL = 60
+    settings.WEBSOCKET_EVENT_BATCH_MAX = 2
+    return EventEmitter()
+
+
+def event(counter, job=1):
+    return dict(group_name='job_events', job=job, counter=counter)
+
+
+def test_sends_immediately_unless_buffering(emitter, mocker):
+    emit = mocker.patch('awx.main.consumers.emit_channel_notification')
+    emitter.send('job_events-1', event(1))
+    emit.assert_called_once_with('job_events-1', event(1))
+    assert not emitter.pending
+
+
+def test_buffered_events_sent_in_one_frame_per_group(emitter, mocker):
+    emit = mocker.patch('awx.main.consumers.emit_channel_notification')
+    emitter.buffering = True
+    for counter in (1, 2, 5, 3):
+        emitter.send('job_events-1', event(counter))
+    emitter.send('job_events-2', event(1, job=2))
+    assert emit.call_count == 0
+
+    emitter.flush(force=True)
+    assert emit.call_args_list == [
+        mocker.call('job_events-1', dict(group_name='job_events', job=1, events=[event(1), event(2)],
+                                         skipped=2, skipped_counters=[3, 5])),
+        mocker.call('job_events-2', dict(group_name='job_events', job=2, events=[event(1, job=2)],
+                                         skipped=0, skipped_counters=None)),
+    ]
+    assert not emitter.pending
+
+
+def test_flush_waits_for_interval(emitter, mocker, settings):
+    emit = mocker.patch('awx.main.consumers.emit_channel_notification')
+    emitter.buffering = True
+    emitter.send('job_events-1', event(1))
+    emitter.flush()
+    assert emit.call_count == 0
+
+    settings.WEBSOCKET_EVENT_INTERVAL = 0
+    emitter.flush()
+    assert emit.call_count == 1
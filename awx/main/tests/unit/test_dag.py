@@ -0,0 +1,103 @@
+import pytest
+
+from awx.main.scheduler.dag_simple import SimpleDAG
+from awx.main.scheduler.dag_workflow import WorkflowDAG
+
+
+class Job(object):
+    def __init__(self, status):
+        self.status = status
+
+
+class WorkflowNode(object):
+    def __init__(self, id, job=None, unified_job_template='jt'):
+        self.id = id
+        self.job = job
+        self.unified_job_template = unified_job_template
+
+
+@pytest.fixture
+def simple_dag():
+    dag = SimpleDAG()
+    nodes = [WorkflowNode(i) for i in range(4)]
+    for n in nodes:
+        dag.add_node(n)
+    dag.add_edges([
+        (nodes[0], nodes[1], 'success_nodes'),
+        (nodes[0], nodes[2], 'failure_nodes'),
+        (nodes[1], nodes[3], 'success_nodes'),
+        (nodes[2], nodes[3], 'always_nodes'),
+    ])
+    return dag, nodes
+
+
+def test_simple_dag_lookups(simple_dag):
+    dag, nodes = simple_dag
+    assert len(dag) == 4
+    assert nodes[3] in dag
+    assert WorkflowNode(5) not in dag
+    assert dag.find_ord(nodes[2]) == 2
+
+    def objs(dag_nodes):
+        return sorted(n['node_object'].id for n in dag_nodes)
+
+    assert objs(dag.get_dependencies(nodes[0])) == [1, 2]
+    assert objs(dag.get_dependencies(nodes[0], 'success_nodes')) == [1]
+    assert objs(dag.get_dependents(nodes[3])) == [1, 2]
+    assert objs(dag.get_dependents(nodes[3], 'always_nodes')) == [2]
+    assert objs(dag.get_root_nodes()) == [0]
+    assert objs(dag.get_leaf_nodes()) == [3]
+
+
+def test_simple_dag_add_node_is_idempotent(simple_dag):
+    dag, nodes = simple_dag
+    dag.add_node(nodes[0])
+    assert len(dag) == 4
+
+
+def test_simple_dag_edge_to_unknown_node(simple_dag):
+    dag, nodes = simple_dag
+    with pytest.raises(LookupError):
+        dag.add_edge(nodes[0], WorkflowNode(5))
+
+
+def build_workflow_dag(nodes, edges):
+    dag = WorkflowDAG()
+    for n in nodes:
+        dag.add_node(n)
+    for from_idx, to_idx, label in edges:
+        dag.add_edge(nodes[from_idx], nodes[to_idx], label)
+    return dag
+
+
+def test_bfs_nodes_to_run_visits_shared_children_once():
+    nodes = [WorkflowNode(0, job=Job('successful')),
+             WorkflowNode(1, job=Job('successful')),
+             WorkflowNode(2)]
+    dag = build_workflow_dag(nodes, [
+        (0, 1, 'success_nodes'),
+        (0, 2, 'success_nodes'),
+        (1, 2, 'always_nodes'),
+    ])
+    assert dag.bfs_nodes_to_run() == [nodes[2]]
+
+
+def test_is_workflow_done_follows_failure_path():
+    nodes = [WorkflowNode(0, job=Job('failed')),
+             WorkflowNode(1),
+             WorkflowNode(2, job=Job('successful'))]
+    dag = build_workflow_dag(nodes, [
+        (0, 1, 'success_nodes'),
+        (0, 2, 'failure_nodes'),
+    ])
+    assert dag.is_workflow_done()
+    assert dag.bfs_nodes_to_run() == []
+
+
+def test_large_workflow():
+    # 1,000 node chain of finished jobs ending with a node still to run
+    nodes = [WorkflowNode(i, job=Job('successful')) for i in range(1000)]
+    nodes[-1].job = None
+    dag = build_workflow_dag(nodes, [(i, i + 1, 'success_nodes') for i in range(999)])
+    assert dag.bfs_nodes_to_run() == [nodes[-1]]
+    assert not dag.is_workflow_done()
@@ -0,0 +1,94 @@
+import pytest
+
+from awx.main.scheduler.placement import BestFitPlacement, GreedyPlacement, get_placement
+from awx.main.scheduler.simulation import PlacementSimulation
+
+
+@pytest.fixture
+def graph():
+    return {
+        'small': dict(capacity_total=50, consumed_capacity=0),
+        'large': dict(capacity_total=200, consumed_capacity=0),
+    }
+
+
+def test_greedy_uses_first_preferred_group(graph):
+    placement = GreedyPlacement(graph)
+    assert placement.select(40, ['large', 'small']) == 'large'
+    placement.consume(40, 'large')
+    assert graph['large']['consumed_capacity'] == 40
+    assert placement.get_remaining_capacity('large') == 160
+
+
+def test_greedy_idle_group_always_fits(graph):
+    placement = GreedyPlacement(graph)
+    assert placement.select(500, ['small']) == 'small'
+
+
+def test_best_fit_picks_tightest_group(graph):
+    placement = BestFitPlacement(graph)
+    assert placement.select(40, ['large', 'small']) == 'small'
+    assert placement.select(100, ['large', 'small']) == 'large'
+
+
+def test_best_fit_consumes_overlapping_groups(graph):
+    graph['tower'] = dict(capacity_total=200, consumed_capacity=0)
+    placement = BestFitPlacement(graph, ig_ig_mapping={'large': ['large', 'tower']})
+    placement.consume(30, 'large')
+    assert graph['large']['consumed_capacity'] == 30
+    assert graph['tower']['consumed_capacity'] == 30
+    assert graph['small']['consumed_capacity'] == 0
+
+
+def test_reserve_holds_back_largest_group(graph):
+    graph['large']['consumed_capacity'] = 190
+    placement = GreedyPlacement(graph, reserve_capacity=True)
+    assert placement.select(100, ['large']) is None
+    assert placement.reserve(100, ['small', 'large']) == 'large'
+    assert placement.select(5, ['large']) is None
+    assert placement.select(5, ['large', 'small']) == 'small'
+
+
+def test_reserve_disabled(graph):
+    placement = GreedyPlacement(graph)
+    assert placement.reserve(100, ['large']) is None
+    assert placement.reserved == set()
+
+
+def test_unknown_placement_falls_back_to_greedy(graph):
+    assert type(get_placement(graph, name='nope', reserve_capacity=False)) is GreedyPlacement
+
+
+def test_simulation_best_fit_reduces_wait():
+    recording = {
+        'instance_groups': {
+            'small': {'capacity': 50, 'instances': ['i1']},
+            'large': {'capacity': 200, 'instances': ['i2', 'i3']},
+        },
+        'tasks': [
+            {'id': 1, 'created': 0, 'duration': 100, 'impact': 40, 'instance_groups': ['large', 'small']},
+            {'id': 2, 'created': 0, 'duration': 100, 'impact': 180, 'instance_groups': ['large']},
+        ],
+    }
+    greedy = PlacementSimulation(recording, placement='greedy').report()
+    best_fit = PlacementSimulation(recording, placement='best_fit').report()
+    assert greedy['tasks'] == best_fit['tasks'] == 2
+    assert best_fit['mean_wait'] == 0
+    assert greedy['mean_wait'] > 0
+    assert best_fit['makespan'] < greedy['makespan']
+
+
+def test_simulation_counts_shared_instances():
+    recording = {
+        'instance_groups': {
+            'tower': {'capacity': 100, 'instances': ['i1']},
+            'other': {'capacity': 100, 'instances': ['i1']},
+        },
+        'tasks': [
+            {'id': 1, 'created': 0, 'duration': 30, 'impact': 80, 'instance_groups': ['tower']},
+            {'id': 2, 'created': 0, 'duration': 30, 'impact': 80, 'instance_groups': ['other']},
+        ],
+    }
+    placed = PlacementSimulation(recording, placement='best_fit', cycle=20).run()
+    assert placed[1]['start'] == 0
+    assert placed[2]['start'] == 40
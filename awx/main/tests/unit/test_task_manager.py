@@ -2,48 +2,38 @@
 # All Rights Reserved.
 
 import mock
-import pytest
 
 from django.utils.timezone import now as tz_now
 from django.db import DatabaseError
 
 from awx.main.scheduler import TaskManager
+from awx.main.scheduler.tasks import (
+    TRIGGER_PENDING_KEY,
+    get_trigger_generation,
+    run_job_complete,
+    run_job_launch,
+)
 from awx.main.models import (
     Job,
     Instance,
     InstanceGroup,
+    TaskLease,
 )
 from django.core.cache import cache
 
 
 class TestCleanupInconsistentCeleryTasks():
     @mock.patch.object(cache, 'get', return_value=None)
-    @mock.patch.object(TaskManager, 'get_active_tasks', return_value=([], {}))
-    @mock.patch.object(TaskManager, 'get_running_tasks', return_value=({'host1': [Job(id=2), Job(id=3),]}, []))
-    @mock.patch.object(InstanceGroup.objects, 'prefetch_related', return_value=[])
-    @mock.patch.object(Instance.objects, 'filter', return_value=mock.MagicMock(first=lambda: None))
-    @mock.patch('awx.main.scheduler.task_manager.logger')
-    def test_instance_does_not_exist(self, logger_mock, *args):
-        logger_mock.error = mock.MagicMock(side_effect=RuntimeError("mocked"))
-        tm = TaskManager()
-        with pytest.raises(RuntimeError) as excinfo:
-            tm.cleanup_inconsistent_celery_tasks()
-
-        assert "mocked" in str(excinfo.value)
-        logger_mock.error.assert_called_once_with("Execution node Instance host1 not found in database. "
-                                                  "The node is currently executing jobs ['job 2 (new)', "
-                                                  "'job 3 (new)']")
-
-    @mock.patch.object(cache, 'get', return_value=None)
-    @mock.patch.object(TaskManager, 'get_active_tasks', return_value=([], {'host1': []}))
     @mock.patch.object(InstanceGroup.objects, 'prefetch_related', return_value=[])
-    @mock.patch.object(TaskManager, 'get_running_tasks')
+    @mock.patch.object(TaskLease.objects, 'filter')
+    @mock.patch.object(Instance.objects, 'filter')
+    @mock.patch.object(TaskManager, 'get_lost_tasks')
     @mock.patch('awx.main.scheduler.task_manager.logger')
-    def test_save_failed(self, logger_mock, get_running_tasks, *args):
+    def test_save_failed(self, logger_mock, get_lost_tasks, *args):
         logger_mock.error = mock.MagicMock()
         job = Job(id=2, modified=tz_now(), status='running', celery_task_id='blah', execution_node='host1')
         job.websocket_emit_status = mock.MagicMock()
-        get_running_tasks.return_value = ({'host1': [job]}, [])
+        get_lost_tasks.return_value = [job]
         tm = TaskManager()
 
         with mock.patch.object(job, 'save', side_effect=DatabaseError):
@@ -52,18 +42,53 @@ class TestCleanupInconsistentCeleryTasks():
             logger_mock.error.assert_called_once_with("Task job 2 (failed) DB error in marking failed. Job possibly deleted.")
 
     @mock.patch.object(InstanceGroup.objects, 'prefetch_related', return_value=[])
-    @mock.patch('awx.main.scheduler.task_manager.inspect')
-    def test_multiple_active_instances_sanity_check(self, inspect_mock, *args):
-        class MockInspector:
-            pass
-
-        mock_inspector = MockInspector()
-        mock_inspector.active = lambda: {
-            'celery@host1': [],
-            'celery@host2': []
-        }
-        inspect_mock.return_value = mock_inspector
+    @mock.patch('awx.main.tasks._send_notification_templates')
+    def test_isolated_task_errors(self, notify, *args):
+        job = Job(id=2, modified=tz_now(), status='running', celery_task_id='blah',
+                  execution_node='isolated1', job_explanation='')
+        job.websocket_emit_status = mock.MagicMock()
         tm = TaskManager()
-        active_task_queues, queues = tm.get_active_tasks()
-        assert 'host1' in queues
-        assert 'host2' in queues
+
+        with mock.patch.object(job, 'save'):
+            tm.fail_lost_tasks([job], set(['isolated1']))
+        assert job.status == 'error'
+        assert 'controller management daemon' in job.job_explanation
+        job.websocket_emit_status.assert_called_once_with('error')
+        notify.assert_called_once_with(job, 'failed')
+
+
+class TestDebouncedTrigger():
+    def setup_method(self, method):
+        cache.clear()
+
+    @mock.patch.object(run_job_launch, 'apply_async')
+    def test_triggers_coalesce(self, apply_async):
+        for job_id in (1, 2, 3):
+            run_job_launch.trigger(job_id)
+        apply_async.assert_called_once_with(args=[1], countdown=mock.ANY)
+        assert get_trigger_generation() == 3
+
+        cache.delete(TRIGGER_PENDING_KEY)
+        run_job_launch.trigger(4)
+        assert apply_async.call_count == 2
+
+    @mock.patch.object(InstanceGroup.objects, 'prefetch_related', return_value=[])
+    def test_reschedule_once_when_triggered_during_cycle(self, *args):
+        cache.set(TRIGGER_PENDING_KEY, 1)
+
+        def trigger_during_cycle():
+            if schedule.call_count == 1:
+                run_job_complete.trigger(2)
+
+        with mock.patch.object(run_job_complete, 'apply_async') as apply_async, \
+                mock.patch.object(TaskManager, 'schedule', side_effect=trigger_during_cycle) as schedule:
+            run_job_complete.schedule()
+        assert schedule.call_count == 2
+        assert apply_async.call_count == 0
+        assert cache.get(TRIGGER_PENDING_KEY) is None
+
+    @mock.patch.object(InstanceGroup.objects, 'prefetch_related', return_value=[])
+    @mock.patch.object(TaskManager, 'schedule')
+    def test_no_reschedule_without_triggers(self, schedule, *args):
+        run_job_launch.schedule()
+        assert schedule.call_count == 1
@@ -218,6 +218,9 @@ class TestJobExecution:
         # ignore pre-run and post-run hooks, they complicate testing in a variety of ways
         self.task.pre_run_hook = self.task.post_run_hook = self.task.final_run_hook = mock.Mock()
 
+        # don't take task leases; they use the DB
+        self.task.acquire_lease = self.task.release_lease = mock.Mock()
+
     def teardown_method(self, method):
         for p in self.patches:
             p.stop()
@@ -264,6 +267,19 @@ class TestGenericRun(TestJobExecution):
         ]:
             assert c in self.task.update_model.call_args_list
 
+    def test_lease_released_when_final_update_fails(self):
+        self.task.release_lease = mock.Mock()
+
+        def fail_final_update(pk, **kwargs):
+            if 'result_traceback' in kwargs:
+                raise RuntimeError('database went away')
+            return self.instance
+        self.task.update_model.side_effect = fail_final_update
+
+        with pytest.raises(RuntimeError):
+            self.task.run(self.pk)
+        self.task.release_lease.assert_called_once_with(self.pk, self.task.acquire_lease.return_value)
+
     def test_artifact_cleanup(self):
         path = tempfile.NamedTemporaryFile(delete=False).name
         try:
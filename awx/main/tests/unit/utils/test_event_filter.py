@@ -25,11 +25,6 @@ def fake_callback():
     return []
 
 
-@pytest.fixture
-def fake_cache():
-    return {}
-
-
 @pytest.fixture
 def wrapped_handle(job_event_callback):
     # Preliminary creation of resources usually done in tasks.py
@@ -38,21 +33,17 @@ def wrapped_handle(job_event_callback):
 
 
 @pytest.fixture
-def job_event_callback(fake_callback, fake_cache):
+def job_event_callback(fake_callback):
     def method(event_data):
-        if 'uuid' in event_data:
-            cache_event = fake_cache.get(':1:ev-{}'.format(event_data['uuid']), None)
-            if cache_event is not None:
-                event_data.update(cache_event)
         fake_callback.append(event_data)
     return method
 
 
-def test_event_recomb(fake_callback, fake_cache, wrapped_handle):
+def test_event_recomb(fake_callback, wrapped_handle):
     # Pretend that this is done by the Ansible callback module
-    fake_cache[':1:ev-{}'.format(EXAMPLE_UUID)] = {'event': 'foo'}
     write_encoded_event_data(wrapped_handle, {
-        'uuid': EXAMPLE_UUID
+        'uuid': EXAMPLE_UUID,
+        'event': 'foo'
     })
     wrapped_handle.write('\r\nTASK [Gathering Facts] *********************************************************\n')
     wrapped_handle.write('\u001b[0;33mchanged: [localhost]\u001b[0m\n')
@@ -89,11 +80,11 @@ def test_verbose_event_no_markings(fake_callback, wrapped_handle):
     assert wrapped_handle._fileobj.getvalue() == 'Running tower-manage command \n'
 
 
-def test_large_data_payload(fake_callback, fake_cache, wrapped_handle):
+def test_large_data_payload(fake_callback, wrapped_handle):
     # Pretend that this is done by the Ansible callback module
-    fake_cache[':1:ev-{}'.format(EXAMPLE_UUID)] = {'event': 'foo'}
     event_data_to_encode = {
         'uuid': EXAMPLE_UUID,
+        'event': 'foo',
         'host': 'localhost',
         'role': 'some_path_to_role'
     }
@@ -110,3 +101,46 @@ def test_large_data_payload(fake_callback, fake_cache, wrapped_handle):
     assert recomb_data['role'] == 'some_path_to_role'
     assert 'event' in recomb_data
     assert recomb_data['event'] == 'foo'
+
+
+def test_event_data_split_across_writes(fake_callback, wrapped_handle):
+    stdout = cStringIO.StringIO()
+    write_encoded_event_data(stdout, {'uuid': EXAMPLE_UUID, 'event': 'foo'})
+    stdout.write('\r\nTASK [Gathering Facts] ***\r\n')
+    write_encoded_event_data(stdout, {})
+    for char in stdout.getvalue():
+        wrapped_handle.write(char)
+
+    assert len(fake_callback) == 1
+    assert fake_callback[0]['event'] == 'foo'
+    assert fake_callback[0]['stdout'] == '\r\nTASK [Gathering Facts] ***'
+    assert wrapped_handle._fileobj.getvalue() == '\r\nTASK [Gathering Facts] ***\r\n'
+
+
+def test_stray_marker_not_rescanned(fake_callback, wrapped_handle):
+    wrapped_handle.write('progress\x1b[K 10%\n')
+    wrapped_handle.write('more verbose output\n' * 10)
+    assert wrapped_handle._buffer == ''
+    wrapped_handle.write('partial\x1b[')
+    assert wrapped_handle._buffer == '\x1b['
+    write_encoded_event_data(wrapped_handle, {'uuid': EXAMPLE_UUID})
+
+    assert len(fake_callback) == 12
+    assert fake_callback[-1]['stdout'] == 'partial'
+    assert wrapped_handle._buffer == ''
+    assert wrapped_handle._fileobj.getvalue().endswith('more verbose output\npartial\x1b[')
+
+
+def test_close_emits_buffered_stdout(fake_callback, wrapped_handle):
+    wrapped_handle.write('no newline at the end')
+    wrapped_handle.close()
+    assert [e['event'] for e in fake_callback] == ['verbose']
+
+
+def test_close_callback_runs_when_close_fails(fake_callback, job_event_callback, mocker):
+    stdout_handle = mocker.Mock(close=mocker.Mock(side_effect=IOError('disk full')))
+    close_callback = mocker.Mock()
+    wrapped_handle = OutputEventFilter(stdout_handle, job_event_callback, close_callback=close_callback)
+    with pytest.raises(IOError):
+        wrapped_handle.close()
+    assert close_callback.call_count == 1
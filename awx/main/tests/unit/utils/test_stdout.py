@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+import gzip
+import os
+
+import pytest
+
+from awx.main.utils.stdout import (
+    StdoutWriter, GzipBlockWriter, index_path, blocks_path, read_stdout_lines, remove_stdout_file,
+    open_stdout_file, stdout_file_size, iter_stdout_file,
+    filter_stdout, STDOUT_ANSI_RE, STDOUT_ANSI_CRLF_RE, RenderedStdoutCache
+)
+
+
+@pytest.fixture
+def stdout_path(tmpdir):
+    return str(tmpdir.join('1-abc.out'))
+
+
+@pytest.fixture
+def gzip_stdout_path(tmpdir):
+    return str(tmpdir.join('1-abc.out.gz'))
+
+
+def write_stdout(path, text, index_interval=3, chunk_size=7, close=True, **kwargs):
+    writer = StdoutWriter(path, index_interval=index_interval, **kwargs)
+    for i in xrange(0, len(text), chunk_size):
+        writer.write(text[i:i + chunk_size])
+    if close:
+        writer.close()
+    else:
+        writer.flush(force=True)
+    return writer
+
+
+@pytest.mark.parametrize('compress', [False, True])
+@pytest.mark.parametrize('tail', [u'', u'no newline'])
+@pytest.mark.parametrize('start_line, end_line', [
+    (0, None), (4, 9), (9, 4), (0, 100), (-5, None), (-100, None), (2, -2), (25, None)
+])
+def test_read_stdout_lines(stdout_path, gzip_stdout_path, start_line, end_line, tail, compress):
+    lines = [u'line {} é\r\n'.format(i) for i in xrange(20)]
+    if tail:
+        lines.append(tail)
+    path = gzip_stdout_path if compress else stdout_path
+    write_stdout(path, u''.join(lines), compress=compress, block_size=16)
+
+    content, start, end, total = read_stdout_lines(path, start_line, end_line)
+    assert content == u''.join(lines[start_line:end_line])
+    assert content == u''.join(lines[start:end])
+    assert total == len(lines)
+
+
+def test_index_only_has_every_nth_line(stdout_path):
+    writer = write_stdout(stdout_path, u'x\n' * 10, index_interval=4)
+    assert writer.tell() == 20
+    # the interval, then the offsets of lines 4 and 8
+    assert os.path.getsize(index_path(stdout_path)) == 3 * 8
+
+
+def test_offsets_past_the_flushed_stdout_are_ignored(stdout_path):
+    write_stdout(stdout_path, u'x\n' * 10)
+    with open(stdout_path, 'r+b') as f:
+        f.truncate(9)
+    assert read_stdout_lines(stdout_path, -2) == (u'x\nx', 3, 5, 5)
+
+
+def test_read_stdout_lines_without_index(stdout_path):
+    with open(stdout_path, 'w') as f:
+        f.write('x\n')
+    assert read_stdout_lines(stdout_path) is None
+
+
+def test_remove_stdout_file(gzip_stdout_path):
+    write_stdout(gzip_stdout_path, u'x\n', compress=True)
+    remove_stdout_file(gzip_stdout_path)
+    assert not os.path.exists(gzip_stdout_path)
+    assert not os.path.exists(index_path(gzip_stdout_path))
+    assert not os.path.exists(blocks_path(gzip_stdout_path))
+    remove_stdout_file(gzip_stdout_path)
+
+
+@pytest.mark.parametrize('block_size', [1, 10, 1048576])
+def test_compressed_stdout(gzip_stdout_path, block_size):
+    stdout = u''.join(u'\x1b[0;32mok: [web{}] é\x1b[0m\r\n'.format(i) for i in xrange(100))
+    data = stdout.encode('utf-8')
+    write_stdout(gzip_stdout_path, stdout, compress=True, block_size=block_size)
+
+    assert gzip.open(gzip_stdout_path).read() == data
+    assert stdout_file_size(gzip_stdout_path) == len(data)
+    assert ''.join(iter_stdout_file(gzip_stdout_path)) == data
+    with open_stdout_file(gzip_stdout_path) as f:
+        for offset in (1000, 10, len(data) - 3, len(data) + 10, 0):
+            f.seek(offset)
+            assert f.tell() == min(offset, len(data))
+            assert f.read(20) == data[offset:offset + 20]
+        f.seek(5)
+        assert f.readline() == data[5:data.index('\n') + 1]
+
+
+def test_unfinished_compressed_stdout(gzip_stdout_path):
+    # A running job's stdout is readable up to where it was last flushed.
+    write_stdout(gzip_stdout_path, u'x\n' * 10, compress=True, block_size=8, close=False)
+    assert stdout_file_size(gzip_stdout_path) == 20
+    assert read_stdout_lines(gzip_stdout_path, -3) == (u'x\nx\nx\n', 7, 10, 10)
+
+
+def test_compressed_stdout_sync_is_throttled(gzip_stdout_path):
+    writer = GzipBlockWriter(gzip_stdout_path, sync_bytes=10, sync_interval=3600)
+    writer.write('x\n')
+    writer.flush()
+    assert stdout_file_size(gzip_stdout_path) == 0
+    writer.write('x\n' * 5)
+    writer.flush()
+    assert stdout_file_size(gzip_stdout_path) == 12
+    writer.write('x')
+    writer.flush(force=True)
+    assert stdout_file_size(gzip_stdout_path) == 13
+    writer.close()
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 5, 1000])
+def test_filter_stdout(chunk_size):
+    stdout = (
+        '\x1b[0;32mok: [web1]\x1b[0m\r\n'
+        '\x1b[KZm9v\x1b[4D\x1b[Kchanged\r\r\n'
+        'no color \x1b[ here\n'
+        'done\r'
+    )
+    chunks = [stdout[i:i + chunk_size] for i in xrange(0, len(stdout), chunk_size)]
+    assert ''.join(filter_stdout(chunks, STDOUT_ANSI_RE)) == (
+        'ok: [web1]\r\nchanged\r\r\nno color \x1b[ here\ndone\r'
+    )
+    assert ''.join(filter_stdout(chunks, STDOUT_ANSI_CRLF_RE)) == (
+        'ok: [web1]\nchanged\r\nno color \x1b[ here\ndone\r'
+    )
+
+
+def test_rendered_stdout_cache_evicts_by_size():
+    cache = RenderedStdoutCache(max_bytes=10)
+    cache.set('a', 'aaaa', 4)
+    cache.set('b', 'bbbb', 4)
+    assert cache.get('a') == 'aaaa'
+    # b is the least recently used, and has to go for c to fit
+    cache.set('c', 'cccc', 4)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c'), cache.size) == ('aaaa', 'cccc', 8)
+    # too large to ever fit, and evicts nothing
+    cache.set('d', 'd' * 11, 11)
+    assert (cache.get('d'), len(cache), cache.size) == (None, 2, 8)
+    cache.set('a', 'aaaaaaaa', 8)
+    assert (cache.get('a'), cache.get('c'), cache.size) == ('aaaaaaaa', None, 8)
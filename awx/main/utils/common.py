@@ -33,6 +33,9 @@ from django.utils.encoding import smart_str
 from django.utils.text import slugify
 from django.apps import apps
 
+# AWX
+from awx.main.constants import ANSI_SGR_PATTERN
+
 logger = logging.getLogger('awx.main.utils')
 
 __all__ = ['get_object_or_400', 'get_object_or_403', 'camelcase_to_underscore', 'memoize', 'memoize_delete',
@@ -45,7 +48,7 @@ __all__ = ['get_object_or_400', 'get_object_or_403', 'camelcase_to_underscore',
            'callback_filter_out_ansible_extra_vars', 'get_search_fields', 'get_system_task_capacity',
            'wrap_args_with_proot', 'build_proot_temp_dir', 'check_proot_installed', 'model_to_dict',
            'model_instance_diff', 'timestamp_apiformat', 'parse_yaml_or_json', 'RequireDebugTrueOrTest',
-           'has_model_field_prefetched', 'set_environ', 'IllegalArgumentError',]
+           'has_model_field_prefetched', 'set_environ', 'IllegalArgumentError', 'truncate_stdout',]
 
 
 def get_object_or_400(klass, *args, **kwargs):
@@ -767,6 +770,24 @@ def timestamp_apiformat(timestamp):
     return timestamp
 
 
+def truncate_stdout(stdout, max_bytes):
+    '''
+    Truncate event stdout to max_bytes for display, closing any ANSI color
+    sequence left open by the cut.
+    '''
+    if max_bytes <= 0 or len(stdout) < max_bytes:
+        return stdout
+    stdout = stdout[:(max_bytes - 1)] + u'\u2026'
+    set_count = 0
+    reset_count = 0
+    for m in ANSI_SGR_PATTERN.finditer(stdout):
+        if m.string[m.start():m.end()] == u'\u001b[0m':
+            reset_count += 1
+        else:
+            set_count += 1
+    return stdout + u'\u001b[0m' * (set_count - reset_count)
+
+
 # damn you python 2.6
 def timedelta_total_seconds(timedelta):
     return (
@@ -809,16 +830,27 @@ def get_current_apps():
 class OutputEventFilter(object):
     '''
     File-like object that looks for encoded job events in stdout data.
+
+    Data is only searched once: the stdout preceding the next event is kept
+    as a list of chunks, and only the tail of the data that may still turn
+    into encoded event data is searched again on the next write().
+
+    The encoded event data is left out of what is written to fileobj; that
+    tail is held back until it turns out not to be event data.
     '''
 
     EVENT_DATA_RE = re.compile(r'\x1b\[K((?:[A-Za-z0-9+/=]+\x1b\[\d+D)+)\x1b\[K')
+    # Incomplete encoded event data at the end of the buffer
+    EVENT_DATA_PREFIX_RE = re.compile(r'\x1b\[K(?:[A-Za-z0-9+/=]|\x1b\[\d+D)*(?:\x1b(?:\[\d*)?)?\Z')
 
-    def __init__(self, fileobj=None, event_callback=None, raw_callback=None):
+    def __init__(self, fileobj=None, event_callback=None, raw_callback=None, close_callback=None):
         self._fileobj = fileobj
         self._event_callback = event_callback
         self._raw_callback = raw_callback
+        self._close_callback = close_callback
         self._counter = 1
         self._start_line = 0
+        self._stdout_chunks = []
         self._buffer = ''
         self._current_event_data = None
 
@@ -826,13 +858,13 @@ class OutputEventFilter(object):
         return getattr(self._fileobj, attr)
 
     def write(self, data):
-        if self._fileobj:
-            self._fileobj.write(data)
-        self._buffer += data
         if self._raw_callback:
             self._raw_callback(data)
+        buf = self._buffer + data
+        pos = 0
+        stdout_chunks = []
         while True:
-            match = self.EVENT_DATA_RE.search(self._buffer)
+            match = self.EVENT_DATA_RE.search(buf, pos)
             if not match:
                 break
             try:
@@ -840,15 +872,49 @@ class OutputEventFilter(object):
                 event_data = json.loads(base64.b64decode(base64_data))
             except ValueError:
                 event_data = {}
-            self._emit_event(self._buffer[:match.start()], event_data)
-            self._buffer = self._buffer[match.end():]
+            stdout_chunks.append(buf[pos:match.start()])
+            self._stdout_chunks.append(stdout_chunks[-1])
+            self._emit_event(''.join(self._stdout_chunks), event_data)
+            self._stdout_chunks = []
+            pos = match.end()
+        scan_start = self._scan_start(buf, pos)
+        if scan_start > pos:
+            stdout_chunks.append(buf[pos:scan_start])
+            self._stdout_chunks.append(stdout_chunks[-1])
+        self._buffer = buf[scan_start:]
+        if self._fileobj and stdout_chunks:
+            self._fileobj.write(''.join(stdout_chunks))
+
+    def _scan_start(self, buf, pos):
+        '''
+        Where the next search for encoded event data must start: the last
+        event data start marker of buf, if what follows it may still be event
+        data, or else a trailing partial start marker.
+        '''
+        marker = buf.rfind('\x1b[K', pos)
+        if marker >= 0 and self.EVENT_DATA_PREFIX_RE.match(buf, marker):
+            return marker
+        for partial in ('\x1b[', '\x1b'):
+            if buf.endswith(partial):
+                return max(pos, len(buf) - len(partial))
+        return len(buf)
 
     def close(self):
-        if self._fileobj:
-            self._fileobj.close()
-        if self._buffer:
-            self._emit_event(self._buffer)
+        try:
+            if self._fileobj:
+                if self._buffer:
+                    self._fileobj.write(self._buffer)
+                self._fileobj.close()
+            self._stdout_chunks.append(self._buffer)
+            buffered_stdout = ''.join(self._stdout_chunks)
+            self._stdout_chunks = []
             self._buffer = ''
+            if buffered_stdout:
+                self._emit_event(buffered_stdout)
+        finally:
+            # Publishes the events already emitted, whatever happened above
+            if self._close_callback:
+                self._close_callback()
 
     def _emit_event(self, buffered_stdout, next_event_data=None):
         if self._current_event_data:
@@ -871,7 +937,7 @@ class OutputEventFilter(object):
             if self._event_callback:
                 self._event_callback(event_data)
 
-        if next_event_data.get('uuid', None):
+        if next_event_data and next_event_data.get('uuid', None):
             self._current_event_data = next_event_data
         else:
             self._current_event_data = None
@@ -4,6 +4,7 @@
 # Django database
 from django.db.migrations.loader import MigrationLoader
 from django.db import connection
+from django.db.models import Max
 
 # Python
 import re
@@ -20,3 +21,20 @@ def get_tower_migration_version():
                 if migration_version > v:
                     v = migration_version
     return v
+
+
+def allocate_ids(model, count):
+    '''
+    Reserve count primary keys for model, so rows can be created with
+    bulk_create() (which doesn't return them) and referred to afterwards.
+    '''
+    if count <= 0:
+        return []
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT nextval(pg_get_serial_sequence(%s, %s)) FROM generate_series(1, %s)',
+                           [model._meta.db_table, model._meta.pk.column, count])
+            return [row[0] for row in cursor.fetchall()]
+    # Development and test databases (sqlite) only have a single writer
+    last_id = model.objects.aggregate(last_id=Max('pk'))['last_id'] or 0
+    return range(last_id + 1, last_id + 1 + count)
@@ -35,7 +35,7 @@ class LogstashFormatter(LogstashFormatterVersion1):
         Output a dictionary which will be passed in logstash or syslog format
         to the logging receiver
         '''
-        if kind == 'activity_stream':
+        if kind in ('activity_stream', 'task_manager', 'callback_receiver'):
             return raw_data
         elif kind == 'system_tracking':
             data = copy(raw_data['ansible_facts'])
@@ -0,0 +1,569 @@
+# Copyright (c) 2017 Ansible by Red Hat
+# All Rights Reserved.
+
+# Python
+import os
+import re
+import struct
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+
+# Django
+from django.conf import settings
+from django.db import connection, transaction
+
+__all__ = ['StdoutWriter', 'GzipBlockWriter', 'GzipBlockReader', 'index_path', 'blocks_path',
+           'open_stdout_file', 'stdout_file_size', 'read_stdout_lines', 'remove_stdout_file',
+           'iter_stdout_file', 'iter_event_stdout', 'filter_stdout',
+           'RenderedStdoutCache', 'rendered_stdout_cache',
+           'STDOUT_ANSI_RE', 'STDOUT_ANSI_CRLF_RE', 'STDOUT_CRLF_RE']
+
+# Each entry of a line-offset index is a little-endian unsigned 64-bit
+# integer. The first one is the interval N the index was built with, entry k
+# (k >= 1) is the byte offset at which line k * N of the stdout file starts.
+INDEX_ENTRY = struct.Struct('<Q')
+INDEX_SUFFIX = '.index'
+# Compressed stdout files are gzip files made of one gzip member per block of
+# block size bytes of stdout. Their .blocks file has the same layout as a
+# line-offset index: the block size, then the offset at which block k starts
+# in the compressed file.
+GZIP_SUFFIX = '.gz'
+BLOCKS_SUFFIX = '.blocks'
+GZIP_WBITS = zlib.MAX_WBITS | 16
+READ_CHUNK_SIZE = 65536
+EVENT_STDOUT_CHUNK_SIZE = 1000
+
+# ANSI escape sequences used to embed event data, and ANSI color escape
+# sequences; neither spans lines.
+STDOUT_ANSI_RE = re.compile(r'\x1b\[K(?:[A-Za-z0-9+/=]+\x1b\[\d+D)+\x1b\[K|\x1b[^m\n]*m')
+# The same, along with the carriage return of every \r\n line ending.
+STDOUT_ANSI_CRLF_RE = re.compile(r'\r(?=\n)|' + STDOUT_ANSI_RE.pattern)
+STDOUT_CRLF_RE = re.compile(r'\r(?=\n)')
+
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+
+def blocks_path(path):
+    return path + BLOCKS_SUFFIX
+
+
+def remove_stdout_file(path):
+    '''
+    Remove a stdout file along with its line-offset index and block offsets.
+    '''
+    for p in (path, index_path(path), blocks_path(path)):
+        try:
+            os.remove(p)
+        except OSError:
+            pass
+
+
+def _read_index_entry(index_file, k):
+    index_file.seek(k * INDEX_ENTRY.size)
+    return INDEX_ENTRY.unpack(index_file.read(INDEX_ENTRY.size))[0]
+
+
+class GzipBlockWriter(object):
+    '''
+    File-like object that compresses what is written to it into path as a
+    gzip member per block_size bytes, and records the offset of every member
+    in a .blocks file next to it, so that reading can start at any block.
+
+    flush() makes all the data written so far readable without ending the
+    current member. As that costs compression when it's done every few lines,
+    it is only done once sync_bytes of data were written or sync_interval
+    seconds went by since it was last done, unless forced.
+    '''
+
+    def __init__(self, path, block_size=1048576, level=6, sync_bytes=65536, sync_interval=1.0):
+        self.name = path
+        self.block_size = block_size
+        self.level = level
+        self.sync_bytes = sync_bytes
+        self.sync_interval = sync_interval
+        self._unsynced = 0
+        self._last_sync = time.time()
+        self._file = open(path, 'wb')
+        self._blocks_file = open(blocks_path(path), 'wb')
+        self._blocks_file.write(INDEX_ENTRY.pack(block_size))
+        self._offset = 0
+        self._block_left = block_size
+        self._dirty = False
+        self._compress = zlib.compressobj(level, zlib.DEFLATED, GZIP_WBITS)
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def _write(self, data):
+        self._file.write(data)
+        self._offset += len(data)
+
+    def _end_block(self):
+        self._write(self._compress.flush())
+        self._compress = zlib.compressobj(self.level, zlib.DEFLATED, GZIP_WBITS)
+        self._block_left = self.block_size
+        self._dirty = False
+        self._unsynced = 0
+
+    def write(self, data):
+        while len(data) >= self._block_left:
+            self._write(self._compress.compress(data[:self._block_left]))
+            data = data[self._block_left:]
+            self._end_block()
+            self._blocks_file.write(INDEX_ENTRY.pack(self._offset))
+        if data:
+            self._write(self._compress.compress(data))
+            self._block_left -= len(data)
+            self._dirty = True
+            self._unsynced += len(data)
+
+    def flush(self, force=False):
+        now = time.time()
+        if self._dirty and (force or self._unsynced >= self.sync_bytes or
+                            now - self._last_sync >= self.sync_interval):
+            self._write(self._compress.flush(zlib.Z_SYNC_FLUSH))
+            self._dirty = False
+            self._unsynced = 0
+            self._last_sync = now
+        self._file.flush()
+        self._blocks_file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            if self._block_left < self.block_size:
+                self._end_block()
+            self.flush()
+            self._file.close()
+            self._blocks_file.close()
+
+
+class GzipBlockReader(object):
+    '''
+    Read-only file-like object for files written by GzipBlockWriter, that
+    seeks to an offset of the uncompressed data by decompressing from the
+    start of its block. A last member that isn't finished yet is read up to
+    where it was last flushed.
+    '''
+
+    def __init__(self, path):
+        self.name = path
+        self._file = open(path, 'rb')
+        try:
+            self._blocks_file = open(blocks_path(path), 'rb')
+        except IOError:
+            self._file.close()
+            raise
+        self._blocks = os.fstat(self._blocks_file.fileno()).st_size // INDEX_ENTRY.size
+        if self._blocks:
+            self.block_size = _read_index_entry(self._blocks_file, 0)
+        else:
+            # Nothing flushed yet, read everything as a single block.
+            self._blocks = 1
+            self.block_size = sys.maxint
+        self._start_block(0)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def close(self):
+        self._file.close()
+        self._blocks_file.close()
+
+    def _start_block(self, k):
+        '''
+        Go to the start of the closest block at or before block k that has
+        been written, return its number.
+        '''
+        compressed_size = os.fstat(self._file.fileno()).st_size
+        k = min(k, self._blocks - 1)
+        offset = 0
+        while k > 0:
+            offset = _read_index_entry(self._blocks_file, k)
+            if offset <= compressed_size:
+                break
+            k -= 1
+        self._file.seek(offset if k > 0 else 0)
+        self._decompress = zlib.decompressobj(GZIP_WBITS)
+        self._pending = ''
+        self._buffer = ''
+        self._buffer_pos = 0
+        self._pos = k * self.block_size
+        return k
+
+    def _fill(self):
+        '''
+        Decompress at most READ_CHUNK_SIZE more bytes into the buffer, return
+        False at the end of the data.
+        '''
+        while True:
+            if not self._pending:
+                self._pending = self._file.read(READ_CHUNK_SIZE)
+                if not self._pending:
+                    return False
+            data = self._decompress.decompress(self._pending, READ_CHUNK_SIZE)
+            if self._decompress.unused_data:
+                # The member ended, the next one starts with what's left.
+                self._pending = self._decompress.unused_data
+                self._decompress = zlib.decompressobj(GZIP_WBITS)
+            else:
+                self._pending = self._decompress.unconsumed_tail
+            if data:
+                self._buffer = self._buffer[self._buffer_pos:] + data
+                self._buffer_pos = 0
+                return True
+
+    def _take(self, end):
+        data = self._buffer[self._buffer_pos:end]
+        self._buffer_pos += len(data)
+        self._pos += len(data)
+        return data
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._pos
+        elif whence == os.SEEK_END:
+            offset += self.size()
+        if offset < self._pos or offset // self.block_size > self._pos // self.block_size:
+            self._start_block(offset // self.block_size)
+        while self._pos < offset:
+            if self._buffer_pos == len(self._buffer) and not self._fill():
+                break
+            self._take(self._buffer_pos + offset - self._pos)
+
+    def size(self):
+        '''
+        The size of the uncompressed data, only the last block of which is
+        decompressed to get it.
+        '''
+        pos = self._pos
+        self._start_block(self._blocks)
+        while self._fill():
+            self._take(len(self._buffer))
+        size = self._pos
+        self.seek(pos)
+        return size
+
+    def read(self, size=-1):
+        chunks = []
+        while size != 0:
+            if self._buffer_pos == len(self._buffer) and not self._fill():
+                break
+            data = self._take(len(self._buffer) if size < 0 else self._buffer_pos + size)
+            chunks.append(data)
+            if size > 0:
+                size -= len(data)
+        return ''.join(chunks)
+
+    def readline(self):
+        chunks = []
+        while True:
+            end = self._buffer.find('\n', self._buffer_pos)
+            if end >= 0:
+                chunks.append(self._take(end + 1))
+                break
+            chunks.append(self._take(len(self._buffer)))
+            if not self._fill():
+                break
+        return ''.join(chunks)
+
+
+def open_stdout_file(path):
+    '''
+    Open a stdout file for reading as bytes, decompressing it if needed.
+    '''
+    if path.endswith(GZIP_SUFFIX):
+        return GzipBlockReader(path)
+    return open(path, 'rb')
+
+
+def stdout_file_size(path):
+    '''
+    The size of the (uncompressed) content of a stdout file.
+    '''
+    if path.endswith(GZIP_SUFFIX):
+        with GzipBlockReader(path) as f:
+            return f.size()
+    return os.path.getsize(path)
+
+
+class StdoutWriter(object):
+    '''
+    File-like object that writes job stdout as UTF-8 to path, and a sidecar
+    index of the byte offset of every index_interval-th line next to it, so
+    that a range of lines can be read without reading the lines before it.
+    With compress, path is written by a GzipBlockWriter and the offsets are
+    those of the uncompressed stdout.
+
+    Index entries are only written once the stdout they point into has been
+    flushed to the file; a compressed file may not be readable that far until
+    its writer syncs, and readers ignore the entries past its end.
+    '''
+
+    def __init__(self, path, index_interval=100, compress=False, block_size=1048576):
+        self.name = path
+        self.index_interval = index_interval
+        if compress:
+            self._file = GzipBlockWriter(path, block_size=block_size)
+        else:
+            self._file = open(path, 'wb')
+        self._index_file = open(index_path(path), 'wb')
+        self._index_file.write(INDEX_ENTRY.pack(index_interval))
+        self._offset = 0
+        self._lines = 0
+        self._pending_offsets = []
+
+    @property
+    def closed(self):
+        return self._file.closed
+
+    def write(self, data):
+        if isinstance(data, unicode):
+            data = data.encode('utf-8')
+        if not data:
+            return
+        newlines = data.count('\n')
+        # Only look for the newlines that end an indexed line.
+        next_indexed = self._lines - self._lines % self.index_interval + self.index_interval
+        if self._lines + newlines >= next_indexed:
+            pos = -1
+            for line in xrange(self._lines, next_indexed):
+                pos = data.index('\n', pos + 1)
+            while True:
+                self._pending_offsets.append(self._offset + pos + 1)
+                next_indexed += self.index_interval
+                if self._lines + newlines < next_indexed:
+                    break
+                for line in xrange(self.index_interval):
+                    pos = data.index('\n', pos + 1)
+        self._file.write(data)
+        self._offset += len(data)
+        self._lines += newlines
+        if self._pending_offsets:
+            self.flush()
+
+    def tell(self):
+        return self._offset
+
+    def flush(self, force=False):
+        if isinstance(self._file, GzipBlockWriter):
+            self._file.flush(force=force)
+        else:
+            self._file.flush()
+        if self._pending_offsets:
+            self._index_file.write(''.join(INDEX_ENTRY.pack(o) for o in self._pending_offsets))
+            self._pending_offsets = []
+        self._index_file.flush()
+
+    def close(self):
+        if not self._file.closed:
+            self.flush(force=True)
+            self._file.close()
+            self._index_file.close()
+
+
+def _skip_lines(fileobj, count):
+    for i in xrange(count):
+        if not fileobj.readline():
+            break
+
+
+def _count_lines(fileobj):
+    '''
+    Count the lines from the current position of fileobj to its end, a
+    last line without a trailing newline included.
+    '''
+    count = 0
+    last = ''
+    while True:
+        chunk = fileobj.read(READ_CHUNK_SIZE)
+        if not chunk:
+            break
+        count += chunk.count('\n')
+        last = chunk[-1]
+    if last and last != '\n':
+        count += 1
+    return count
+
+
+def read_stdout_lines(path, start_line=0, end_line=None):
+    '''
+    Read lines start_line to end_line (as in a slice of the list of lines) of
+    a stdout file written by StdoutWriter, using its line-offset index to
+    only read the lines asked for, and the N lines at most before them.
+
+    Return (content, start, end, total_lines), or None if the file has no
+    index.
+    '''
+    try:
+        index_file = open(index_path(path), 'rb')
+    except IOError:
+        return None
+    try:
+        stdout_file = open_stdout_file(path)
+    except IOError:
+        index_file.close()
+        return None
+    with index_file, stdout_file:
+        index_size = os.fstat(index_file.fileno()).st_size // INDEX_ENTRY.size
+        if index_size < 1:
+            return None
+        interval = _read_index_entry(index_file, 0)
+        if isinstance(stdout_file, GzipBlockReader):
+            stdout_size = stdout_file.size()
+        else:
+            stdout_size = os.fstat(stdout_file.fileno()).st_size
+
+        def seek_line(line):
+            # Go to the closest indexed line at or before line, return it.
+            k = min(line // interval, index_size - 1)
+            while k > 0:
+                offset = _read_index_entry(index_file, k)
+                if offset <= stdout_size:
+                    stdout_file.seek(offset)
+                    return k * interval
+                k -= 1
+            stdout_file.seek(0)
+            return 0
+
+        # Only the lines after the last index entry are counted.
+        total_lines = seek_line(index_size * interval)
+        total_lines += _count_lines(stdout_file)
+
+        start, end, step = slice(start_line, end_line).indices(total_lines)
+        lines = []
+        if start < end:
+            _skip_lines(stdout_file, start - seek_line(start))
+            for i in xrange(end - start):
+                line = stdout_file.readline()
+                if not line:
+                    break
+                lines.append(line)
+    return ''.join(lines).decode('utf-8', 'replace'), start, end, total_lines
+
+
+def iter_stdout_file(path):
+    '''
+    Yield the content of a stdout file in chunks of READ_CHUNK_SIZE bytes.
+    '''
+    with open_stdout_file(path) as f:
+        while True:
+            chunk = f.read(READ_CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+
+
+def iter_event_stdout(tablename, related_name, job_id, chunk_size=EVENT_STDOUT_CHUNK_SIZE):
+    '''
+    Yield the stdout of the events of a job in order, one line per event,
+    chunk_size events at a time. On PostgreSQL the events are read through
+    a server-side cursor so only one chunk of them is ever in memory.
+    '''
+    sql = 'SELECT stdout FROM {} WHERE {} = %s ORDER BY start_line'.format(tablename, related_name)
+    with transaction.atomic():
+        if connection.vendor == 'postgresql':
+            connection.ensure_connection()
+            cursor = connection.connection.cursor(name='event_stdout_{}'.format(uuid.uuid4().hex))
+            cursor.itersize = chunk_size
+        else:
+            cursor = connection.cursor()
+        try:
+            cursor.execute(sql, [job_id])
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                if not rows:
+                    break
+                yield u''.join(stdout + u'\n' for stdout, in rows)
+        finally:
+            cursor.close()
+
+
+def filter_stdout(chunks, pattern):
+    '''
+    Remove every match of pattern, which must not match across lines, from a
+    stream of stdout chunks in a single pass. The end of a chunk that may
+    still be part of a match, from the first escape sequence of its last
+    line on, is held back until the next one.
+    '''
+    tail = ''
+    for chunk in chunks:
+        data = tail + chunk
+        cut = data.find('\x1b', data.rfind('\n') + 1)
+        if cut < 0:
+            cut = len(data) - 1 if data.endswith('\r') else len(data)
+        tail = data[cut:]
+        data = pattern.sub('', data[:cut])
+        if data:
+            yield data
+    if tail:
+        yield pattern.sub('', tail)
+
+
+class RenderedStdoutCache(object):
+    '''
+    Per-process LRU cache of rendered stdout, bounded by the total size of
+    the entries it holds rather than by their number: the least recently
+    used entries are evicted until a new one fits, and an entry larger than
+    the whole cache is never kept.
+    '''
+
+    def __init__(self, max_bytes=None):
+        self._max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.size = 0
+
+    @property
+    def max_bytes(self):
+        if self._max_bytes is None:
+            return getattr(settings, 'STDOUT_RENDER_CACHE_MAX_BYTES', 0)
+        return self._max_bytes
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None:
+                return None
+            self._entries[key] = entry
+            return entry[0]
+
+    def set(self, key, value, size):
+        max_bytes = self.max_bytes
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1]
+            if size > max_bytes:
+                return
+            while self._entries and self.size + size > max_bytes:
+                self.size -= self._entries.popitem(last=False)[1][1]
+            self._entries[key] = (value, size)
+            self.size += size
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+
+rendered_stdout_cache = RenderedStdoutCache()
@@ -179,6 +179,21 @@ EVENT_STDOUT_MAX_BYTES_DISPLAY = 1024
 # Note that this can be recreated if the stdout is downloaded
 LOCAL_STDOUT_EXPIRE_TIME = 2592000
 
+# Every STDOUT_INDEX_INTERVAL lines the byte offset of the next line of a stdout
+# file is recorded in its .index file, which lets a range of lines be read
+# without reading the whole file.
+STDOUT_INDEX_INTERVAL = 100
+
+# Write stdout files gzip compressed, as one gzip member per
+# STDOUT_COMPRESSION_BLOCK_SIZE bytes of stdout so that reading a range of
+# lines only decompresses the blocks they are in.
+STDOUT_COMPRESSION = False
+STDOUT_COMPRESSION_BLOCK_SIZE = 1048576
+
+# Each API process keeps up to this many bytes of the stdout of finished jobs
+# rendered to HTML, least recently viewed first out; 0 disables it.
+STDOUT_RENDER_CACHE_MAX_BYTES = 33554432
+
 # The number of processes spawned by the callback receiver to process job
 # events into the database
 JOB_EVENT_WORKERS = 4
@@ -186,6 +201,36 @@ JOB_EVENT_WORKERS = 4
 # The maximum size of the job event worker queue before requests are blocked
 JOB_EVENT_MAX_QUEUE_SIZE = 10000
 
+# Events are routed to a worker by job. When that worker's queue is full they
+# go to the next worker with room; when all queues are full the receiver waits
+# up to JOB_EVENT_QUEUE_TIMEOUT seconds for the first worker before dropping
+# the event.
+JOB_EVENT_QUEUE_TIMEOUT = 5
+
+# Seconds between two reports of the job event workers' queue depth,
+# throughput and drop counters to the callback_receiver logger.
+JOB_EVENT_METRICS_INTERVAL = 60
+
+# Each job event worker saves the events it receives in batches of up to
+# JOB_EVENT_BATCH_SIZE events, waiting at most JOB_EVENT_BATCH_LATENCY seconds
+# for a batch to fill up.
+JOB_EVENT_BATCH_SIZE = 500
+JOB_EVENT_BATCH_LATENCY = 0.1
+
+# Maximum number of inventory host names each job event worker keeps in memory
+# to resolve the hosts of job events, and how long (in seconds) the hosts of a
+# job are kept after its last event when it ends without playbook stats.
+JOB_EVENT_HOST_CACHE_SIZE = 100000
+JOB_EVENT_HOST_CACHE_TTL = 600
+
+# The callback receiver sends the job events of each job to websocket listeners
+# in one frame every WEBSOCKET_EVENT_INTERVAL seconds, so at most
+# WEBSOCKET_EVENT_BATCH_MAX / WEBSOCKET_EVENT_INTERVAL events per second and
+# job are sent. Beyond that a frame only has the number and counter range of
+# the events left out, which the job results page then fetches from the API.
+WEBSOCKET_EVENT_INTERVAL = 0.25
+WEBSOCKET_EVENT_BATCH_MAX = 100
+
 # Disallow sending session cookies over insecure connections
 SESSION_COOKIE_SECURE = True
 
@@ -474,6 +519,47 @@ CELERYBEAT_SCHEDULE = {
     },
 }
 AWX_INCONSISTENT_TASK_INTERVAL = 60 * 3
+# Workers renew the lease of the tasks they run every
+# AWX_TASK_LEASE_RENEW_INTERVAL seconds. Waiting and running tasks whose
+# lease is older than AWX_TASK_LEASE_TIMEOUT seconds are marked as failed.
+AWX_TASK_LEASE_RENEW_INTERVAL = 30
+AWX_TASK_LEASE_TIMEOUT = 60 * 3
+
+# The task manager keeps an in-process view of pending, waiting and running
+# tasks and only loads the tasks modified since its previous cycle. A full
+# reload of the queue is done every AWX_TASK_MANAGER_RECONCILE_INTERVAL
+# seconds (0 reloads the whole queue on every cycle).
+AWX_TASK_MANAGER_RECONCILE_INTERVAL = 60 * 5
+# Window (in seconds) re-scanned on each incremental load to tolerate clock
+# skew between nodes and transactions committed after the previous cycle.
+AWX_TASK_MANAGER_DELTA_OVERLAP = 60
+
+# Order in which the task manager considers pending tasks: 'fifo' (oldest
+# first), 'fair_share' (weighted fair share between organizations on each
+# instance group) or 'template_priority'.
+AWX_TASK_MANAGER_POLICY = 'fifo'
+# Organization id -> relative share of capacity, for the fair_share policy.
+# Organizations not listed have a weight of 1.
+AWX_TASK_MANAGER_ORGANIZATION_WEIGHTS = {}
+# Unified job template id -> priority, for the template_priority policy.
+# Higher priorities run first, templates not listed have a priority of 0.
+AWX_TASK_MANAGER_TEMPLATE_PRIORITIES = {}
+
+# How the task manager picks an instance group for a pending task: 'greedy'
+# (first preferred group with room) or 'best_fit' (preferred group the task
+# fills most tightly, counting capacity shared between overlapping groups).
+AWX_TASK_MANAGER_PLACEMENT = 'greedy'
+# Hold back the largest preferred group of a task that couldn't be placed
+# for the rest of the cycle, so large tasks aren't starved by smaller ones.
+AWX_TASK_MANAGER_RESERVE_CAPACITY = False
+# Number of workflow nodes linked to their spawned jobs per UPDATE.
+AWX_TASK_MANAGER_WORKFLOW_BATCH_SIZE = 500
+# Number of task manager cycles whose timings and counters are kept in the
+# cache for /api/v2/task_manager_metrics/, 0 to keep none.
+AWX_TASK_MANAGER_METRICS_HISTORY = 50
+# Seconds a job launch or completion waits before running the task manager,
+# triggers arriving in the meantime are folded into the same run.
+AWX_TASK_MANAGER_TRIGGER_WINDOW = 1
 
 # Django Caching Configuration
 if is_testing():
@@ -877,6 +963,14 @@ INTERNAL_API_URL = 'http://127.0.0.1:%s' % DEVSERVER_DEFAULT_PORT
 PERSISTENT_CALLBACK_MESSAGES = True
 USE_CALLBACK_QUEUE = True
 CALLBACK_QUEUE = "callback_tasks"
+# Job events are published to the callback queue in batches of up to
+# CALLBACK_QUEUE_BATCH_SIZE events or CALLBACK_QUEUE_BATCH_BYTES bytes of JSON,
+# waiting at most CALLBACK_QUEUE_BATCH_LATENCY seconds for a batch to fill up.
+CALLBACK_QUEUE_BATCH_SIZE = 100
+CALLBACK_QUEUE_BATCH_BYTES = 256 * 1024
+CALLBACK_QUEUE_BATCH_LATENCY = 0.1
+# Compression of the callback queue messages ('zlib', 'bzip2' or None).
+CALLBACK_QUEUE_COMPRESSION = 'zlib'
 FACT_QUEUE = "facts"
 
 SCHEDULER_QUEUE = "scheduler"
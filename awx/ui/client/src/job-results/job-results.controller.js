@@ -674,8 +674,7 @@ function(jobData, jobDataOptions, jobLabels, jobFinished, count, $scope, ParseTy
 
     var bufferInterval;
 
-    // Processing of job_events messages from the websocket
-    toDestroy.push($scope.$on(`ws-job_events-${$scope.job.id}`, function(e, data) {
+    var queueEvent = function(data) {
         if (!bufferInterval) {
             bufferInterval = setInterval(function(){
                 processBuffer();
@@ -709,6 +708,33 @@ function(jobData, jobDataOptions, jobLabels, jobFinished, count, $scope, ParseTy
             }
             buffer.push(data);
         });
+    };
+
+    // Processing of job_events messages from the websocket
+    toDestroy.push($scope.$on(`ws-job_events-${$scope.job.id}`, function(e, data) {
+        queueEvent(data);
+    }));
+
+    // Events the server left out of the websocket frames under load are
+    // fetched from the API by their counter range
+    var getSkippedEvents = function(url) {
+        jobResultsService.getEvents(url)
+            .then(events => {
+                events.results.forEach(event => {
+                    // get the name in the same format as the data
+                    // coming over the websocket
+                    event.event_name = event.event;
+                    delete event.event;
+                    queueEvent(event);
+                });
+                if (events.next) {
+                    getSkippedEvents(events.next);
+                }
+            });
+    };
+
+    toDestroy.push($scope.$on(`ws-job_events-${$scope.job.id}-skipped`, function(e, counters) {
+        getSkippedEvents(`${jobData.related.job_events}?counter__gte=${counters[0]}&counter__lte=${counters[1]}&order_by=counter`);
     }));
 
     // get previously set up socket messages from resolve
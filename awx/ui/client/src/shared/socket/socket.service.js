@@ -84,6 +84,22 @@ export default
                     $rootScope.$broadcast('ws-jobs-summary', data);
                     return;
                 }
+                else if(data.group_name==="job_events" && data.events){
+                    // The callback receiver sends the events of a job in
+                    // batches, hand them out one at a time. Events skipped
+                    // under load are only counted and aren't sent at all,
+                    // their counter range is handed out for listeners to
+                    // fetch them.
+                    str = `ws-${data.group_name}-${data.job}`;
+                    _.forEach(data.events, function(event){
+                        $rootScope.$broadcast(str, event);
+                    });
+                    if (data.skipped && data.skipped_counters) {
+                        $log.debug(`Job ${data.job}: ${data.skipped} events skipped`);
+                        $rootScope.$broadcast(`${str}-skipped`, data.skipped_counters);
+                    }
+                    return;
+                }
                 else if(data.group_name==="job_events"){
                     // The naming scheme is "ws" then a
                     // dash (-) and the group_name, then the job ID